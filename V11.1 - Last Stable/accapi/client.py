@@ -1,6 +1,8 @@
 from threading import Thread, Condition
+import logging
 import socket
 import struct
+import time
 
 from .enums import OutboundMessageTypes
 from .structs import (
@@ -13,7 +15,9 @@ from .structs import (
     BroadcastingEvent,
 )
 
-__all__ = ["AccClient"]
+__all__ = ["AccClient", "CallQueue"]
+
+logger = logging.getLogger(__name__)
 
 
 class EndOfStreamError(Exception):
@@ -24,19 +28,46 @@ class ThreadedSocketReader(object):
     """
     Reads from a socket continuously and provides a non-blocking read method.
 
+    Datagrams are kept whole in a fixed-capacity ring, so memory is bounded and consuming
+    data never shifts the buffer. When the ring is full the overload policy decides what goes:
+    "drop_oldest" drops the oldest queued packet, "coalesce_cars" replaces the queued realtime
+    car update of the same car with the newer one and otherwise drops the oldest packet.
+
     Args:
         source (socket.socket): A socket instance.
         chunkSize (int): The data will be read in chunks of the given size.
+        capacity (int): Maximum number of packets waiting to be read.
+        overloadPolicy (str): "drop_oldest" or "coalesce_cars".
 
     Attributes:
         isAlive (bool): The reader will terminate its thread if the source has been closed.
-        size (int): How much data has been read so far.
+        size (int): How much data is waiting to be read.
+        droppedPackets (int): Packets dropped because the ring was full.
+        coalescedPackets (int): Car updates replaced by a newer update of the same car.
+        highWaterMark (int): Most packets that were ever waiting at once.
     """
 
-    def __init__(self, source: socket.socket, chunkSize: int = 2048):
+    OVERLOAD_POLICIES = ("drop_oldest", "coalesce_cars")
+    CAR_UPDATE_TYPE = 3
+
+    def __init__(self, source: socket.socket, chunkSize: int = 2048, capacity: int = 4096,
+                 overloadPolicy: str = "drop_oldest"):
+        if overloadPolicy not in self.OVERLOAD_POLICIES:
+            raise ValueError(f"Unknown overload policy: {overloadPolicy}")
         self._source = source
         self._chunkSize = chunkSize
-        self._data = bytearray()
+        self._capacity = capacity
+        self._overloadPolicy = overloadPolicy
+        self._slots = [None] * capacity
+        self._head = 0  # Sequence number of the oldest queued packet
+        self._tail = 0  # Sequence number the next packet gets
+        self._current = b""
+        self._offset = 0
+        self._available = 0
+        self._carSlots = {}
+        self.droppedPackets = 0
+        self.coalescedPackets = 0
+        self.highWaterMark = 0
         self._dataLock = Condition()
         self._stopSignal = False
         self._thread = Thread(target=self._run)
@@ -53,10 +84,24 @@ class ThreadedSocketReader(object):
     @property
     def size(self):
         self._dataLock.acquire()
-        size = len(self._data)
+        size = self._available
         self._dataLock.release()
         return size
 
+    @property
+    def stats(self):
+        self._dataLock.acquire()
+        stats = {
+            # Every packet gets a sequence number except car updates that replaced a queued one
+            "receivedPackets": self._tail + self.coalescedPackets,
+            "queuedPackets": self._tail - self._head,
+            "droppedPackets": self.droppedPackets,
+            "coalescedPackets": self.coalescedPackets,
+            "highWaterMark": self.highWaterMark,
+        }
+        self._dataLock.release()
+        return stats
+
     def read(self, size: int = None, timeout: int = None):
         """
         Reads data from the stream.
@@ -71,7 +116,7 @@ class ThreadedSocketReader(object):
         """
         # Raise exception if no data will ever come in
         self._dataLock.acquire()
-        if not self.isAlive and (not self._data or (size is not None and len(self._data) < size)):
+        if not self.isAlive and (not self._available or (size is not None and self._available < size)):
             self._dataLock.release()
             if self._exception is not None:
                 raise self._exception
@@ -80,30 +125,77 @@ class ThreadedSocketReader(object):
 
         # Return all available data
         if size is None:
-            if len(self._data) > 0:
-                data = bytes(self._data)
-                self._data = bytearray()
-            else:
-                data = None
+            data = self._take(self._available) if self._available > 0 else None
 
         # Return specified amount of data
         else:
 
             # Wait until there's enough data to fulfill the request
-            if len(self._data) < size and not self._dataLock.wait(timeout):
+            if self._available < size and not self._dataLock.wait_for(lambda: self._available >= size, timeout):
 
                 # No data after timeout
                 data = None
 
-            # Slice data according to size
             else:
-                data = bytes(self._data[:size])
-                del self._data[:size]
+                data = self._take(size)
 
         # Release and return
         self._dataLock.release()
         return data
 
+    def _take(self, size):
+        # Fields are read from the packet being consumed; only its remaining bytes are touched
+        end = self._offset + size
+        if end <= len(self._current):
+            data = self._current[self._offset:end]
+            self._offset = end
+        else:
+            parts = [self._current[self._offset:]]
+            remaining = size - len(parts[0])
+            while remaining > 0:
+                self._current = self._pop()
+                parts.append(self._current[:remaining])
+                self._offset = len(parts[-1])
+                remaining -= self._offset
+            data = b"".join(parts)
+        self._available -= size
+        return data
+
+    def _pop(self):
+        index = self._head % self._capacity
+        packet = self._slots[index]
+        self._slots[index] = None
+        if self._carSlots and self._isCarUpdate(packet):
+            carIndex = struct.unpack_from("<H", packet, 1)[0]
+            if self._carSlots.get(carIndex) == self._head:
+                del self._carSlots[carIndex]
+        self._head += 1
+        return packet
+
+    def _isCarUpdate(self, packet):
+        return len(packet) >= 3 and packet[0] == self.CAR_UPDATE_TYPE
+
+    def _push(self, packet):
+        if self._tail - self._head >= self._capacity:
+            if self._overloadPolicy == "coalesce_cars" and self._isCarUpdate(packet):
+                sequence = self._carSlots.get(struct.unpack_from("<H", packet, 1)[0])
+                if sequence is not None and sequence >= self._head:
+                    index = sequence % self._capacity
+                    self._available += len(packet) - len(self._slots[index])
+                    self._slots[index] = packet
+                    self.coalescedPackets += 1
+                    return
+            self._available -= len(self._pop())
+            self.droppedPackets += 1
+
+        if self._overloadPolicy == "coalesce_cars" and self._isCarUpdate(packet):
+            self._carSlots[struct.unpack_from("<H", packet, 1)[0]] = self._tail
+        self._slots[self._tail % self._capacity] = packet
+        self._tail += 1
+        self._available += len(packet)
+        if self._tail - self._head > self.highWaterMark:
+            self.highWaterMark = self._tail - self._head
+
     def stop(self):
         """
         Signals the reader to stop.
@@ -120,12 +212,91 @@ class ThreadedSocketReader(object):
             except Exception as e:
                 self._exception = e
                 break
+            if not data:
+                continue
             self._dataLock.acquire()
-            self._data.extend(data)
+            self._push(data)
             self._dataLock.notify_all()
             self._dataLock.release()
 
 
+class EntryListRefresh(object):
+    """
+    Coalesces entry list requests so a burst of mismatching car updates sends one request.
+
+    At most one request is in flight. Requests are spaced at least `interval` seconds apart,
+    and the interval doubles up to maxInterval while refreshes keep being needed right after
+    one completed, then falls back to minInterval once things settle.
+
+    Args:
+        minInterval (float): Shortest time between two requests, in seconds.
+        maxInterval (float): Longest backoff between two requests, in seconds.
+        timeout (float): A request without an answer after this long no longer blocks a new one.
+
+    Attributes:
+        requestsSent (int): Entry list requests actually sent.
+        requestsSaved (int): Requests that were asked for but coalesced into one in flight.
+        staleUpdatesKept (int): Car updates delivered flagged as stale instead of dropped.
+        updatesDropped (int): Car updates for cars not in the entry list at all.
+    """
+
+    def __init__(self, minInterval: float = 0.5, maxInterval: float = 8.0, timeout: float = 2.0):
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.timeout = timeout
+        self.interval = minInterval
+        self.inFlight = False
+        self.sentAt = None
+        self.completedAt = None
+        self.requestsSent = 0
+        self.requestsSaved = 0
+        self.staleUpdatesKept = 0
+        self.updatesDropped = 0
+
+    def shouldRequest(self, now: float = None):
+        """
+        Returns:
+            bool: True if a request should be sent now, in which case it is counted as in flight.
+        """
+        now = time.monotonic() if now is None else now
+        if self.sentAt is not None:
+            if self.inFlight and now - self.sentAt < self.timeout:
+                self.requestsSaved += 1
+                return False
+            if now - self.sentAt < self.interval:
+                self.requestsSaved += 1
+                return False
+            if self.completedAt is not None and now - self.completedAt < 2 * self.interval:
+                self.interval = min(self.interval * 2, self.maxInterval)
+            else:
+                self.interval = self.minInterval
+        self.inFlight = True
+        self.sentAt = now
+        self.requestsSent += 1
+        return True
+
+    def awaitingCars(self, now: float = None):
+        """
+        Returns:
+            bool: True right after an entry list arrived, while its per-car entries are still coming in.
+        """
+        now = time.monotonic() if now is None else now
+        return self.completedAt is not None and now - self.completedAt < self.timeout
+
+    def completed(self, now: float = None):
+        self.inFlight = False
+        self.completedAt = time.monotonic() if now is None else now
+
+    @property
+    def stats(self):
+        return {
+            "requestsSent": self.requestsSent,
+            "requestsSaved": self.requestsSaved,
+            "staleUpdatesKept": self.staleUpdatesKept,
+            "updatesDropped": self.updatesDropped,
+        }
+
+
 class Event(object):
     def __init__(self, source, content):
         self.source = source
@@ -144,6 +315,34 @@ class Observable(object):
         self._callbacks.append(callback)
 
 
+class CallQueue(object):
+    """
+    Functions handed over from any thread to run on the thread that owns the queue, e.g. to
+    switch on a profiler that only sees the thread it is enabled in.
+    """
+
+    def __init__(self):
+        self._calls = []
+
+    def __len__(self):
+        return len(self._calls)
+
+    def put(self, func):
+        """
+        Args:
+            func (callable): Called without arguments; an exception is logged and the next call still runs.
+        """
+        self._calls.append(func)
+
+    def run(self):
+        while self._calls:
+            func = self._calls.pop(0)
+            try:
+                func()
+            except Exception:
+                logger.exception("Queued call %r failed", func)
+
+
 class AccClient(object):
 
     endianess = "<"
@@ -169,6 +368,7 @@ class AccClient(object):
         self._writable = False
         self._entryList = []
         self._cars = {}
+        self._entryListRefresh = EntryListRefresh()
 
         # Receive methods
         self._receiveMethods = {
@@ -185,6 +385,8 @@ class AccClient(object):
         self._stopSignal = False
         self._thread = None
         self._reader = None
+        self._readerStats = None
+        self._threadCalls = CallQueue()
 
     def _update_connection_state(self, state):
         if state != self._connectionState:
@@ -200,6 +402,36 @@ class AccClient(object):
     def writable(self):
         return self._writable
 
+    @property
+    def entryListStats(self):
+        return self._entryListRefresh.stats
+
+    @property
+    def threadIds(self):
+        """
+        Returns:
+            dict: Identifiers of the client and reader threads that are running, by name.
+        """
+        threads = {"client": self._thread, "reader": self._reader._thread if self._reader is not None else None}
+        return {name: thread.ident for name, thread in threads.items() if thread is not None and thread.ident}
+
+    def callInClientThread(self, func):
+        """
+        Runs func on the client thread before it reads the next message, or within 0.1 s when idle.
+        Used to switch on profilers that only see the thread they are enabled in.
+
+        Args:
+            func (callable): Called without arguments; an exception is logged by CallQueue.
+        """
+        self._threadCalls.put(func)
+
+    @property
+    def readerStats(self):
+        # Kept from the last connection once the reader is gone
+        if self._reader is None:
+            return self._readerStats
+        return self._reader.stats
+
     @property
     def onConnectionStateChange(self):
         return self._onConnectionStateChange
@@ -267,7 +499,8 @@ class AccClient(object):
         self._connectionId = result.connectionId
         self._writable = result.writable
         self._update_connection_state("established")
-        self._request_entry_list()
+        self._entryListRefresh = EntryListRefresh()
+        self._refresh_entry_list()
         self._request_track_data()
 
     def _receive_realtime_update(self):
@@ -278,16 +511,25 @@ class AccClient(object):
 
     def _receive_realtime_car_update(self):
         args = RealtimeCarUpdate.receive_args(self._receive)
-        update = RealtimeCarUpdate(*args)
-        if update.carIndex in self._cars and self._cars[update.carIndex] == update.driverCount:
-            for callback in self._onRealtimeCarUpdate.callbacks:
-                update = RealtimeCarUpdate(*args)
-                callback(Event(self, update))
-        else:
-            self._request_entry_list()
+        carIndex, driverCount = args[0], args[2]
+        known = self._cars.get(carIndex)
+        stale = known != driverCount
+        if stale:
+            if known != -1 or not self._entryListRefresh.awaitingCars():
+                self._refresh_entry_list()
+            # A known car with outdated driver data is still worth delivering; an unknown one is not
+            if known is None:
+                self._entryListRefresh.updatesDropped += 1
+                return
+            self._entryListRefresh.staleUpdatesKept += 1
+        for callback in self._onRealtimeCarUpdate.callbacks:
+            update = RealtimeCarUpdate(*args)
+            update.entryListStale = stale
+            callback(Event(self, update))
 
     def _receive_entry_list(self):
         entryList = EntryList.receive(self._receive)
+        self._entryListRefresh.completed()
         self._cars = {i: self._cars[i] if i in self._cars else -1 for i in entryList.carIndices}
 
     def _receive_entry_list_car(self):
@@ -329,6 +571,10 @@ class AccClient(object):
     def _request_entry_list(self):
         self._send(("B", OutboundMessageTypes.REQUEST_ENTRY_LIST.value), ("i", self._connectionId))
 
+    def _refresh_entry_list(self):
+        if self._entryListRefresh.shouldRequest():
+            self._request_entry_list()
+
     def _request_track_data(self):
         self._send(("B", OutboundMessageTypes.REQUEST_TRACK_DATA.value), ("i", self._connectionId))
 
@@ -379,6 +625,8 @@ class AccClient(object):
     def _run(self):
         try:
             while not self._stopSignal:
+                if self._threadCalls:
+                    self._threadCalls.run()
                 try:
                     messageTypeData = self._reader.read(1, timeout=0.1)
                 except (ConnectionResetError, EndOfStreamError):
@@ -394,6 +642,7 @@ class AccClient(object):
             except:
                 pass
         self._reader.stop()
+        self._readerStats = self._reader.stats
         self._reader = None
         self._socket.close()
         self._socket = None
@@ -412,6 +661,8 @@ class AccClient(object):
         commandPassword: str = "",
         displayName: str = "Python ACCAPI",
         updateIntervalMs: int = 100,
+        bufferPackets: int = 4096,
+        overloadPolicy: str = "drop_oldest",
     ):
         if self.isAlive:
             raise ValueError("Must be stopped")
@@ -419,7 +670,7 @@ class AccClient(object):
         self._server = (url, port)
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self._socket.settimeout(1)
-        self._reader = ThreadedSocketReader(self._socket)
+        self._reader = ThreadedSocketReader(self._socket, capacity=bufferPackets, overloadPolicy=overloadPolicy)
         self._thread = Thread(target=self._run)
         self._stopSignal = False
         self._thread.start()
@@ -1,9 +1,15 @@
-from enum import Enum
+from enum import Enum, IntEnum
 
 __all__ = [
     "OutboundMessageTypes",
+    "CarLocation",
+    "SessionPhase",
+    "SessionType",
+    "BroadcastingEventType",
+    "PIT_LOCATIONS",
     "LAP_TYPE",
     "DRIVER_CATEGORY",
+    "CUP_CATEGORY",
     "CAR_LOCATION",
     "SESSION_PHASE",
     "SESSION_TYPE",
@@ -32,12 +38,63 @@ class OutboundMessageTypes(Enum):
     SAVE_MANUAL_REPLAY_HIGHLIGHT = 60
 
 
+# Raw protocol values, for comparisons on the hot path; the dicts below give the display names
+class CarLocation(IntEnum):
+    UNKNOWN = 0
+    TRACK = 1
+    PITLANE = 2
+    PIT_ENTRY = 3
+    PIT_EXIT = 4
+
+
+class SessionPhase(IntEnum):
+    UNKNOWN = 0
+    STARTING = 1
+    PRE_FORMATION = 2
+    FORMATION_LAP = 3
+    PRE_SESSION = 4
+    SESSION = 5
+    SESSION_OVER = 6
+    POST_SESSION = 7
+    RESULT_UI = 8
+
+
+class SessionType(IntEnum):
+    PRACTICE = 0
+    QUALIFYING = 4
+    SUPERPOLE = 9
+    RACE = 10
+    HOTLAP = 11
+    HOT_STINT = 12
+    HOTLAP_SUPERPOLE = 13
+    REPLAY = 14
+
+
+class BroadcastingEventType(IntEnum):
+    UNKNOWN = 0
+    GREEN_FLAG = 1
+    SESSION_OVER = 2
+    PENALTY_COMMUNICATION_MESSAGE = 3
+    ACCIDENT = 4
+    LAP_COMPLETED = 5
+    BEST_SESSION_LAP = 6
+    BEST_PERSONAL_LAP = 7
+
+
+# Plain ints, so membership tests hash an int instead of going through the enum
+PIT_LOCATIONS = frozenset({int(CarLocation.PITLANE), int(CarLocation.PIT_ENTRY)})
+
+
 LAP_TYPE = MissingHandlingDict({0: "Regular", 1: "Outlap", 2: "Inlap"})
 
 DRIVER_CATEGORY = MissingHandlingDict(
     {0: "Bronze", 1: "Silver", 2: "Gold", 3: "Platinum", 255: "Unknown"}
 )
 
+CUP_CATEGORY = MissingHandlingDict(
+    {0: "Pro", 1: "Pro-Am", 2: "Am", 3: "Silver", 4: "National"}
+)
+
 CAR_LOCATION = MissingHandlingDict(
     {0: "Unknown", 1: "Track", 2: "Pitlane", 3: "Pit Entry", 4: "Pit Exit"}
 )
@@ -45,8 +45,8 @@ class RealtimeUpdate(object):
         args = list(args)
         self.eventIndex = args.pop(0)
         self.sessionIndex = args.pop(0)
-        self.sessionType = SESSION_TYPE[args.pop(0)]
-        self.sessionPhase = SESSION_PHASE[args.pop(0)]
+        self.sessionTypeCode = args.pop(0)
+        self.sessionPhaseCode = args.pop(0)
         self.sessionTimeMs = args.pop(0)
         self.sessionEndTimeMs = args.pop(0)
         self.focusedCarIndex = args.pop(0)
@@ -69,6 +69,15 @@ class RealtimeUpdate(object):
         self.bestSessionLap = Lap(*args)
         self._leftovers = self.bestSessionLap._leftovers
 
+    # Names are only looked up when something asks for them, e.g. for logging
+    @property
+    def sessionType(self):
+        return SESSION_TYPE[self.sessionTypeCode]
+
+    @property
+    def sessionPhase(self):
+        return SESSION_PHASE[self.sessionPhaseCode]
+
     @classmethod
     def receive(cls, receiveMethod):
         return cls(*cls.receive_args(receiveMethod))
@@ -96,9 +105,16 @@ class Lap(object):
         self.isValidForBest = args.pop(0)
         self.isOutlap = args.pop(0)
         self.isInlap = args.pop(0)
-        self.type = LAP_TYPE[1 if self.isOutlap else 0 + 2 if self.isInlap else 0]
         self._leftovers = args
 
+    @property
+    def typeCode(self):
+        return 1 if self.isOutlap else 0 + 2 if self.isInlap else 0
+
+    @property
+    def type(self):
+        return LAP_TYPE[self.typeCode]
+
     @classmethod
     def receive(cls, receiveMethod):
         return cls(*cls.receive_args(receiveMethod))
@@ -121,7 +137,7 @@ class RealtimeCarUpdate(object):
         self.worldPosX = args.pop(0)
         self.worldPosY = args.pop(0)
         self.yaw = args.pop(0)
-        self.location = CAR_LOCATION[args.pop(0)]
+        self.locationCode = args.pop(0)
         self.kmh = args.pop(0)
         self.position = args.pop(0)
         self.cupPosition = args.pop(0)
@@ -133,6 +149,12 @@ class RealtimeCarUpdate(object):
         self.lastLap = Lap(*self.bestSessionLap._leftovers)
         self.currentLap = Lap(*self.lastLap._leftovers)
         self._leftovers = self.currentLap._leftovers
+        # Set by the client when the car's entry list data is being refreshed
+        self.entryListStale = False
+
+    @property
+    def location(self):
+        return CAR_LOCATION[self.locationCode]
 
     @classmethod
     def receive(cls, receiveMethod):
@@ -253,12 +275,16 @@ class TrackData(object):
 class BroadcastingEvent(object):
     def __init__(self, *args):
         args = list(args)
-        self.type = BROADCASTING_EVENT_TYPE[args.pop(0)]
+        self.typeCode = args.pop(0)
         self.message = args.pop(0)
         self.timeMs = args.pop(0)
         self.carIndex = args.pop(0)
         self._leftovers = args
 
+    @property
+    def type(self):
+        return BROADCASTING_EVENT_TYPE[self.typeCode]
+
     @classmethod
     def receive(cls, receiveMethod):
         return cls(*cls.receive_args(receiveMethod))
@@ -0,0 +1,57 @@
+class Incident:
+    __slots__ = ("start_ms", "last_ms", "cars", "cells", "spline")
+
+    def __init__(self, session_ms, spline):
+        self.start_ms = session_ms
+        self.last_ms = session_ms
+        self.cars = []
+        self.cells = []
+        self.spline = spline
+
+
+class AccidentClusterer:
+    """
+    Groups accident reports into incidents by where and when they happened.
+    """
+
+    def __init__(self, cell_meters=50, window_ms=4000):
+        self.cell_meters = cell_meters
+        self.window_ms = window_ms
+        self.grid = {}
+        self.open = []
+
+    def add(self, session_ms, car_index, x=None, y=None, spline=None):
+        incident = None
+        cell = None
+        if x is not None and y is not None:
+            cell = (int(x // self.cell_meters), int(y // self.cell_meters))
+            cx, cy = cell
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    candidate = self.grid.get((cx + dx, cy + dy))
+                    if candidate is not None and session_ms - candidate.last_ms <= self.window_ms and (
+                            incident is None or candidate.last_ms > incident.last_ms):
+                        incident = candidate
+
+        if incident is None:
+            # Reports without a position yet stand on their own
+            incident = Incident(session_ms, spline)
+            self.open.append(incident)
+        if car_index not in incident.cars:
+            incident.cars.append(car_index)
+        incident.last_ms = session_ms
+        if cell is not None:
+            self.grid[cell] = incident
+            incident.cells.append(cell)
+        return incident
+
+    def pop_finished(self, session_ms, force=False):
+        finished = [incident for incident in self.open
+                    if force or session_ms - incident.last_ms > self.window_ms]
+        if finished:
+            self.open = [incident for incident in self.open if incident not in finished]
+            for incident in finished:
+                for cell in incident.cells:
+                    if self.grid.get(cell) is incident:
+                        del self.grid[cell]
+        return finished
@@ -0,0 +1,345 @@
+import os
+import time
+import random
+import threading
+
+from metrics import API_GAUGE, METRICS
+
+RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504, 529})
+# Statuses that mean "slow down" rather than "something broke"
+THROTTLE_STATUS = frozenset({429, 529})
+CONNECTION_ERRORS = ("APIConnectionError", "APITimeoutError", "ConnectionError", "Timeout")
+# A caller can set admission.listener on its own thread to hear when its request is really sent
+# (True) and when it is back to waiting for a retry (False), e.g. the hedger, which must not count
+# budget waits, pauses and retries as response time
+admission = threading.local()
+
+
+def notify_admission(admitted):
+    listener = getattr(admission, "listener", None)
+    if listener is not None:
+        listener(admitted)
+
+
+def failure_of(outcome):
+    """
+    (status, Retry-After seconds) if the exception or response is worth retrying, otherwise None.
+    """
+    status = getattr(outcome, "status_code", None)
+    if status is None and isinstance(outcome, Exception):
+        if any(cls.__name__ in CONNECTION_ERRORS for cls in type(outcome).__mro__):
+            return None, None
+        return None
+    if status not in RETRYABLE_STATUS:
+        return None
+    # requests responses carry headers themselves, anthropic errors on their httpx response
+    headers = getattr(outcome, "headers", None) or getattr(getattr(outcome, "response", None), "headers", None) or {}
+    try:
+        retry_after = float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        retry_after = None
+    return status, retry_after
+
+
+class TokenBucket:
+    """
+    Per-minute budget; reserve() returns how long to wait for the units, so waiters keep their order.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount):
+        with self.lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            # A single request bigger than the bucket would otherwise wait forever
+            self.level -= min(amount, self.capacity)
+            return -self.level / self.rate if self.level < 0 else 0.0
+
+
+class RetryableStatus(Exception):
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+
+
+class Attempt:
+    """
+    One try of a governed call; use as a context manager inside ProviderGovernor.attempts().
+    """
+
+    def __init__(self, provider, number, last):
+        self.provider = provider
+        self.number = number
+        self.last = last
+        self.done = False
+        self.committed = False
+        self.retry_delay = 0.0
+        self.started = None
+        self.final_failure = None
+
+    def commit(self):
+        # Once part of a streamed reply has been used, a failure can no longer be retried
+        self.committed = True
+
+    def check(self, response):
+        """
+        Raises for a retryable HTTP response while retries are left; the last one is handed back as is.
+        """
+        failure = failure_of(response)
+        if failure is not None:
+            if not self.last:
+                raise RetryableStatus(response)
+            self.final_failure = failure
+        return response
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        notify_admission(True)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        latency = time.monotonic() - self.started
+        self.provider.release()
+        if exc_type is GeneratorExit:
+            # A streamed reply the caller stopped reading, e.g. a hedge that lost; neither success nor failure
+            self.done = True
+            return False
+        if exc is None:
+            self.done = True
+            if self.final_failure is not None:
+                self.provider.on_failure(self.final_failure, self.number, final=True)
+            else:
+                self.provider.on_success(latency)
+            return False
+
+        failure = failure_of(exc.response if isinstance(exc, RetryableStatus) else exc)
+        if failure is None or self.last or self.committed:
+            self.done = True
+            self.provider.on_failure(failure, self.number, final=True)
+            return False
+
+        if isinstance(exc, RetryableStatus):
+            exc.response.close()
+        self.retry_delay = self.provider.on_failure(failure, self.number, final=False)
+        notify_admission(False)
+        return True
+
+
+class ProviderGovernor:
+    """
+    Outbound limits for one provider: per-minute budgets, AIMD concurrency and retries.
+    """
+
+    def __init__(self, name, per_minute=None, initial_concurrency=2, min_concurrency=1, max_concurrency=16,
+                 max_retries=5, backoff_base=0.5, backoff_cap=30.0, latency_tolerance=2.0, seed=None):
+        self.name = name
+        self.set_limits(per_minute)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.limit = float(initial_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.latency_tolerance = latency_tolerance
+        self.long_latency = None
+        self.short_latency = None
+        self.rng = random.Random(seed)
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.counters = {"requests": 0, "succeeded": 0, "throttled": 0, "retries": 0, "errors": 0, "failed": 0,
+                         "budget_wait_s": 0.0, "latency_decreases": 0}
+
+    def set_limits(self, per_minute):
+        # None or {} lifts every budget, e.g. against a local stub server
+        self.buckets = {unit: TokenBucket(rate) for unit, rate in (per_minute or {}).items() if rate}
+
+    def attempts(self, cost=None):
+        """
+        Yields Attempts until one succeeds or fails for good; each is used as `with attempt:`.
+        """
+        for number in range(self.max_retries + 1):
+            self.wait_for_budget(cost)
+            self.acquire()
+            # The attempt releases its slot when its with block exits
+            attempt = Attempt(self, number, last=number == self.max_retries)
+            try:
+                yield attempt
+            finally:
+                # A caller that closes or drops the generator before entering the attempt, e.g. a
+                # hedge that lost, would otherwise keep the slot for good
+                if attempt.started is None:
+                    self.release()
+            if attempt.done:
+                return
+            time.sleep(attempt.retry_delay)
+
+    def call(self, func, cost=None):
+        result = None
+        for attempt in self.attempts(cost):
+            with attempt:
+                result = attempt.check(func())
+        return result
+
+    def wait_for_budget(self, cost):
+        cost = dict(cost or {})
+        cost.setdefault("requests", 1)
+        wait = max([bucket.reserve(cost.get(unit, 0)) for unit, bucket in self.buckets.items()], default=0.0)
+        if wait > 0:
+            with self.condition:
+                self.counters["budget_wait_s"] += wait
+            time.sleep(wait)
+
+    def acquire(self):
+        with self.condition:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause > 0:
+                    self.condition.wait(pause)
+                elif self.in_flight >= int(self.limit):
+                    self.condition.wait()
+                else:
+                    break
+            self.in_flight += 1
+            self.counters["requests"] += 1
+
+    def saturated(self):
+        """
+        Whether a request sent now would have to wait: the provider is paused or at its concurrency limit.
+        """
+        with self.condition:
+            return self.paused_until > time.monotonic() or self.in_flight >= int(self.limit)
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def on_success(self, latency):
+        with self.condition:
+            self.counters["succeeded"] += 1
+            if self.long_latency is None:
+                self.long_latency = self.short_latency = latency
+            # Two moving averages: requests of different sizes even out, a queue building up does not
+            self.short_latency = 0.8 * self.short_latency + 0.2 * latency
+            self.long_latency = 0.98 * self.long_latency + 0.02 * latency
+            if self.short_latency > self.latency_tolerance * self.long_latency:
+                self.limit = max(self.min_concurrency, self.limit * 0.9)
+                self.counters["latency_decreases"] += 1
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def on_failure(self, failure, attempt, final):
+        """
+        Returns the seconds to wait before the next attempt.
+        """
+        status, retry_after = failure if failure is not None else (None, None)
+        with self.condition:
+            if status in THROTTLE_STATUS:
+                self.counters["throttled"] += 1
+                self.limit = max(self.min_concurrency, self.limit / 2)
+            else:
+                self.counters["errors"] += 1
+            if final:
+                self.counters["failed"] += 1
+                return 0.0
+
+            self.counters["retries"] += 1
+            if retry_after is not None:
+                delay = retry_after
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            else:
+                delay = self.rng.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** min(attempt, 16)))
+            return delay
+
+    @property
+    def stats(self):
+        with self.condition:
+            return {
+                "concurrency": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                **{name: round(value, 3) if isinstance(value, float) else value
+                   for name, value in self.counters.items()},
+            }
+
+
+class ApiGovernor:
+    """
+    Shared registry of ProviderGovernors so every stage talking to a provider shares its limits.
+    """
+
+    def __init__(self, providers=None):
+        self.providers = {}
+        self.lock = threading.Lock()
+        for provider in providers or []:
+            self.providers[provider.name] = provider
+
+    def provider(self, name):
+        with self.lock:
+            if name not in self.providers:
+                self.providers[name] = ProviderGovernor(name)
+            return self.providers[name]
+
+    def call(self, name, func, cost=None):
+        return self.provider(name).call(func, cost)
+
+    def attempts(self, name, cost=None):
+        return self.provider(name).attempts(cost)
+
+    @property
+    def stats(self):
+        with self.lock:
+            providers = list(self.providers.values())
+        return {provider.name: provider.stats for provider in providers}
+
+    def format_stats(self):
+        return ", ".join(f"{name}: {stats['concurrency']} concurrent, {stats['throttled']} throttled, "
+                         f"{stats['retries']} retries, {stats['failed']} failed"
+                         for name, stats in self.stats.items() if stats["requests"])
+
+
+def estimate_tokens(*texts):
+    # About four characters a token for English prose and race logs
+    return sum(len(text or "") for text in texts) // 4
+
+
+def limits_from_env(name, defaults):
+    # e.g. ANTHROPIC_RATE_LIMITS="requests=1000,input_tokens=80000"; a unit set to 0 is not limited
+    value = os.environ.get(name)
+    if not value:
+        return defaults
+    limits = dict(defaults)
+    for part in value.split(","):
+        unit, separator, rate = part.partition("=")
+        if not separator:
+            raise ValueError(f"{name}: expected unit=rate, got {part!r}")
+        limits[unit.strip()] = float(rate)
+    return limits
+
+
+# Starting points for the default tiers; AIMD finds the real ceiling from there. Accounts on
+# other tiers set ANTHROPIC_RATE_LIMITS / ELEVENLABS_RATE_LIMITS, or call set_limits()
+GOVERNOR = ApiGovernor([
+    ProviderGovernor("anthropic", per_minute=limits_from_env("ANTHROPIC_RATE_LIMITS",
+                                                             {"requests": 50, "input_tokens": 40000}),
+                     initial_concurrency=2, max_concurrency=16),
+    ProviderGovernor("elevenlabs", per_minute=limits_from_env("ELEVENLABS_RATE_LIMITS", {"characters": 40000}),
+                     initial_concurrency=2, max_concurrency=10),
+])
+
+
+def collect_metrics():
+    for name, stats in GOVERNOR.stats.items():
+        for field, value in stats.items():
+            API_GAUGE.set(value, name, field)
+
+
+METRICS.add_collector(collect_metrics)
@@ -0,0 +1,127 @@
+class BattleDetector:
+    """
+    Groups of cars running nose to tail, with enter/exit hysteresis per adjacent pair.
+    """
+
+    def __init__(self, enter_gap_ms=1000, exit_gap_ms=1500, intense_gap_ms=300, enter_ticks=2, exit_ticks=3,
+                 min_interval_ms=120000, max_cars=6):
+        self.enter_gap_ms = enter_gap_ms
+        self.exit_gap_ms = exit_gap_ms
+        self.intense_gap_ms = intense_gap_ms
+        self.enter_ticks = enter_ticks
+        self.exit_ticks = exit_ticks
+        # Session time a battle stays quiet after an event before it can be reported intensifying again
+        self.min_interval_ms = min_interval_ms
+        self.max_cars = max_cars
+        # (car, car) -> [close ticks, far ticks, in battle]; the key is unordered so a pass keeps the state
+        self.pairs = {}
+        # battle id -> {"cars", "position", "intense", "reported", "last_event_ms", "announced"};
+        # reported is the largest size announced
+        self.battles = {}
+        self.car_battle = {}
+        self.next_id = 0
+
+    def update(self, order, gaps, positions, session_ms):
+        # order: car indices in race order, without cars in the pits or finished; gaps: carIndex ->
+        # (gap ms, interval ms). Returns (phase, cars front to back, position, closest interval ms)
+        # tuples, phase being "started", "intensifying" or "ended".
+        events = []
+        pairs = {}
+        groups = []
+        group = None
+        closest = None
+
+        # One linear scan over adjacent pairs of the already sorted field
+        for front, behind in zip(order, order[1:]):
+            key = (front, behind) if front < behind else (behind, front)
+            state = self.pairs.get(key) or [0, 0, False]
+            if front in gaps and behind in gaps:
+                interval = gaps[behind][0] - gaps[front][0]
+            else:
+                interval = None
+
+            if interval is not None and interval < 0:
+                # A car ahead on the road but behind on the gap curve says nothing about the fight:
+                # the pair keeps its state and the interval is not a candidate for the closest
+                interval = None
+            elif interval is not None and interval < self.enter_gap_ms:
+                state[0] += 1
+                state[1] = 0
+            elif interval is None or interval > self.exit_gap_ms:
+                state[1] += 1
+                state[0] = 0
+            if not state[2] and state[0] >= self.enter_ticks:
+                state[2] = True
+            elif state[2] and state[1] >= self.exit_ticks:
+                state[2] = False
+            pairs[key] = state
+
+            # A train of close pairs is several fights, not one for the whole field: a full group
+            # ends here and the next close pair starts another
+            if state[2] and (group is None or len(group) < self.max_cars):
+                if group is None:
+                    group = [front]
+                    closest = interval
+                    groups.append((group, closest))
+                group.append(behind)
+                if interval is not None and (closest is None or interval < closest):
+                    closest = interval
+                    groups[-1] = (group, closest)
+            else:
+                group = None
+
+        self.pairs = pairs
+
+        matched = set()
+        car_battle = {}
+        for cars, closest in groups:
+            position = positions.get(cars[0])
+            intense = closest is not None and closest < self.intense_gap_ms
+            ids = {self.car_battle[car] for car in cars if car in self.car_battle} - matched
+            if not ids:
+                battle_id = self.next_id
+                self.next_id += 1
+                split = any(car in self.car_battle for car in cars)
+                self.battles[battle_id] = {"cars": cars, "position": position, "intense": intense,
+                                           "reported": len(cars), "last_event_ms": session_ms,
+                                           "announced": not split}
+                # The back half of a battle that split up is not a new fight
+                if not split:
+                    events.append(("started", cars, position, closest))
+            else:
+                # Groups that merged continue as the oldest battle
+                battle_id = min(ids)
+                battle = self.battles[battle_id]
+                for other in ids - {battle_id}:
+                    matched.add(other)
+                    merged = self.battles.pop(other)
+                    battle["reported"] = max(battle["reported"], merged["reported"])
+                    battle["announced"] = battle["announced"] or merged["announced"]
+                # Only a change is news: the gap closing in past intense_gap_ms, or more cars than
+                # were ever announced, and then at most once per min_interval_ms
+                closed_in = intense and not battle["intense"]
+                grew = len(cars) > battle["reported"]
+                if (closed_in or grew) and session_ms - battle["last_event_ms"] >= self.min_interval_ms:
+                    battle["last_event_ms"] = session_ms
+                    battle["reported"] = max(battle["reported"], len(cars))
+                    battle["announced"] = True
+                    events.append(("intensifying", cars, position, closest))
+                # A gap that closes in while the battle is quiet is dropped, not reported late
+                if intense:
+                    battle["intense"] = True
+                elif closest is not None and closest > 2 * self.intense_gap_ms:
+                    battle["intense"] = False
+                battle.update(cars=cars, position=position)
+            matched.add(battle_id)
+            for car in cars:
+                car_battle[car] = battle_id
+
+        # Pairs already waited exit_ticks before leaving, so an unmatched battle is over
+        for battle_id in [battle_id for battle_id in self.battles if battle_id not in matched]:
+            battle = self.battles.pop(battle_id)
+            # Nobody heard of a split-off half that never made news, so neither is its end
+            if battle["announced"]:
+                events.append(("ended", battle["cars"], battle["position"], None))
+
+        self.car_battle = car_battle
+        return events
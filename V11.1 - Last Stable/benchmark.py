@@ -0,0 +1,338 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+from datetime import datetime
+from itertools import islice
+
+from accapi.client import AccClient
+from accapi.structs import RealtimeCarUpdate
+from race_generator import REALTIME_CAR_UPDATE, REGISTRATION_RESULT, SyntheticRace, read_datagrams
+
+
+class BufferReader:
+    """
+    Offline stand-in for ThreadedSocketReader: serves recorded datagrams to AccClient's decoder.
+    """
+
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    @property
+    def remaining(self):
+        return len(self.data) - self.offset
+
+    def read(self, size=None, timeout=None):
+        if size is None:
+            size = self.remaining
+        if self.remaining < size:
+            return None
+        chunk = self.data[self.offset:self.offset + size].tobytes()
+        self.offset += size
+        return chunk
+
+
+def best_of(func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def metric(value, unit):
+    # Rates are better higher, times per operation better lower
+    better = "higher" if unit.endswith("/s") else "lower"
+    return {"value": round(value, 3), "unit": unit, "better": better}
+
+
+def load_datagrams(options, cars):
+    if options.datagrams:
+        return list(read_datagrams(options.datagrams))
+    race = SyntheticRace(cars=cars, hours=options.minutes / 60, seed=options.seed)
+    # Registration triggers requests to a server; the decoder is measured from the entry list on
+    return [datagram for datagram in race.datagrams() if datagram[0] != REGISTRATION_RESULT]
+
+
+def bench_decode(options):
+    results = {}
+    for cars in options.cars:
+        datagrams = load_datagrams(options, cars)
+        data = b"".join(datagrams)
+
+        def decode():
+            client = AccClient()
+            # Entry list refreshes would need a socket; the benchmark only measures decoding
+            client._send = lambda *args: None
+            for observable in (client.onRealtimeUpdate, client.onRealtimeCarUpdate, client.onEntryListCarUpdate,
+                               client.onTrackDataUpdate, client.onBroadcastingEvent):
+                observable.subscribe(lambda event: None)
+            client._reader = BufferReader(data)
+            receive_methods = client._receiveMethods
+            reader = client._reader
+            while reader.remaining:
+                receive_methods[reader.read(1)[0]]()
+
+        elapsed = best_of(decode, options.repeat)
+        results[f"decode.{cars}_cars.packets_per_s"] = metric(len(datagrams) / elapsed, "packets/s")
+        results[f"decode.{cars}_cars.mb_per_s"] = metric(len(data) / elapsed / 1e6, "MB/s")
+        if options.datagrams:
+            break
+    return results
+
+
+def bench_construction(options):
+    race = SyntheticRace(cars=60, hours=options.minutes / 60, seed=options.seed)
+    car_args = [args for message_type, args in islice(race.messages(), 200000) if message_type == REALTIME_CAR_UPDATE]
+
+    def construct():
+        for args in car_args:
+            RealtimeCarUpdate(*args)
+
+    elapsed = best_of(construct, options.repeat)
+    return {"construct.realtime_car_update_us": metric(elapsed / len(car_args) * 1e6, "us")}
+
+
+def collector_for(directory):
+    from data_collector import DataCollector
+    collector = DataCollector("ACC")
+    collector.setup_output_file(os.path.join(directory, "race.txt"))
+    return collector
+
+
+def bench_ticks(options, directory):
+    from race_generator import ENTRY_LIST_CAR, REALTIME_UPDATE, TRACK_DATA, BROADCASTING_EVENT
+    from accapi.client import Event
+
+    results = {}
+    for cars in options.cars:
+        collector = collector_for(os.path.join(directory, f"ticks_{cars}"))
+        handlers = {REALTIME_UPDATE: collector.on_realtime_update,
+                    REALTIME_CAR_UPDATE: collector.on_realtime_car_update,
+                    ENTRY_LIST_CAR: collector.on_entry_list_car_update,
+                    TRACK_DATA: collector.on_track_data_update,
+                    BROADCASTING_EVENT: collector.on_broadcasting_event}
+        race = SyntheticRace(cars=cars, hours=options.minutes / 60, seed=options.seed)
+        update_every_ms = collector.update_interval * 1000
+        next_update_ms = update_every_ms
+        sort_times, overtake_times, update_times = [], [], []
+        for message_type, content in race.decoded():
+            handlers[message_type](Event(race, content))
+            # Sample once per collector update interval, as the QThread would
+            if message_type != REALTIME_UPDATE or content.sessionTimeMs < next_update_ms:
+                continue
+            next_update_ms += update_every_ms
+            if not collector.race_started:
+                continue
+
+            start = time.perf_counter()
+            sorted_cars = collector.get_sorted_cars()
+            sort_times.append(time.perf_counter() - start)
+
+            positions = {car['carIndex']: i + 1 for i, car in enumerate(sorted_cars)}
+            start = time.perf_counter()
+            collector.detect_overtakes(positions, collector.finished_cars)
+            overtake_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            collector.update_race_data()
+            update_times.append(time.perf_counter() - start)
+        collector.close_output()
+
+        for name, samples in (("get_sorted_cars", sort_times), ("detect_overtakes", overtake_times),
+                              ("update_race_data", update_times)):
+            if samples:
+                results[f"tick.{cars}_cars.{name}_us"] = metric(sum(samples) / len(samples) * 1e6, "us")
+    return results
+
+
+def bench_log_event(options, directory):
+    collector = collector_for(os.path.join(directory, "log_event"))
+    collector.session_time_ms = 60000
+    count = 2000
+
+    def log():
+        for i in range(count):
+            collector.log_event(f"Overtake! Driver A overtook Driver B for position {i % 20 + 1}.", "overtake",
+                                [1, 2], {"position": i % 20 + 1})
+
+    elapsed = best_of(log, options.repeat)
+    collector.close_output()
+    return {"log_event.us": metric(elapsed / count * 1e6, "us")}
+
+
+def bench_pipeline(options, directory):
+    """
+    Wall time of filter -> commentary -> voice on a short synthetic race, against local servers.
+    """
+    stub = None
+    llm_url, tts_url = options.llm_url, options.tts_url
+    if options.stub:
+        from api_governor import GOVERNOR
+        from stub_server import StubBehaviour, StubServer
+        # The stub has no quota, so the run measures the pipeline rather than the default tier budgets
+        for provider in GOVERNOR.providers.values():
+            provider.set_limits(None)
+        stub = StubServer(llm=StubBehaviour(latency=options.stub_latency, seed=options.seed),
+                          tts=StubBehaviour(latency=options.stub_latency, seed=options.seed + 1)).start()
+        llm_url = llm_url or stub.url
+        tts_url = tts_url or stub.url
+    # Only ever an explicit URL: a stray ANTHROPIC_BASE_URL must not send a benchmark to a paid API
+    if not llm_url:
+        print("pipeline: skipped, no --stub or --llm-url", file=sys.stderr)
+        return {}
+
+    from data_filterer import DataFilterer
+    from race_commentator import RaceCommentator
+    from voice_generator import VoiceGenerator
+
+    race = SyntheticRace(cars=20, hours=options.pipeline_minutes / 60, seed=options.seed)
+    log_path = race.write_collector_log(os.path.join(directory, "pipeline", "race.txt"))
+    results = {}
+    messages = []
+    try:
+        filterer = DataFilterer(log_path, "benchmark", llm_url)
+        filterer.output_signal.connect(messages.append)
+        start = time.perf_counter()
+        filterer.run()
+        results["pipeline.filter_s"] = metric(time.perf_counter() - start, "s")
+        if filterer.output_path is None:
+            raise RuntimeError(f"Filtering failed: {messages[-1] if messages else 'no output'}")
+
+        commentator = RaceCommentator(filterer.output_path, "benchmark", llm_url)
+        commentator.output_signal.connect(messages.append)
+        start = time.perf_counter()
+        commentator.run()
+        results["pipeline.commentary_s"] = metric(time.perf_counter() - start, "s")
+
+        if tts_url:
+            voice = VoiceGenerator(commentator.output_path, "benchmark", tts_url)
+            voice.output_dir = os.path.join(directory, "pipeline", "audio")
+            voice.output_signal.connect(messages.append)
+            start = time.perf_counter()
+            voice.run()
+            results["pipeline.voice_s"] = metric(time.perf_counter() - start, "s")
+        else:
+            print("pipeline: voice skipped, no --tts-url", file=sys.stderr)
+    finally:
+        if stub is not None:
+            stub.stop()
+    return results
+
+
+BENCHMARKS = {
+    "decode": lambda options, directory: bench_decode(options),
+    "construct": lambda options, directory: bench_construction(options),
+    "ticks": bench_ticks,
+    "log_event": bench_log_event,
+    "pipeline": bench_pipeline,
+}
+
+
+def run(options):
+    directory = tempfile.mkdtemp(prefix="benchmark_")
+    results = {}
+    try:
+        for name in options.only or BENCHMARKS:
+            start = time.perf_counter()
+            try:
+                results.update(BENCHMARKS[name](options, directory))
+            except ImportError as e:
+                print(f"{name}: skipped, {e}", file=sys.stderr)
+                continue
+            print(f"{name}: done in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": options.seed,
+            "minutes": options.minutes,
+            "datagrams": options.datagrams,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    (name, baseline, current, change) for every metric that got worse by more than threshold.
+    """
+    regressions = []
+    for name, result in sorted(current["results"].items()):
+        base = baseline["results"].get(name)
+        if base is None or not base["value"]:
+            continue
+        change = result["value"] / base["value"] - 1
+        worse = -change if result["better"] == "higher" else change
+        flag = "REGRESSION" if worse > threshold else ""
+        print(f"{name:50s} {base['value']:>14.3f} {result['value']:>14.3f} {result['unit']:>10s} {change:+8.1%} {flag}")
+        if flag:
+            regressions.append((name, base["value"], result["value"], change))
+    return regressions
+
+
+def format_results(report):
+    for name, result in sorted(report["results"].items()):
+        print(f"{name:50s} {result['value']:>14.3f} {result['unit']}")
+
+
+if __name__ == "__main__":
+    # python benchmark.py run --output benchmarks/baseline.json
+    # python benchmark.py run --baseline benchmarks/baseline.json
+    # python benchmark.py compare benchmarks/baseline.json benchmarks/current.json
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the collector and pipeline stages.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS))
+    run_parser.add_argument("--cars", nargs="+", type=int, default=[20, 60, 120])
+    run_parser.add_argument("--minutes", type=float, default=5.0, help="Synthetic race length per benchmark")
+    run_parser.add_argument("--pipeline-minutes", type=float, default=5.0)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--datagrams", help="Recorded datagrams (race_generator.py --format datagrams) to decode")
+    run_parser.add_argument("--stub", action="store_true", help="Run the pipeline against a local stub_server.py")
+    run_parser.add_argument("--stub-latency", default="fixed:0", help="Stub latency, see stub_server.parse_latency")
+    run_parser.add_argument("--llm-url", help="Base URL of a local Anthropic-compatible server")
+    run_parser.add_argument("--tts-url", help="Base URL of a local ElevenLabs-compatible server")
+    run_parser.add_argument("--output", help="Write the results here as JSON")
+    run_parser.add_argument("--baseline", help="Compare against this saved result")
+    run_parser.add_argument("--threshold", type=float, default=0.10)
+
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+
+    options = parser.parse_args()
+    if options.command == "run":
+        report = run(options)
+        format_results(report)
+        if options.output:
+            os.makedirs(os.path.dirname(options.output) or ".", exist_ok=True)
+            with open(options.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        baseline_path = options.baseline
+    else:
+        with open(options.current, encoding="utf-8") as f:
+            report = json.load(f)
+        baseline_path = options.baseline
+
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, options.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {options.threshold:.0%}", file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,48 @@
+class ClassLeaderboard:
+    """
+    Class positions derived from the overall order in one pass.
+    """
+
+    def __init__(self):
+        self.classes = {}
+        self.positions = {}
+        self.orders = {}
+
+    def set_class(self, car_index, category):
+        self.classes[car_index] = category
+
+    def forget(self, car_index):
+        self.classes.pop(car_index, None)
+
+    @property
+    def multiclass(self):
+        return len(set(self.classes.values())) > 1
+
+    def update(self, order, classes=None):
+        # Returns (class overtakes as (overtaker, overtaken, category, class position),
+        # class leader changes as (new leader, previous leader, category)).
+        classes = self.classes if classes is None else classes
+        previous_positions = self.positions
+        previous_orders = self.orders
+        positions = {}
+        orders = {}
+        for car_index in order:
+            cars = orders.setdefault(classes.get(car_index), [])
+            cars.append(car_index)
+            positions[car_index] = len(cars)
+
+        overtakes = []
+        leader_changes = []
+        if previous_positions:
+            for category, cars in orders.items():
+                for ahead, behind in zip(cars, cars[1:]):
+                    # Same test as the overall detector: the pair swapped places within the class
+                    if previous_positions.get(ahead, 0) > previous_positions.get(behind, len(cars) + 1):
+                        overtakes.append((ahead, behind, category, positions[ahead]))
+                previous_order = previous_orders.get(category)
+                if previous_order and cars[0] != previous_order[0] and previous_order[0] in positions:
+                    leader_changes.append((cars[0], previous_order[0], category))
+
+        self.positions = positions
+        self.orders = orders
+        return overtakes, leader_changes
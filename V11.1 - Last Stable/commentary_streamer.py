@@ -0,0 +1,169 @@
+import os
+import re
+import time
+import queue
+import threading
+from collections import Counter
+
+from event_store import EventWriter, events_path, open_events
+from metrics import TTS_BYTES
+from race_commentator import RaceCommentator
+from voice_generator import VoiceGenerator
+
+# Events (time to first audio) and timecodes (audio file numbering) remembered in endurance mode
+LATENCY_WINDOW = 1000
+
+
+class SentenceSplitter:
+    # A sentence ends at ., ! or ? (plus any closing quote/bracket) followed by whitespace
+    boundary = re.compile(r'(?<=[.!?])["\')\]]*\s+')
+
+    def __init__(self, min_chars=20):
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, text):
+        self.buffer += text
+        sentences = []
+        start = 0
+        for match in self.boundary.finditer(self.buffer):
+            sentence = self.buffer[start:match.end()].strip()
+            # Very short fragments ("P3." or "Wow!") are voiced together with the next sentence
+            if len(sentence) >= self.min_chars:
+                sentences.append(sentence)
+                start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self):
+        sentence = re.sub(r'\s+', ' ', self.buffer).strip()
+        self.buffer = ""
+        return [sentence] if sentence else []
+
+
+class StreamingCommentator(RaceCommentator):
+    def __init__(self, input_path, api_key, xi_api_key, base_url=None, tts_base_url=None):
+        super().__init__(input_path, api_key, base_url)
+        self.voice = VoiceGenerator(input_path, xi_api_key, tts_base_url)
+        self.sentence_queue = queue.Queue()
+        self.first_audio_latencies = {}
+        self.events_streamed = 0
+        # Events voiced per timecode, so events in the same second get their own file
+        self.audio_occurrences = Counter()
+
+    def run(self):
+        self.output_signal.emit("Starting streaming race commentary...")
+        self.progress_signal.emit(0)
+
+        tts_thread = threading.Thread(target=self.speak_sentences, daemon=True)
+
+        try:
+            os.makedirs(self.voice.output_dir, exist_ok=True)
+            tts_thread.start()
+
+            messages = []
+            race_history = self.new_race_history()
+            events = open_events(self.input_path)
+            processed_events = 0
+            if self.compact_encoding:
+                self.setup_compact_encoding(events)
+
+            self.output_path = self.create_output_file()
+            self.event_writer = EventWriter(events_path(self.output_path))
+
+            for event in events:
+                timecode = event.timecode
+                event_data = self.encode_event(event.text)
+                commentary = self.stream_event(messages, timecode, event_data, race_history)
+
+                self.write_commentary(timecode, commentary, event.session_ms)
+                race_history += f"{timecode} - {event_data}\n"
+
+                processed_events += 1
+                self.progress_signal.emit(events.progress(processed_events))
+
+            self.close_event_writer()
+            self.sentence_queue.put(None)
+            tts_thread.join()
+
+            self.output_signal.emit(f"Streaming commentary complete. Output saved to {self.output_path}")
+            self.report_first_audio_latency()
+            self.progress_signal.emit(100)
+
+        except Exception as e:
+            self.sentence_queue.put(None)
+            self.output_signal.emit(f"An error occurred: {str(e)}")
+        finally:
+            self.close_event_writer()
+
+    def stream_event(self, messages, timecode, event_data, race_history, event_start=None):
+        if event_start is None:
+            event_start = time.perf_counter()
+        # Several events can share a timecode, so TTS state is keyed by event number
+        event_id = self.events_streamed
+        self.events_streamed += 1
+        self.audio_occurrences[timecode] += 1
+        if self.endurance and len(self.audio_occurrences) > LATENCY_WINDOW:
+            del self.audio_occurrences[next(iter(self.audio_occurrences))]
+        audio_path = self.voice.get_audio_path(timecode, self.audio_occurrences[timecode])
+        splitter = SentenceSplitter()
+        parts = []
+
+        for text in self.stream_ai_commentary(messages, event_data, race_history):
+            parts.append(text)
+            for sentence in splitter.feed(text):
+                self.sentence_queue.put((event_id, timecode, audio_path, self.decode_commentary(sentence), event_start))
+
+        for sentence in splitter.flush():
+            self.sentence_queue.put((event_id, timecode, audio_path, self.decode_commentary(sentence), event_start))
+
+        return self.decode_commentary("".join(parts))
+
+    def speak_sentences(self):
+        # Runs on its own thread so TTS for one sentence overlaps generation of the next.
+        # Sentences arrive event by event, so only the current event's text is kept.
+        spoken_event = None
+        spoken_text = ""
+        while True:
+            item = self.sentence_queue.get()
+            if item is None:
+                break
+
+            event_id, timecode, output_path, sentence, event_start = item
+            previous_text = spoken_text if event_id == spoken_event else ""
+            try:
+                response = self.request_sentence_audio(sentence, previous_text)
+                if not response.ok:
+                    self.output_signal.emit(f"Error generating audio for time {timecode}: {response.text}")
+                    continue
+
+                # First sentence of an event starts a new file, later sentences are appended to it
+                with open(output_path, "ab" if previous_text else "wb") as f:
+                    for chunk in response.iter_content(chunk_size=self.voice.chunk_size):
+                        if event_id not in self.first_audio_latencies:
+                            self.on_first_audio(event_id, timecode, time.perf_counter() - event_start)
+                        TTS_BYTES.inc(len(chunk))
+                        f.write(chunk)
+            except Exception as e:
+                self.output_signal.emit(f"Error generating audio for time {timecode}: {str(e)}")
+                continue
+
+            spoken_event = event_id
+            spoken_text = f"{previous_text} {sentence}" if previous_text else sentence
+
+    def request_sentence_audio(self, sentence, previous_text):
+        return self.voice.request_audio(sentence, previous_text)
+
+    def on_first_audio(self, event_id, timecode, latency):
+        self.first_audio_latencies[event_id] = latency
+        if self.endurance and len(self.first_audio_latencies) > LATENCY_WINDOW:
+            del self.first_audio_latencies[next(iter(self.first_audio_latencies))]
+        self.output_signal.emit(f"{timecode} - first audio after {latency:.2f}s")
+
+    def report_first_audio_latency(self):
+        latencies = sorted(self.first_audio_latencies.values())
+        if not latencies:
+            return
+        median = latencies[len(latencies) // 2]
+        worst = latencies[-1]
+        self.output_signal.emit(f"Time to first audio: median {median:.2f}s, worst {worst:.2f}s over {len(latencies)} events")
@@ -1,10 +1,24 @@
 import sys
 import os
+import time
+import threading
 from PyQt5.QtCore import QThread, pyqtSignal
 from datetime import datetime, timedelta
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from accapi.client import AccClient
+from accapi.client import AccClient, CallQueue
+from accapi.enums import CUP_CATEGORY, PIT_LOCATIONS, BroadcastingEventType, CarLocation, SessionPhase, SessionType
+from event_store import EventWriter, RaceEvent, events_path
+from gap_engine import GapEngine
+from battle_detector import BattleDetector
+from accident_clusterer import AccidentClusterer
+from lap_timing import LapTiming, format_lap_time
+from class_leaderboard import ClassLeaderboard
+from race_frame import FrameBuffer
+from metrics import (METRICS, EVENTS, LOG_WRITE_SECONDS, PACKETS_DROPPED, PACKETS_RECEIVED, QUEUE_DEPTH, TICK_SECONDS,
+                     MetricsServer, SnapshotWriter, timed_handler, timed_receive_methods)
+from profiler import Profiler
+from telemetry_archive import TelemetryRecorder
 
 class DataCollector(QThread):
     output_signal = pyqtSignal(str)
@@ -23,9 +37,12 @@ class DataCollector(QThread):
         self.race_started = False
         self.session_time_ms = 0
         self.race_start_time = None
-        self.current_accidents = {}
+        self.accident_clusterer = AccidentClusterer()
         self.initialization_complete = False
         self.output_file = None
+        self.event_writer = None
+        self.record_telemetry = False
+        self.telemetry_recorder = None
         self.cars_in_pits = set()
         self.current_flag = "Green"
         self.last_position_display = 0
@@ -34,9 +51,41 @@ class DataCollector(QThread):
         self.leader_finished = False
         self.leader_car_index = None
         self.total_laps = None
+        self.live_queue = None
+        self.gap_engine = GapEngine()
+        self.battle_detector = BattleDetector()
+        # Multiclass races: one detector per cupCategory, fed the class order
+        self.class_battle_detectors = {}
+        self.lap_timing = LapTiming()
+        self.class_leaderboard = ClassLeaderboard()
+        self.frames = FrameBuffer()
+        # Endurance mode: every compact_interval_ms of session time, cars not heard from for
+        # stale_car_ms are dropped from the per-car state
+        self.endurance = False
+        self.stale_car_ms = 60000
+        self.compact_interval_ms = 300000
+        self.next_compaction_ms = 0
+        # Set a port to serve /metrics; the JSON snapshot is then written next to the race log
+        self.metrics_port = None
+        self.metrics_snapshot_interval = 10
+        self.metrics_server = None
+        self.metrics_snapshot = None
+        # Profiling on request: a profile.request file next to the race log, profile_port, or
+        # SIGUSR1/SIGUSR2 once the entry point calls profiler.install_signal_handlers() on the main thread
+        self.profile_port = None
+        self.thread_id = None
+        self.thread_calls = CallQueue()
+        self.profiler = Profiler(self.profile_prefix, self.profile_threads, self.output_signal.emit)
 
     def run(self):
         self.running = True
+        self.thread_id = threading.get_ident()
+        if self.metrics_port is not None:
+            self.metrics_server = MetricsServer(METRICS, self.metrics_port)
+            self.output_signal.emit(f"Metrics on http://127.0.0.1:{self.metrics_server.port}/metrics")
+        if self.profile_port is not None:
+            port = self.profiler.serve(self.profile_port)
+            self.output_signal.emit(f"Profiler listening on 127.0.0.1:{port}")
         self.setup_client()
         self.start_client()
         
@@ -51,18 +100,76 @@ class DataCollector(QThread):
         
         while self.running:
             self.msleep(self.update_interval * 1000)
+            self.thread_calls.run()
+            self.profiler.poll_control_file(os.path.dirname(self.output_file or os.path.join("Race Data", "")))
             if self.race_started:
                 self.update_race_data()
 
     def stop(self):
         self.running = False
         self.stop_client()
+        stats = self.client.entryListStats
+        if stats["requestsSent"]:
+            self.output_signal.emit(f"Entry list refreshes: {stats['requestsSent']} sent, {stats['requestsSaved']} coalesced, "
+                                    f"{stats['staleUpdatesKept']} stale car updates kept.")
+        stats = self.client.readerStats
+        if stats and (stats["droppedPackets"] or stats["coalescedPackets"]):
+            self.output_signal.emit(f"Receive buffer overloaded: {stats['droppedPackets']} packets dropped, "
+                                    f"{stats['coalescedPackets']} car updates coalesced, "
+                                    f"peak {stats['highWaterMark']} packets queued.")
+        self.close_output()
+        METRICS.remove_collector(self.collect_metrics)
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        self.profiler.stop()
+
+    def close_output(self):
+        if self.event_writer:
+            self.event_writer.close()
+        if self.telemetry_recorder:
+            self.telemetry_recorder.close()
+        if self.metrics_snapshot is not None:
+            self.metrics_snapshot.stop()
+            self.metrics_snapshot = None
 
     def setup_client(self):
-        self.client.onRealtimeUpdate.subscribe(self.on_realtime_update)
-        self.client.onRealtimeCarUpdate.subscribe(self.on_realtime_car_update)
-        self.client.onEntryListCarUpdate.subscribe(self.on_entry_list_car_update)
-        self.client.onBroadcastingEvent.subscribe(self.on_broadcasting_event)
+        handlers = [
+            (self.client.onRealtimeUpdate, self.on_realtime_update),
+            (self.client.onRealtimeCarUpdate, self.on_realtime_car_update),
+            (self.client.onEntryListCarUpdate, self.on_entry_list_car_update),
+            (self.client.onBroadcastingEvent, self.on_broadcasting_event),
+            (self.client.onTrackDataUpdate, self.on_track_data_update),
+        ]
+        # Timing wrappers only exist while metrics are on, so the packet path is untouched otherwise
+        if METRICS.enabled:
+            self.client._receiveMethods = timed_receive_methods(self.client._receiveMethods)
+            handlers = [(observable, timed_handler(handler, handler.__name__)) for observable, handler in handlers]
+            METRICS.add_collector(self.collect_metrics)
+        for observable, handler in handlers:
+            observable.subscribe(handler)
+
+    def collect_metrics(self):
+        stats = self.client.readerStats
+        if stats:
+            PACKETS_RECEIVED.set(stats["receivedPackets"])
+            PACKETS_DROPPED.set(stats["droppedPackets"], "dropped")
+            PACKETS_DROPPED.set(stats["coalescedPackets"], "coalesced")
+            QUEUE_DEPTH.set(stats["queuedPackets"], "packets")
+        if self.live_queue is not None:
+            QUEUE_DEPTH.set(self.live_queue.qsize(), "live_events")
+
+    def profile_prefix(self):
+        if self.output_file:
+            return os.path.splitext(self.output_file)[0]
+        return os.path.join("Race Data", datetime.now().strftime("%Y-%m-%d_%H-%M-%S"))
+
+    def profile_threads(self):
+        threads = {name: (ident, self.client.callInClientThread if name == "client" else None)
+                   for name, ident in self.client.threadIds.items()}
+        if self.thread_id is not None and self.running:
+            threads["collector"] = (self.thread_id, self.thread_calls.put)
+        return threads
 
     def start_client(self):
         self.client.start(
@@ -71,7 +178,8 @@ class DataCollector(QThread):
             password="asd",
             commandPassword="",
             displayName="Python ACC Data Collector",
-            updateIntervalMs=500
+            updateIntervalMs=500,
+            overloadPolicy="coalesce_cars"
         )
 
     def stop_client(self):
@@ -80,14 +188,19 @@ class DataCollector(QThread):
 
     def on_realtime_update(self, event):
         update = event.content
+        # A realtime update opens a new tick; the car updates of the previous one become a frame
+        self.frames.publish(self.session_time_ms, self.cars, self.cars_in_pits, self.finished_cars,
+                            self.class_leaderboard.classes)
         self.session_info = {
-            "sessionType": update.sessionType,
-            "sessionPhase": update.sessionPhase,
+            "sessionTypeCode": update.sessionTypeCode,
+            "sessionPhaseCode": update.sessionPhaseCode,
         }
         self.session_time_ms = update.sessionTimeMs
+        if self.endurance and self.session_time_ms >= self.next_compaction_ms:
+            self.compact_state()
 
         if not self.initialization_complete:
-            if update.sessionType == "Race" and update.sessionPhase != "Pre Session":
+            if update.sessionTypeCode == SessionType.RACE and update.sessionPhaseCode != SessionPhase.PRE_SESSION:
                 self.initialization_complete = True
                 if self.session_time_ms == 0:
                     self.output_signal.emit("Waiting for the race to start.")
@@ -97,17 +210,14 @@ class DataCollector(QThread):
         if not self.race_started and self.session_time_ms > 0:
             self.race_started = True
             self.race_start_time = datetime.now() - timedelta(milliseconds=self.session_time_ms)
-            self.log_event("The Race Begins!")
+            self.log_event("The Race Begins!", "race_start")
 
-        if self.race_started and not self.final_lap_phase:
-            elapsed_time = self.session_time_ms / 1000
-            if elapsed_time >= 240 and (elapsed_time - self.last_position_display) >= 240:
-                self.display_positions()
-                self.last_position_display = elapsed_time
+        if self.race_started:
+            self.log_incidents()
 
-        if update.sessionPhase == "Session Over" and not self.final_lap_phase:
+        if update.sessionPhaseCode == SessionPhase.SESSION_OVER and not self.final_lap_phase:
             self.final_lap_phase = True
-            self.log_event("Leader is on final lap")
+            self.log_event("Leader is on final lap", "final_lap")
 
         if self.final_lap_phase and not self.leader_finished:
             self.check_race_finish()
@@ -120,6 +230,19 @@ class DataCollector(QThread):
         current_spline = car.splinePosition
         laps = car.laps
         continuous_spline = laps + current_spline
+        location = car.locationCode
+
+        if location == CarLocation.TRACK:
+            # Only flying laps at racing speed teach the gap engine; out laps, in laps and cars
+            # crawling after a spin would bend the curve
+            current_lap = car.currentLap
+            if car.kmh >= 30 and not current_lap.isOutlap and not current_lap.isInlap:
+                self.gap_engine.learn(current_spline, current_lap.lapTimeMs)
+            previous_laps = self.cars[car.carIndex].get('laps')
+            last_lap = car.lastLap
+            if previous_laps is not None and laps > previous_laps and not (
+                    last_lap.isInvalid or last_lap.isOutlap or last_lap.isInlap):
+                self.gap_engine.learn_lap(last_lap.lapTimeMs)
 
         self.cars[car.carIndex].update({
             'carIndex': car.carIndex,
@@ -127,19 +250,29 @@ class DataCollector(QThread):
             'continuousSpline': continuous_spline,
             'laps': laps,
             'previous_spline': current_spline,
-            'location': car.location,
+            'locationCode': location,
             'position': car.position,
+            'kmh': car.kmh,
+            'worldPosX': car.worldPosX,
+            'worldPosY': car.worldPosY,
+            'lastSeenMs': self.session_time_ms,
         })
 
+        timing_events = self.lap_timing.update(car)
+        if timing_events and self.race_started and car.carIndex not in self.finished_cars:
+            for timing_event in timing_events:
+                self.log_timing(*timing_event)
+
         if car.carIndex not in self.finished_cars:
-            if car.location in ["Pitlane", "Pit Entry"] and car.carIndex not in self.cars_in_pits:
+            in_pits = location in PIT_LOCATIONS
+            if in_pits and car.carIndex not in self.cars_in_pits:
                 self.cars_in_pits.add(car.carIndex)
                 driver_name = self.cars[car.carIndex].get('driverName', f"Car {car.carIndex}")
-                self.log_event(f"{driver_name} has entered the pits.")
-            elif car.location not in ["Pitlane", "Pit Entry"] and car.carIndex in self.cars_in_pits:
+                self.log_event(f"{driver_name} has entered the pits.", "pit_entry", [car.carIndex])
+            elif not in_pits and car.carIndex in self.cars_in_pits:
                 self.cars_in_pits.remove(car.carIndex)
                 driver_name = self.cars[car.carIndex].get('driverName', f"Car {car.carIndex}")
-                self.log_event(f"{driver_name} has exited the pits.")
+                self.log_event(f"{driver_name} has exited the pits.", "pit_exit", [car.carIndex])
 
     def on_entry_list_car_update(self, event):
         car = event.content
@@ -149,31 +282,46 @@ class DataCollector(QThread):
             driver = car.drivers[0]
             self.cars[car.carIndex]['driverName'] = f"{driver.firstName} {driver.lastName}"
             self.cars[car.carIndex]['driverSurname'] = driver.lastName
+        self.cars[car.carIndex]['cupCategory'] = car.cupCategory
+        self.cars[car.carIndex].setdefault('lastSeenMs', self.session_time_ms)
+        self.class_leaderboard.set_class(car.carIndex, car.cupCategory)
+
+    def compact_state(self):
+        # Runs on the client thread like every other write to self.cars; analysis reads published frames
+        self.next_compaction_ms = self.session_time_ms + self.compact_interval_ms
+        stale = [car_index for car_index, car in self.cars.items()
+                 if self.session_time_ms - car.get('lastSeenMs', self.session_time_ms) > self.stale_car_ms]
+        for car_index in stale:
+            car = self.cars.pop(car_index)
+            self.cars_in_pits.discard(car_index)
+            self.finished_cars.discard(car_index)
+            self.lap_timing.forget(car_index)
+            self.class_leaderboard.forget(car_index)
+            self.output_signal.emit(f"{car.get('driverName', f'Car {car_index}')} has left the session.")
+        if stale:
+            # A dict never shrinks its table on deletes; a copy is sized for the cars still here
+            self.cars = dict(self.cars)
+
+    def on_track_data_update(self, event):
+        self.gap_engine.set_track_length(event.content.trackMeters)
 
     def on_broadcasting_event(self, event):
         event_content = event.content
-        event_type = event_content.type
-        if event_type == "Green Flag":
+        event_type = event_content.typeCode
+        if event_type == BroadcastingEventType.GREEN_FLAG:
             if self.current_flag != "Green":
-                self.log_event("Green flag! Racing resumes.")
+                self.log_event("Green flag! Racing resumes.", "flag", payload={"flag": "Green"})
                 self.current_flag = "Green"
-        elif event_type == "Session Over":
-            self.log_event("Leader is on final lap")
+        elif event_type == BroadcastingEventType.SESSION_OVER:
+            self.log_event("Leader is on final lap", "final_lap")
             self.final_lap_phase = True
-        elif event_type == "Accident":
-            accident_time = self.format_session_time(self.session_time_ms)
+        elif event_type == BroadcastingEventType.ACCIDENT:
             car_index = event_content.carIndex
 
             if car_index not in self.finished_cars:
-                try:
-                    driver = self.cars[car_index].get('driverName', f'Car {car_index}')
-                except KeyError:
-                    driver = f'Unknown Car {car_index}'
-
-                if accident_time not in self.current_accidents:
-                    self.current_accidents[accident_time] = []
-
-                self.current_accidents[accident_time].append(driver)
+                car = self.cars.get(car_index, {})
+                self.accident_clusterer.add(self.session_time_ms, car_index, car.get('worldPosX'),
+                                            car.get('worldPosY'), car.get('splinePosition'))
 
     def check_race_finish(self):
         sorted_cars = self.get_sorted_cars()
@@ -181,98 +329,268 @@ class DataCollector(QThread):
         if leader['splinePosition'] > 0.99 and not self.leader_finished:
             self.leader_finished = True
             self.total_laps = leader['laps']
-            self.log_event(f"Checkered flag! {leader['driverName']} takes the win!")
+            self.log_event(f"Checkered flag! {leader['driverName']} takes the win!", "finish", [leader['carIndex']])
             self.report_race_results(sorted_cars)
 
     def report_race_results(self, sorted_cars):
         for position, car in enumerate(sorted_cars, start=1):
             driver_name = car.get('driverName', f"Car {car['carIndex']}")
-            self.log_event(f"{driver_name} has finished in position {position}.")
+            self.log_event(f"{driver_name} has finished in position {position}.", "result", [car['carIndex']],
+                           {"position": position})
             self.finished_cars.add(car['carIndex'])
 
     def get_sorted_cars(self):
         return sorted(self.cars.values(), key=lambda x: (-x.get('laps', 0), -x.get('splinePosition', 0)))
 
-    def display_positions(self):
-        sorted_cars = self.get_sorted_cars()
+    def display_positions(self, frame, gaps):
+        # Called from update_race_data with its frame and the gaps computed from it
+        if frame.multiclass:
+            self.display_class_positions(frame, gaps)
+            return
         positions = []
-        for position, car in enumerate(sorted_cars, start=1):
-            if car['carIndex'] not in self.finished_cars:
-                driver_name = car.get('driverName', f"Car {car['carIndex']}")
-                positions.append(f"(P{position}) {driver_name}")
+        car_indices = []
+        for position, car in enumerate(frame.sorted_cars, start=1):
+            if car['carIndex'] not in frame.finished_cars:
+                driver_name = frame.driver_name(car['carIndex'])
+                if position > 1 and car['carIndex'] in gaps:
+                    positions.append(f"(P{position}) {driver_name} {self.gap_engine.format_gap(gaps[car['carIndex']][0])}")
+                else:
+                    positions.append(f"(P{position}) {driver_name}")
+                car_indices.append(car['carIndex'])
         position_string = "Current positions: " + ", ".join(positions)
-        self.log_event(position_string)
-
-    def update_race_data(self):
-        sorted_cars = self.get_sorted_cars()
-
-        current_positions = {car['carIndex']: i+1 for i, car in enumerate(sorted_cars) if car['carIndex'] not in self.cars_in_pits and car['carIndex'] not in self.finished_cars}
-        overtakes = self.detect_overtakes(current_positions) if self.session_time_ms >= 15000 else []
-
-        self.previous_positions = current_positions
+        self.log_event(position_string, "positions", car_indices)
+
+    def display_class_positions(self, frame, gaps):
+        # One table per class, in the order the classes run on track, with gaps to the class leader
+        tables = {}
+        for car in frame.sorted_cars:
+            if car['carIndex'] in frame.finished_cars:
+                continue
+            table = tables.setdefault(frame.classes.get(car['carIndex']), ([], [], []))
+            positions, car_indices, leader = table
+            driver_name = frame.driver_name(car['carIndex'])
+            position = len(car_indices) + 1
+            if leader and car['carIndex'] in gaps and leader[0] in gaps:
+                gap = gaps[car['carIndex']][0] - gaps[leader[0]][0]
+                positions.append(f"(P{position}) {driver_name} {self.gap_engine.format_gap(gap)}")
+            else:
+                positions.append(f"(P{position}) {driver_name}")
+                leader.append(car['carIndex'])
+            car_indices.append(car['carIndex'])
 
-        accidents = self.current_accidents
-        self.current_accidents = {}  # Clear the current accidents after processing
+        for category, (positions, car_indices, _) in tables.items():
+            class_name = self.get_class_name(category)
+            self.log_event(f"Current positions ({class_name}): " + ", ".join(positions), "positions", car_indices,
+                           {"class": class_name})
 
-        for overtake in overtakes:
-            self.log_event(overtake)
+    def get_class_name(self, category):
+        return CUP_CATEGORY[category] if category is not None else "Unknown class"
 
-        for accident_time, drivers in accidents.items():
-            drivers_str = ", ".join(drivers)
-            self.log_event(f"Accident involving: {drivers_str}")
+    def update_race_data(self):
+        # Runs on the QThread: everything about the field comes from one published frame
+        tick_start = time.perf_counter()
+        frame = self.frames.front
+        with TICK_SECONDS.time("sort"):
+            sorted_cars = frame.sorted_cars
+        with TICK_SECONDS.time("gaps"):
+            speeds = [car['kmh'] for car in sorted_cars if car.get('kmh')]
+            gaps = self.gap_engine.compute(sorted_cars, sum(speeds) / len(speeds) if speeds else None)
+
+        current_positions = {car['carIndex']: i+1 for i, car in enumerate(sorted_cars) if car['carIndex'] not in frame.cars_in_pits and car['carIndex'] not in frame.finished_cars}
+        with TICK_SECONDS.time("overtakes"):
+            overtakes = self.detect_overtakes(current_positions, frame.finished_cars) if frame.session_time_ms >= 15000 else []
+        order = [car['carIndex'] for car in sorted_cars if car['carIndex'] in current_positions]
+        with TICK_SECONDS.time("classes"):
+            class_overtakes, class_leader_changes = self.class_leaderboard.update(order, frame.classes)
+        with TICK_SECONDS.time("battles"):
+            battles = []
+            if frame.session_time_ms >= 15000 and self.race_started:
+                if frame.multiclass:
+                    battles = self.detect_class_battles(gaps, frame.session_time_ms)
+                else:
+                    battles = [battle + (None,) for battle in
+                               self.battle_detector.update(order, gaps, current_positions, frame.session_time_ms)]
+        if frame.multiclass:
+            # Overall passes across classes are mostly lapping; only passes within a class are reported
+            overtakes = []
+            if frame.session_time_ms < 15000 or not self.race_started:
+                class_overtakes, class_leader_changes = [], []
+        else:
+            class_overtakes, class_leader_changes = [], []
 
-    def detect_overtakes(self, current_positions):
+        self.previous_positions = current_positions
+        name = frame.driver_name
+
+        for overtaker, overtaken, position in overtakes:
+            self.log_event(f"Overtake! {name(overtaker)} overtook {name(overtaken)} "
+                           f"for position {position}.", "overtake", [overtaker, overtaken], {"position": position})
+
+        for overtaker, overtaken, category, position in class_overtakes:
+            if position == 1:
+                continue  # Reported as a class lead change
+            class_name = self.get_class_name(category)
+            self.log_event(f"Class overtake! {name(overtaker)} overtook {name(overtaken)} "
+                           f"for P{position} in {class_name}.", "overtake", [overtaker, overtaken],
+                           {"position": position, "class": class_name})
+
+        for leader, previous_leader, category in class_leader_changes:
+            class_name = self.get_class_name(category)
+            self.log_event(f"{name(leader)} takes the {class_name} class lead from "
+                           f"{name(previous_leader)}!", "class_leader", [leader, previous_leader],
+                           {"class": class_name})
+
+        for phase, car_indices, position, closest, category in battles:
+            self.log_battle(phase, car_indices, position, closest, frame, category)
+
+        if not self.final_lap_phase:
+            elapsed_time = frame.session_time_ms / 1000
+            if elapsed_time >= 240 and (elapsed_time - self.last_position_display) >= 240:
+                self.display_positions(frame, gaps)
+                self.last_position_display = elapsed_time
+        TICK_SECONDS.observe(time.perf_counter() - tick_start, "total")
+
+    def log_incidents(self):
+        # Accident reports arrive on the client thread, so incidents are clustered and logged there too
+        for incident in self.accident_clusterer.pop_finished(self.session_time_ms):
+            drivers_str = ", ".join(self.get_driver_name(car_index) for car_index in incident.cars)
+            if len(incident.cars) > 1:
+                location = self.describe_location(incident.spline)
+                self.log_event(f"Multi-car incident at {location}: {drivers_str}", "accident", incident.cars,
+                               {"location": location}, session_ms=incident.start_ms)
+            else:
+                self.log_event(f"Accident involving: {drivers_str}", "accident", incident.cars,
+                               session_ms=incident.start_ms)
+
+    def describe_location(self, spline):
+        if spline is None:
+            return "an unknown part of the track"
+        if self.gap_engine.track_meters:
+            return f"the {spline * self.gap_engine.track_meters / 1000:.1f} km mark"
+        return f"{spline:.0%} of the lap"
+
+    def log_timing(self, kind, car_index, *values):
+        driver_name = self.get_driver_name(car_index)
+        if kind == "fastest_lap":
+            lap_ms, = values
+            self.log_event(f"Fastest lap! {driver_name} sets a {format_lap_time(lap_ms)}.", kind, [car_index],
+                           {"lap_ms": lap_ms})
+        elif kind == "purple_sector":
+            sector, split_ms = values
+            self.log_event(f"Purple sector! {driver_name} is fastest in sector {sector + 1} with a "
+                           f"{split_ms / 1000:.3f}.", kind, [car_index], {"sector": sector + 1, "split_ms": split_ms})
+        elif kind == "pace_drop":
+            lap_ms, average_ms = values
+            self.log_event(f"{driver_name} is losing pace: {format_lap_time(lap_ms)}, "
+                           f"{(lap_ms - average_ms) / 1000:.1f}s off their recent average.", kind, [car_index],
+                           {"lap_ms": lap_ms, "average_ms": int(average_ms)})
+
+    def detect_class_battles(self, gaps, session_ms):
+        # Cars of different classes running together are lapping traffic, not a fight, so each
+        # class is searched on its own order; a class with no car on track still ends its battles
+        orders = self.class_leaderboard.orders
+        battles = []
+        for category in set(orders) | set(self.class_battle_detectors):
+            detector = self.class_battle_detectors.setdefault(category, BattleDetector())
+            for battle in detector.update(orders.get(category, []), gaps, self.class_leaderboard.positions,
+                                          session_ms):
+                battles.append(battle + (category,))
+        return battles
+
+    def log_battle(self, phase, car_indices, position, closest, frame, category=None):
+        names = [frame.driver_name(car_index) for car_index in car_indices]
+        drivers_str = names[0] if len(names) == 1 else ", ".join(names[:-1]) + " and " + names[-1]
+        payload = {"phase": phase, "position": position}
+        if category is None:
+            place = f"position {position}"
+        else:
+            payload["class"] = self.get_class_name(category)
+            place = f"P{position} in {payload['class']}"
+        if phase == "started":
+            text = f"Battle for {place}: {drivers_str} are nose to tail."
+        elif phase == "intensifying":
+            text = f"The battle for {place} is heating up: {drivers_str}"
+            if closest is None:
+                text += "."
+            elif closest < 100:
+                # Below a tenth the gap would print as 0.0s
+                text += ", side by side."
+            else:
+                text += f", {closest / 1000:.1f}s apart."
+        else:
+            text = f"The battle for {place} is over: {drivers_str}."
+        self.log_event(text, "battle", car_indices, payload)
+
+    def detect_overtakes(self, current_positions, finished_cars):
         overtakes = []
         if not self.previous_positions or not self.race_started:
             return overtakes
 
         for car_index, current_pos in current_positions.items():
-            if car_index in self.previous_positions and car_index not in self.finished_cars:
+            if car_index in self.previous_positions and car_index not in finished_cars:
                 previous_pos = self.previous_positions[car_index]
                 if current_pos < previous_pos:
-                    try:
-                        overtaker = self.cars[car_index].get('driverName', f"Car {car_index}")
-                    except KeyError:
-                        overtaker = f"Unknown Car {car_index}"
                     for other_index, other_pos in current_positions.items():
-                        if other_index != car_index and other_index not in self.finished_cars and other_pos == current_pos + 1 and self.previous_positions.get(other_index, 0) < previous_pos:
-                            try:
-                                overtaken = self.cars[other_index].get('driverName', f"Car {other_index}")
-                            except KeyError:
-                                overtaken = f"Unknown Car {other_index}"
-                            overtakes.append(f"Overtake! {overtaker} overtook {overtaken} for position {current_pos}.")
+                        if other_index != car_index and other_index not in finished_cars and other_pos == current_pos + 1 and self.previous_positions.get(other_index, 0) < previous_pos:
+                            overtakes.append((car_index, other_index, current_pos))
         return overtakes
 
+    def get_driver_name(self, car_index):
+        try:
+            return self.cars[car_index].get('driverName', f"Car {car_index}")
+        except KeyError:
+            return f"Unknown Car {car_index}"
+
     def format_session_time(self, milliseconds):
         seconds = int(milliseconds // 1000)
         hours, remainder = divmod(seconds, 3600)
         minutes, seconds = divmod(remainder, 60)
         return f"{int(hours):02d}:{int(minutes):02d}:{int(seconds):02d}"
 
-    def setup_output_file(self):
-        if not os.path.exists("Race Data"):
-            os.makedirs("Race Data")
-
+    def setup_output_file(self, output_file=None):
         start_time = datetime.now()
-        filename = start_time.strftime("%Y-%m-%d_%H-%M-%S") + ".txt"
-        self.output_file = os.path.join("Race Data", filename)
+        if output_file is None:
+            filename = start_time.strftime("%Y-%m-%d_%H-%M-%S") + ".txt"
+            output_file = os.path.join("Race Data", filename)
+        os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+        self.output_file = output_file
 
         with open(self.output_file, 'w', encoding='utf-8') as f:
             f.write(f"Race data collection started at: {start_time}\n\n")
 
-    def log_event(self, event):
-        formatted_time = self.format_session_time(self.session_time_ms)
+        self.event_writer = EventWriter(events_path(self.output_file))
+
+        if METRICS.enabled:
+            self.metrics_snapshot = SnapshotWriter(METRICS, os.path.splitext(self.output_file)[0] + "_metrics.json",
+                                                   self.metrics_snapshot_interval)
+
+        if self.record_telemetry:
+            self.telemetry_recorder = TelemetryRecorder(os.path.splitext(self.output_file)[0] + "_telemetry")
+            self.telemetry_recorder.attach(self.client)
+
+    def log_event(self, event, event_type="info", cars=(), payload=None, session_ms=None):
+        # session_ms stamps an event that is logged after it happened, e.g. a clustered incident
+        if session_ms is None:
+            session_ms = self.session_time_ms
+        formatted_time = self.format_session_time(session_ms)
         log_message = f"{formatted_time} - {event}"
 
         self.output_signal.emit(log_message)
+        EVENTS.inc(1, event_type)
+
+        if self.live_queue is not None:
+            self.live_queue.put((session_ms, event, time.perf_counter(), event_type, payload))
+
+        if self.event_writer:
+            self.event_writer.write(RaceEvent(int(session_ms), event_type, event, cars, payload))
 
         if self.output_file:
-            try:
-                with open(self.output_file, 'a', encoding='utf-8') as f:
-                    f.write(log_message + '\n')
-            except UnicodeEncodeError:
-                with open(self.output_file, 'a', encoding='utf-8', errors='replace') as f:
-                    f.write(log_message + '\n')
+            with LOG_WRITE_SECONDS.time():
+                try:
+                    with open(self.output_file, 'a', encoding='utf-8') as f:
+                        f.write(log_message + '\n')
+                except UnicodeEncodeError:
+                    with open(self.output_file, 'a', encoding='utf-8', errors='replace') as f:
+                        f.write(log_message + '\n')
 
     def get_output_file_path(self):
         return self.output_file
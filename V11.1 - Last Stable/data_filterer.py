@@ -1,19 +1,36 @@
 import os
+import re
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from PyQt5.QtCore import QThread, pyqtSignal
-from datetime import datetime, timedelta
 import anthropic
 
+from api_governor import GOVERNOR, estimate_tokens
+from event_store import RaceEvent, events_path, parse_timecode, write_events
+from metrics import LLM_SECONDS, record_usage
+from race_log_codec import RaceLogCodec
+from race_log_reducer import reduce_race_log
+
 class DataFilterer(QThread):
     output_signal = pyqtSignal(str)
     progress_signal = pyqtSignal(int)
 
-    def __init__(self, input_path, api_key):
+    def __init__(self, input_path, api_key, base_url=None):
         super().__init__()
         self.input_path = input_path
         self.output_path = None
-        self.client = anthropic.Anthropic(api_key=api_key)
+        # base_url=None keeps the SDK default, which honours ANTHROPIC_BASE_URL (e.g. stub_server.py)
+        self.client = anthropic.Anthropic(api_key=api_key, base_url=base_url, max_retries=0)
+        # Pacing, concurrency and retries are shared with every other stage calling the same API
+        self.governor = GOVERNOR
         self.prompt = self.load_prompt("data_filterer_prompt.txt")
+        self.prefilter = True
+        self.compact_encoding = False
+        self.codec = None
+        # Logs longer than this are filtered in overlapping time windows, several at a time
+        self.max_single_prompt_chars = 40000
+        self.chunk_seconds = 1800
+        self.chunk_overlap_seconds = 60
 
     def run(self):
         self.output_signal.emit("Starting data filtering...")
@@ -53,53 +70,150 @@ class DataFilterer(QThread):
             return f"Error: {filename} not found. Please create this file with the desired prompt."
 
     def filter_race_data(self, race_data):
-        message = self.client.messages.create(
-            model="claude-3-5-sonnet-20240620",
-            max_tokens=4000,
-            temperature=0,
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"{self.prompt}\n\nHere is the race data to filter:\n\n<race_data>\n{race_data}\n</race_data>"
-                }
-            ]
-        )
+        if self.prefilter:
+            race_data, stats = reduce_race_log(race_data)
+            self.output_signal.emit(
+                f"Pre-filter reduced race data from {stats['input_chars']} to {stats['output_chars']} characters "
+                f"({stats['input_events']} to {stats['output_events']} events, {100 * (1 - stats['ratio']):.0f}% smaller)"
+            )
+
+        self.codec = None
+        if self.compact_encoding:
+            self.codec = RaceLogCodec.from_log(race_data)
+            encoded_size = len(self.codec.header()) + len(self.codec.encode(race_data))
+            self.output_signal.emit(f"Compact encoding: {len(race_data)} to {encoded_size} characters "
+                                    f"({len(self.codec.names)} drivers)")
+
+        if len(race_data) > self.max_single_prompt_chars:
+            return self.filter_race_data_chunked(race_data)
+        return self.request_filter(self.prompt, race_data)
+
+    def request_filter(self, prompt, race_data):
+        if self.codec is not None:
+            prompt = f"{prompt}\n\n{self.codec.header()}\n\nReply in the same compact format, one event per line."
+            race_data = self.codec.encode(race_data)
+
+        with LLM_SECONDS.time("filter"):
+            message = self.governor.call("anthropic", lambda: self.client.messages.create(
+                model="claude-3-5-sonnet-20240620",
+                max_tokens=4000,
+                temperature=0,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": f"{prompt}\n\nHere is the race data to filter:\n\n<race_data>\n{race_data}\n</race_data>"
+                    }
+                ]
+            ), {"input_tokens": estimate_tokens(prompt, race_data)})
+        record_usage("filter", message.usage)
+
+        if message.stop_reason == "max_tokens":
+            self.output_signal.emit("Warning: filtered output hit the token limit and may be truncated.")
 
         filtered_content = message.content[0].text if isinstance(message.content, list) else message.content
+        if self.codec is not None:
+            filtered_content = self.codec.decode(filtered_content)
         return filtered_content
 
+    def split_into_windows(self, race_data):
+        # Returns (owned_start, owned_end, text) per window. Each window also carries
+        # chunk_overlap_seconds of events on both sides as context; only events inside
+        # its own range are kept from its output.
+        events = []
+        for line in race_data.split('\n'):
+            match = re.match(r'(\d{2}):(\d{2}):(\d{2}) - ', line)
+            if match:
+                hours, minutes, seconds = map(int, match.groups())
+                events.append((hours * 3600 + minutes * 60 + seconds, line))
+        if not events:
+            return []
+
+        # Events logged at the start (qualifying results, race context) are shared by every window
+        preamble = [line for seconds, line in events if seconds == 0]
+        last_second = events[-1][0]
+
+        windows = []
+        start = 0
+        while start <= last_second:
+            end = start + self.chunk_seconds
+            lines = [line for seconds, line in events
+                     if start - self.chunk_overlap_seconds <= seconds < end + self.chunk_overlap_seconds
+                     and (seconds > 0 or start == 0)]
+            if start > 0:
+                lines = preamble + lines
+            windows.append((start, end, '\n'.join(lines)))
+            start = end
+        return windows
+
+    def filter_window(self, window, index, count):
+        start, end, race_data = window
+        prompt = (f"{self.prompt}\n\nThis is part {index + 1} of {count} of a long race. Filter only the events "
+                  f"from {self.format_seconds(start)} up to {self.format_seconds(end)}; events outside that range "
+                  f"are context only.")
+        return self.request_filter(prompt, race_data)
+
+    def filter_race_data_chunked(self, race_data):
+        windows = self.split_into_windows(race_data)
+        self.output_signal.emit(f"Race data is long, filtering it in {len(windows)} windows...")
+
+        # Every window is submitted at once; the governor decides how many are really in flight
+        workers = max(1, min(len(windows), self.governor.provider("anthropic").max_concurrency))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self.filter_window, window, i, len(windows)) for i, window in enumerate(windows)]
+            results = [future.result() for future in futures]
+        self.output_signal.emit(f"API calls: {self.governor.format_stats()}")
+
+        return self.merge_windows(windows, results)
+
+    def merge_windows(self, windows, results):
+        merged = []
+        seen = set()
+        for (start, end, _), filtered_content in zip(windows, results):
+            for line in filtered_content.split('\n'):
+                match = re.match(r'(\d{2}):(\d{2}):(\d{2}) - (.+)', line.strip())
+                if not match:
+                    continue
+                hours, minutes, seconds, text = match.groups()
+                seconds = int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+                # Overlap events are only kept from the window that owns them
+                if not start <= seconds < end:
+                    continue
+                key = (seconds, text.strip())
+                if key in seen:
+                    continue
+                seen.add(key)
+                merged.append((seconds, line.strip()))
+
+        merged.sort(key=lambda item: item[0])
+        return '\n'.join(line for _, line in merged)
+
+    def format_seconds(self, seconds):
+        hours, remainder = divmod(seconds, 3600)
+        minutes, seconds = divmod(remainder, 60)
+        return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
     def calculate_commentary_words(self, events):
-        processed_events = []
-        for i, event in enumerate(events):
+        # Each line is parsed once; the word budget is the gap to the next event at two words per second
+        parsed = []
+        for event in events:
             parts = event.split(' - ', 1)
             if len(parts) != 2:
                 continue  # Skip this event if it doesn't have the expected format
-            
-            time_str, description = parts
-            try:
-                current_time = datetime.strptime(time_str, '%H:%M:%S')
-            except ValueError:
+
+            session_ms = parse_timecode(parts[0].strip())
+            if session_ms is None:
                 continue  # Skip this event if the time format is incorrect
+            parsed.append((session_ms, parts[1].strip()))
 
-            if i < len(events) - 1:
-                next_parts = events[i+1].split(' - ', 1)
-                if len(next_parts) != 2:
-                    continue  # Skip to the next event if the next one doesn't have the expected format
-                
-                next_time_str = next_parts[0]
-                try:
-                    next_time = datetime.strptime(next_time_str, '%H:%M:%S')
-                    time_diff = (next_time - current_time).total_seconds()
-                    words = int(time_diff * 2)
-                except ValueError:
-                    words = 0  # Default to 0 if there's an issue with the next time
-            else:
-                words = 0  # Last event doesn't have a word count
+        processed_events = []
+        for i, (session_ms, description) in enumerate(parsed):
+            words = (parsed[i + 1][0] - session_ms) // 500 if i < len(parsed) - 1 else 0
 
             if words > 0:
-                processed_events.append(f"{event} Commentate in {words} words.")
+                processed_events.append(RaceEvent(session_ms, "filtered", f"{description} Commentate in {words} words.",
+                                                  payload={"words": words}))
             else:
-                processed_events.append(event)
+                processed_events.append(RaceEvent(session_ms, "filtered", description))
 
         return processed_events
 
@@ -112,7 +226,8 @@ class DataFilterer(QThread):
         new_file_path = os.path.join(original_dir, new_file_name)
 
         with open(new_file_path, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(filtered_content))
+            f.write('\n'.join(f"{event.timecode} - {event.text}" for event in filtered_content))
+        write_events(events_path(new_file_path), filtered_content)
 
         return new_file_path
 
@@ -0,0 +1,155 @@
+import os
+import json
+import threading
+
+# The header has a fixed width so the event count can be rewritten in place while the log grows;
+# closed is 1 once the writer closed the file and the count is final
+HEADER_TEMPLATE = '{{"format": "race-events", "version": 1, "count": {:10d}, "closed": {:d}}}\n'
+
+
+class RaceEvent:
+    __slots__ = ("session_ms", "type", "cars", "payload", "text")
+
+    def __init__(self, session_ms, type, text, cars=(), payload=None):
+        self.session_ms = session_ms
+        self.type = type
+        self.text = text
+        self.cars = cars
+        self.payload = payload
+
+    @property
+    def timecode(self):
+        return format_session_time(self.session_ms)
+
+    def to_json(self):
+        record = {"t": self.session_ms, "type": self.type, "text": self.text}
+        if self.cars:
+            record["cars"] = list(self.cars)
+        if self.payload:
+            record["payload"] = self.payload
+        return json.dumps(record, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, line):
+        record = json.loads(line)
+        return cls(record["t"], record["type"], record["text"], record.get("cars", ()), record.get("payload"))
+
+
+def format_session_time(milliseconds):
+    seconds = int(milliseconds // 1000)
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+def parse_timecode(timecode):
+    # "HH:MM:SS" -> session milliseconds, or None
+    parts = timecode.split(':')
+    if len(parts) != 3 or not all(len(part) == 2 and part.isdigit() for part in parts):
+        return None
+    hours, minutes, seconds = int(parts[0]), int(parts[1]), int(parts[2])
+    return (hours * 3600 + minutes * 60 + seconds) * 1000
+
+
+def events_path(text_path):
+    return os.path.splitext(text_path)[0] + ".events.jsonl"
+
+
+class EventWriter:
+    # The collector logs from the AccClient thread and its own QThread, so writes take a lock.
+    # The count in the header is rewritten every header_every events and on close; until then
+    # it lags the file and readers count the records themselves.
+    def __init__(self, path, header_every=100):
+        self.path = path
+        self.count = 0
+        self.header_every = header_every
+        self.lock = threading.Lock()
+        self.file = open(path, 'w', encoding='utf-8')
+        self.file.write(HEADER_TEMPLATE.format(0, 0))
+
+    def write(self, event):
+        line = event.to_json() + '\n'
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(line)
+            self.count += 1
+            if self.count % self.header_every == 0:
+                self.update_header()
+            else:
+                self.file.flush()
+
+    def update_header(self, closed=False):
+        end = self.file.tell()
+        self.file.seek(0)
+        self.file.write(HEADER_TEMPLATE.format(self.count, closed))
+        self.file.seek(end)
+        self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.update_header(closed=True)
+                self.file.close()
+
+
+def write_events(path, events):
+    writer = EventWriter(path)
+    try:
+        for event in events:
+            writer.write(event)
+    finally:
+        writer.close()
+
+
+class EventSource:
+    count = 0
+
+    def __len__(self):
+        return self.count
+
+    def progress(self, processed):
+        # Percent done after processed events, for the progress signal of every stage
+        return int(processed / self.count * 100) if self.count else 100
+
+
+class EventReader(EventSource):
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'r', encoding='utf-8') as file:
+            header = json.loads(file.readline())
+            self.count = header["count"]
+            # A log still being written, or one whose writer never closed it, has a count behind the file
+            if not header.get("closed"):
+                self.count = sum(1 for line in file if line.strip())
+
+    def __iter__(self):
+        with open(self.path, 'r', encoding='utf-8') as file:
+            file.readline()
+            for line in file:
+                if line.strip():
+                    yield RaceEvent.from_json(line)
+
+
+class TextLogReader(EventSource):
+    # Fallback for logs written before the event store existed; the file is read once
+    def __init__(self, path):
+        self.path = path
+        self.events = []
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                timecode, separator, text = line.strip().partition(' - ')
+                session_ms = parse_timecode(timecode) if separator else None
+                if session_ms is not None and text:
+                    self.events.append(RaceEvent(session_ms, "text", text))
+        self.count = len(self.events)
+
+    def __iter__(self):
+        return iter(self.events)
+
+
+def open_events(text_path):
+    path = events_path(text_path)
+    if os.path.exists(path):
+        return EventReader(path)
+    return TextLogReader(text_path)
@@ -0,0 +1,104 @@
+from array import array
+
+
+class GapEngine:
+    """
+    Converts track position into race time so gaps can be given in seconds.
+    """
+
+    def __init__(self, bins=200, default_lap_ms=100000):
+        self.bins = bins
+        self.reference = array('d', [0.0] * bins)
+        self.samples = array('I', [0] * bins)
+        self.learned_bins = 0
+        self.lap_ms = 0.0
+        self.default_lap_ms = default_lap_ms
+        self.track_meters = None
+        self.gaps = {}
+
+    def set_track_length(self, track_meters):
+        self.track_meters = track_meters
+
+    def learn(self, spline, current_lap_ms):
+        if not 0.0 <= spline < 1.0 or current_lap_ms <= 0:
+            return
+        index = int(spline * self.bins)
+        if self.samples[index] == 0:
+            self.reference[index] = current_lap_ms
+            self.learned_bins += 1
+        else:
+            # Smoothed, so one slow lap (traffic, a spin) does not bend the curve
+            self.reference[index] += 0.1 * (current_lap_ms - self.reference[index])
+        self.samples[index] += 1
+
+    def learn_lap(self, lap_ms):
+        if lap_ms <= 0:
+            return
+        self.lap_ms = lap_ms if self.lap_ms == 0 else self.lap_ms + 0.2 * (lap_ms - self.lap_ms)
+
+    def reference_lap_ms(self, average_kmh=None):
+        if self.lap_ms:
+            return self.lap_ms
+        if self.track_meters and average_kmh:
+            return self.track_meters / (average_kmh / 3.6) * 1000
+        return self.default_lap_ms
+
+    def curve(self, lap_ms):
+        # ms into the lap at the start of every bin; bins without samples are linear in spline
+        reference = self.reference
+        samples = self.samples
+        step = lap_ms / self.bins
+        curve = []
+        floor = 0.0
+        for i in range(self.bins):
+            # Noisy bins can come out below the one before; time never runs backwards round a lap
+            floor = min(max(floor, reference[i] if samples[i] else i * step), lap_ms)
+            curve.append(floor)
+        return curve
+
+    def compute(self, sorted_cars, average_kmh=None):
+        """
+        Returns carIndex -> (gap to leader ms, interval ms) for the whole field in one pass.
+        """
+        if not sorted_cars:
+            self.gaps = {}
+            return self.gaps
+
+        lap_ms = self.reference_lap_ms(average_kmh)
+        bins = self.bins
+        curve = self.curve(lap_ms) if self.learned_bins else None
+        step = lap_ms / bins
+
+        progress = []
+        for car in sorted_cars:
+            spline = car.get('splinePosition', 0.0)
+            position = spline * bins
+            index = min(int(position), bins - 1)
+            if curve is None:
+                lap_time = position * step
+            else:
+                # Linear interpolation between bin starts; the last bin runs to a full lap
+                start = curve[index]
+                end = curve[index + 1] if index + 1 < bins else lap_ms
+                lap_time = start + (end - start) * (position - index)
+            progress.append(car.get('laps', 0) * lap_ms + lap_time)
+
+        gaps = {}
+        ahead = progress[0]
+        gap = 0.0
+        for car, value in zip(sorted_cars, progress):
+            # The order comes from laps + spline; a car behind is never reported ahead in time
+            interval = max(0.0, ahead - value)
+            gap += interval
+            gaps[car['carIndex']] = (gap, interval)
+            ahead = value
+
+        self.gaps = gaps
+        return gaps
+
+    def format_gap(self, gap_ms):
+        lap_ms = self.reference_lap_ms()
+        if gap_ms >= lap_ms:
+            laps = int(gap_ms // lap_ms)
+            return f"+{laps} lap" if laps == 1 else f"+{laps} laps"
+        return f"+{gap_ms / 1000:.1f}s"
@@ -0,0 +1,228 @@
+import time
+import queue
+import threading
+from collections import deque
+
+from api_governor import admission
+
+ITEM, END, ERROR, ADMITTED = range(4)
+
+
+class Candidate:
+    """
+    One copy of a hedged request, iterating its producer on a thread of its own.
+    """
+
+    def __init__(self, index, produce, events, discard, governed=False):
+        self.index = index
+        self.cancelled = threading.Event()
+        self.started = time.monotonic()
+        # A governed copy is only sent while the governor has its attempt out, not while it waits
+        self.admitted_at = None if governed else self.started
+        self.first_at = None
+        self.on_late_first = None
+        self.discard = discard
+        self.governed = governed
+        self.events = events
+        self.thread = threading.Thread(target=self.run, args=(produce, events), daemon=True)
+        self.thread.start()
+
+    def on_admission(self, admitted):
+        self.admitted_at = time.monotonic() if admitted else None
+        self.events.put((self.index, ADMITTED, None))
+
+    def run(self, produce, events):
+        items = None
+        if self.governed:
+            admission.listener = self.on_admission
+        try:
+            items = produce()
+            for item in items:
+                if self.first_at is None:
+                    self.first_at = time.monotonic()
+                    if self.cancelled.is_set() and self.on_late_first is not None:
+                        self.on_late_first(self)
+                if self.cancelled.is_set():
+                    if self.discard is not None:
+                        self.discard(item)
+                    break
+                events.put((self.index, ITEM, item))
+            else:
+                events.put((self.index, END, None))
+        except Exception as e:
+            events.put((self.index, ERROR, e))
+        finally:
+            # Closing the generator leaves its with blocks, which closes the HTTP stream
+            if items is not None and hasattr(items, "close"):
+                items.close()
+            admission.listener = None
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+class Hedger:
+    """
+    Sends a second copy of a slow request and keeps whichever answers first.
+    """
+
+    def __init__(self, name, percentile=0.95, window=200, min_samples=20, min_delay_s=0.2, budget_per_minute=20,
+                 stall_timeout_s=None, governor=None):
+        self.name = name
+        self.percentile = percentile
+        self.latencies = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.min_delay_s = min_delay_s
+        self.budget_per_minute = budget_per_minute
+        self.stall_timeout_s = stall_timeout_s
+        # The hedge goes out after the percentile of recent time to first byte, counted from when the
+        # governor sends the request, and never while the provider is paused or at its limit
+        self.governor = governor
+        self.hedge_times = deque()
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "hedged": 0, "hedge_wins": 0, "over_budget": 0, "saturated": 0,
+                         "stalled": 0, "saved_s": 0.0}
+
+    def threshold(self):
+        with self.lock:
+            if len(self.latencies) < self.min_samples:
+                return None
+            ordered = sorted(self.latencies)
+        return max(self.min_delay_s, ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))])
+
+    def take_budget(self):
+        with self.lock:
+            now = time.monotonic()
+            while self.hedge_times and now - self.hedge_times[0] > 60:
+                self.hedge_times.popleft()
+            if len(self.hedge_times) >= self.budget_per_minute:
+                self.counters["over_budget"] += 1
+                return False
+            self.hedge_times.append(now)
+            self.counters["hedged"] += 1
+            return True
+
+    def call(self, func, discard=None):
+        """
+        Hedges a call that returns once its first byte is in, such as requests.post(stream=True).
+        """
+        stream = self.stream(lambda: iter([func()]), discard)
+        try:
+            return next(stream)
+        finally:
+            stream.close()
+
+    def stream(self, produce, discard=None):
+        """
+        Hedges a streamed call; produce() returns an iterator of chunks.
+        """
+        events = queue.Queue()
+        with self.lock:
+            self.counters["requests"] += 1
+        candidates = [Candidate(0, produce, events, discard, self.governor is not None)]
+        try:
+            yield from self.relay(candidates, produce, events, discard)
+        finally:
+            # The caller may stop early (call() takes one item); nothing should keep streaming for it
+            for candidate in candidates:
+                candidate.cancel()
+            self.drain(events, discard)
+
+    def relay(self, candidates, produce, events, discard):
+        threshold = self.threshold()
+        failed = {}
+        winner = None
+
+        while winner is None:
+            # Nothing times out for a copy still waiting on the governor
+            hedge_at = None
+            if threshold is not None and len(candidates) == 1 and candidates[0].admitted_at is not None:
+                hedge_at = candidates[0].admitted_at + threshold
+            deadline = hedge_at
+            sent = [candidate.admitted_at for candidate in candidates if candidate.admitted_at is not None]
+            if self.stall_timeout_s is not None and sent:
+                stall_deadline = max(sent) + self.stall_timeout_s
+                deadline = stall_deadline if deadline is None else min(deadline, stall_deadline)
+            try:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                index, kind, item = events.get(timeout=timeout)
+            except queue.Empty:
+                if hedge_at is not None:
+                    threshold = None
+                    if self.governor is not None and self.governor.saturated():
+                        with self.lock:
+                            self.counters["saturated"] += 1
+                    elif self.take_budget():
+                        candidates.append(Candidate(1, produce, events, discard, self.governor is not None))
+                    continue
+                with self.lock:
+                    self.counters["stalled"] += 1
+                raise TimeoutError(f"{self.name}: no response after {self.stall_timeout_s:.1f}s")
+
+            if kind == ADMITTED:
+                continue
+            if kind == ERROR:
+                failed[index] = item
+                if len(failed) == len(candidates):
+                    raise item
+                continue
+            winner = candidates[index]
+
+        self.record(winner, winner.first_at - (winner.admitted_at or winner.started), candidates)
+        while kind != END:
+            if kind == ERROR:
+                raise item
+            yield item
+            while True:
+                try:
+                    index, kind, item = events.get(timeout=self.stall_timeout_s)
+                except queue.Empty:
+                    with self.lock:
+                        self.counters["stalled"] += 1
+                    raise TimeoutError(f"{self.name}: stream stalled for {self.stall_timeout_s:.1f}s")
+                if index == winner.index and kind != ADMITTED:
+                    break
+                if kind == ITEM and discard is not None:
+                    discard(item)
+
+    def drain(self, events, discard):
+        while True:
+            try:
+                index, kind, item = events.get_nowait()
+            except queue.Empty:
+                return
+            if kind == ITEM and discard is not None:
+                discard(item)
+
+    def record(self, winner, first_byte, candidates):
+        # The first copy's time is only a lower bound when the hedge won; it still keeps the threshold honest
+        with self.lock:
+            self.latencies.append(first_byte)
+            if winner.index == 1:
+                self.counters["hedge_wins"] += 1
+        for candidate in candidates:
+            if candidate is not winner:
+                candidate.on_late_first = lambda loser, won_at=time.monotonic(): self.on_late_first(loser, won_at)
+                candidate.cancel()
+
+    def on_late_first(self, loser, won_at):
+        if loser.index == 0:
+            with self.lock:
+                self.counters["saved_s"] += max(0.0, loser.first_at - won_at)
+
+    @property
+    def stats(self):
+        threshold = self.threshold()
+        with self.lock:
+            requests = self.counters["requests"]
+            return {
+                **self.counters,
+                "saved_s": round(self.counters["saved_s"], 3),
+                "hedge_rate": round(self.counters["hedged"] / requests, 3) if requests else 0.0,
+                "threshold_s": None if threshold is None else round(threshold, 3),
+            }
+
+    def format_stats(self):
+        stats = self.stats
+        return (f"{self.name}: {stats['hedged']} hedged ({stats['hedge_rate']:.0%}), {stats['hedge_wins']} won, "
+                f"{stats['saved_s']:.1f}s saved, {stats['stalled']} stalled")
@@ -0,0 +1,120 @@
+from array import array
+
+# ACC fills missing lap and split times with INT32_MAX
+NO_TIME = 2 ** 31 - 1
+
+
+def format_lap_time(milliseconds):
+    minutes, milliseconds = divmod(int(milliseconds), 60000)
+    return f"{minutes}:{milliseconds / 1000:06.3f}"
+
+
+def is_time(milliseconds):
+    return milliseconds is not None and 0 < milliseconds < NO_TIME
+
+
+class LapTiming:
+    """
+    Session, personal and sector bests, updated one completed lap at a time.
+    """
+
+    def __init__(self, history_laps=20, sectors=3, pace_window=5, pace_drop_factor=1.03):
+        self.history_laps = history_laps
+        self.sectors = sectors
+        self.pace_window = pace_window
+        self.pace_drop_factor = pace_drop_factor
+        self.lap_counts = {}
+        self.histories = {}
+        self.completed = {}
+        self.dropping = set()
+        self.personal_bests = {}
+        self.session_best = None
+        self.session_best_car = None
+        self.sector_bests = [None] * sectors
+        self.sector_best_cars = [None] * sectors
+
+    def update(self, car):
+        # Returns ("fastest_lap", carIndex, ms), ("purple_sector", carIndex, sector, ms) and
+        # ("pace_drop", carIndex, ms, average ms) tuples for a lap that just completed.
+        previous = self.lap_counts.get(car.carIndex)
+        if previous == car.laps:
+            return []
+        self.lap_counts[car.carIndex] = car.laps
+        # The first packet only sets the counter; the lap before it is not ours to time
+        if previous is None or car.laps < previous:
+            return []
+        return self.complete_lap(car.carIndex, car.lastLap)
+
+    def complete_lap(self, car_index, lap):
+        events = []
+        valid = is_time(lap.lapTimeMs) and not lap.isInvalid
+        self.record(car_index, lap.lapTimeMs if valid else 0)
+        if not valid:
+            return events
+
+        if lap.isValidForBest:
+            best = self.personal_bests.get(car_index)
+            if best is None or lap.lapTimeMs < best:
+                self.personal_bests[car_index] = lap.lapTimeMs
+            if self.session_best is None or lap.lapTimeMs < self.session_best:
+                # The first lap of the session only sets the reference
+                if self.session_best is not None:
+                    events.append(("fastest_lap", car_index, lap.lapTimeMs))
+                self.session_best = lap.lapTimeMs
+                self.session_best_car = car_index
+
+            for sector, split in enumerate(lap.splits[:self.sectors]):
+                if not is_time(split):
+                    continue
+                if self.sector_bests[sector] is None or split < self.sector_bests[sector]:
+                    # A fastest lap already tells the story of its sectors
+                    if self.sector_bests[sector] is not None and not events:
+                        events.append(("purple_sector", car_index, sector, split))
+                    self.sector_bests[sector] = split
+                    self.sector_best_cars[sector] = car_index
+
+        if not (lap.isOutlap or lap.isInlap):
+            average = self.average_pace(car_index, skip_last=True)
+            if average and lap.lapTimeMs > average * self.pace_drop_factor:
+                if car_index not in self.dropping:
+                    self.dropping.add(car_index)
+                    events.append(("pace_drop", car_index, lap.lapTimeMs, average))
+            else:
+                self.dropping.discard(car_index)
+        return events
+
+    def record(self, car_index, lap_ms):
+        history = self.histories.get(car_index)
+        if history is None:
+            history = self.histories[car_index] = array('i', [0] * self.history_laps)
+            self.completed[car_index] = 0
+        history[self.completed[car_index] % self.history_laps] = lap_ms
+        self.completed[car_index] += 1
+
+    def forget(self, car_index):
+        # A car that left the session; its laps stay in the session and sector bests
+        self.lap_counts.pop(car_index, None)
+        self.histories.pop(car_index, None)
+        self.completed.pop(car_index, None)
+        self.personal_bests.pop(car_index, None)
+        self.dropping.discard(car_index)
+
+    def lap_history(self, car_index):
+        # Oldest first, 0 for invalid laps
+        history = self.histories.get(car_index)
+        if history is None:
+            return []
+        count = self.completed[car_index]
+        if count <= self.history_laps:
+            return list(history[:count])
+        start = count % self.history_laps
+        return list(history[start:]) + list(history[:start])
+
+    def average_pace(self, car_index, skip_last=False):
+        laps = self.lap_history(car_index)
+        if skip_last:
+            laps = laps[:-1]
+        laps = [lap for lap in laps[-self.pace_window:] if lap]
+        if len(laps) < 3:
+            return None
+        return sum(laps) / len(laps)
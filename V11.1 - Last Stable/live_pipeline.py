@@ -0,0 +1,294 @@
+import os
+import time
+import queue
+import heapq
+import threading
+
+from commentary_streamer import StreamingCommentator
+from event_store import EventWriter, events_path
+from hedging import Hedger
+from metrics import METRICS, QUEUE_DEPTH
+
+# Event importance, most important first
+FINISH, ACCIDENT, LEAD_CHANGE, RACE_CONTROL, OVERTAKE, PIT, POSITIONS = range(7)
+
+# How long after it happened (in session time) an event is still worth voicing
+EVENT_BUDGET_MS = {
+    FINISH: 60000,
+    ACCIDENT: 20000,
+    LEAD_CHANGE: 15000,
+    RACE_CONTROL: 15000,
+    OVERTAKE: 10000,
+    PIT: 10000,
+    POSITIONS: 20000,
+}
+
+
+EVENT_TYPE_PRIORITY = {
+    "finish": FINISH,
+    "result": FINISH,
+    "accident": ACCIDENT,
+    "overtake": OVERTAKE,
+    "class_leader": LEAD_CHANGE,
+    "battle": OVERTAKE,
+    "fastest_lap": OVERTAKE,
+    "purple_sector": POSITIONS,
+    "pace_drop": PIT,
+    "pit_entry": PIT,
+    "pit_exit": PIT,
+    "positions": POSITIONS,
+}
+
+
+def classify_event(text, event_type=None, payload=None):
+    if event_type is not None and event_type != "info":
+        if event_type == "overtake" and payload and payload.get("position") == 1:
+            return LEAD_CHANGE
+        return EVENT_TYPE_PRIORITY.get(event_type, RACE_CONTROL)
+
+    # Events without a type (older collectors) are classified by their wording
+    if text.startswith("Checkered flag!") or "has finished in position" in text:
+        return FINISH
+    if text.startswith("Accident") or text.startswith("Multi-car incident"):
+        return ACCIDENT
+    if text.startswith("Overtake!") or text.startswith("Class overtake!"):
+        return LEAD_CHANGE if text.endswith("for position 1.") else OVERTAKE
+    if text.endswith("the pits."):
+        return PIT
+    if text.startswith("Current positions"):
+        return POSITIONS
+    return RACE_CONTROL
+
+
+class LiveEvent:
+    __slots__ = ("session_time_ms", "text", "received_at", "priority", "deadline_ms")
+
+    def __init__(self, session_time_ms, text, received_at, event_type=None, payload=None):
+        self.session_time_ms = session_time_ms
+        self.text = text
+        self.received_at = received_at
+        self.priority = classify_event(text, event_type, payload)
+        self.deadline_ms = session_time_ms + EVENT_BUDGET_MS[self.priority]
+
+    def __lt__(self, other):
+        return (self.priority, self.deadline_ms) < (other.priority, other.deadline_ms)
+
+
+class LivePipeline(StreamingCommentator):
+    def __init__(self, collector, api_key, xi_api_key, max_merge=4, stats_interval=30, hedging=False,
+                 stall_timeout=10.0):
+        super().__init__(None, api_key, xi_api_key)
+        self.collector = collector
+        self.event_queue = queue.Queue()
+        collector.live_queue = self.event_queue
+        self.pending = []
+        self.max_merge = max_merge
+        self.stats_interval = stats_interval
+        self.running = False
+
+        # Seconds from picking an event up to its first audio, smoothed; used to predict staleness
+        self.expected_voice_time = 3.0
+        self.dequeued_at = {}
+        self.events_dropped = 0
+        self.events_merged = 0
+        self.events_voiced = 0
+        self.segments_skipped = 0
+        self.stage_lag = {"queue": 0.0, "commentary": 0.0, "audio": 0.0}
+
+        # A call that stops answering costs its own segment or sentence, never the rest of the session
+        self.client = self.client.with_options(timeout=stall_timeout)
+        self.voice.timeout = (3.05, stall_timeout)
+        self.llm_hedger = None
+        self.tts_hedger = None
+        if hedging:
+            self.llm_hedger = Hedger("llm", stall_timeout_s=stall_timeout,
+                                     governor=self.governor.provider("anthropic"))
+            self.tts_hedger = Hedger("tts", stall_timeout_s=stall_timeout,
+                                     governor=self.voice.governor.provider("elevenlabs"))
+
+    def run(self):
+        self.running = True
+        self.output_signal.emit("Starting live commentary...")
+
+        tts_thread = threading.Thread(target=self.speak_sentences, daemon=True)
+        METRICS.add_collector(self.collect_metrics)
+
+        try:
+            os.makedirs(self.voice.output_dir, exist_ok=True)
+            tts_thread.start()
+
+            messages = []
+            race_history = self.new_race_history()
+            last_stats = time.perf_counter()
+
+            while self.running:
+                self.drain_queue(timeout=0.2)
+                self.drop_stale_events()
+
+                if time.perf_counter() - last_stats >= self.stats_interval:
+                    self.output_signal.emit(self.format_stats())
+                    last_stats = time.perf_counter()
+
+                events = self.next_events()
+                if not events:
+                    continue
+
+                dequeued_at = time.perf_counter()
+                first = events[0]
+                timecode = self.collector.format_session_time(first.session_time_ms)
+                event_data = " ".join(event.text for event in events)
+                self.stage_lag["queue"] = dequeued_at - first.received_at
+
+                self.dequeued_at[self.events_streamed] = dequeued_at
+                try:
+                    commentary = self.stream_event(messages, timecode, event_data, race_history, first.received_at)
+                except Exception as e:
+                    self.skip_segment(messages, timecode, events, e)
+                    continue
+                self.stage_lag["commentary"] = time.perf_counter() - dequeued_at
+
+                self.write_commentary(timecode, commentary, first.session_time_ms)
+                race_history += f"{timecode} - {event_data}\n"
+                self.events_voiced += len(events)
+
+            self.close_event_writer()
+            self.sentence_queue.put(None)
+            tts_thread.join()
+            self.output_signal.emit("Live commentary stopped. " + self.format_stats())
+
+        except Exception as e:
+            self.sentence_queue.put(None)
+            self.output_signal.emit(f"An error occurred: {str(e)}")
+        finally:
+            self.close_event_writer()
+            METRICS.remove_collector(self.collect_metrics)
+
+    def stop(self):
+        self.running = False
+
+    def skip_segment(self, messages, timecode, events, error):
+        # The question goes unanswered, so it is taken back to keep the conversation alternating
+        if messages and messages[-1]["role"] == "user":
+            messages.pop()
+        self.segments_skipped += 1
+        self.events_dropped += len(events)
+        self.output_signal.emit(f"{timecode} - commentary skipped: {error}")
+
+    def stream_ai_commentary(self, messages, event_data, race_history):
+        if self.llm_hedger is None:
+            yield from super().stream_ai_commentary(messages, event_data, race_history)
+            return
+
+        context = self.build_context(event_data, race_history)
+        messages.append({"role": "user", "content": context})
+        request = list(messages)
+
+        parts = []
+        for text in self.llm_hedger.stream(lambda: self.commentary_stream(request)):
+            parts.append(text)
+            yield text
+
+        self.add_reply(messages, "".join(parts))
+
+    def request_sentence_audio(self, sentence, previous_text):
+        if self.tts_hedger is None:
+            return super().request_sentence_audio(sentence, previous_text)
+        return self.tts_hedger.call(lambda: self.voice.request_audio(sentence, previous_text),
+                                    discard=lambda response: response.close())
+
+    def drain_queue(self, timeout):
+        try:
+            item = self.event_queue.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while True:
+            heapq.heappush(self.pending, LiveEvent(*item))
+            try:
+                item = self.event_queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def is_stale(self, event):
+        now_ms = self.collector.session_time_ms
+        return now_ms + self.expected_voice_time * 1000 > event.deadline_ms
+
+    def drop_stale_events(self):
+        fresh = [event for event in self.pending if not self.is_stale(event)]
+        if len(fresh) != len(self.pending):
+            self.events_dropped += len(self.pending) - len(fresh)
+            heapq.heapify(fresh)
+            self.pending = fresh
+
+    def next_events(self):
+        if not self.pending:
+            return []
+
+        # Voice the most important event, folding in other waiting events of the same kind
+        events = [heapq.heappop(self.pending)]
+        same_kind = [event for event in self.pending if event.priority == events[0].priority]
+        same_kind.sort(key=lambda event: event.session_time_ms)
+        for event in same_kind[:self.max_merge - 1]:
+            self.pending.remove(event)
+            events.append(event)
+        if len(events) > 1:
+            heapq.heapify(self.pending)
+            self.events_merged += len(events) - 1
+        return events
+
+    def resolve_output_path(self):
+        collector_file = self.collector.get_output_file_path()
+        if collector_file:
+            self.input_path = collector_file
+            self.output_path = self.create_output_file()
+            self.event_writer = EventWriter(events_path(self.output_path))
+
+    def write_commentary(self, timecode, commentary, session_ms=None):
+        if self.output_path is None:
+            self.resolve_output_path()
+        if self.output_path is None:
+            self.output_signal.emit(f"{timecode} - {commentary}")
+            return
+        super().write_commentary(timecode, commentary, session_ms)
+
+    def on_first_audio(self, event_id, timecode, latency):
+        super().on_first_audio(event_id, timecode, latency)
+        self.stage_lag["audio"] = latency
+        dequeued_at = self.dequeued_at.pop(event_id, None)
+        # Sentences are voiced in order, so earlier events that never got audio never will
+        for stale in [key for key in self.dequeued_at if key < event_id]:
+            del self.dequeued_at[stale]
+        if dequeued_at is not None:
+            voice_time = time.perf_counter() - dequeued_at
+            self.expected_voice_time = 0.8 * self.expected_voice_time + 0.2 * voice_time
+
+    def stats(self):
+        return {
+            "incoming": self.event_queue.qsize(),
+            "pending": len(self.pending),
+            "sentences": self.sentence_queue.qsize(),
+            "voiced": self.events_voiced,
+            "merged": self.events_merged,
+            "dropped": self.events_dropped,
+            "expected_voice_time": self.expected_voice_time,
+            "skipped": self.segments_skipped,
+            "lag": dict(self.stage_lag),
+            "api": self.governor.stats,
+            "hedging": {hedger.name: hedger.stats for hedger in (self.llm_hedger, self.tts_hedger) if hedger},
+        }
+
+    def collect_metrics(self):
+        QUEUE_DEPTH.set(len(self.pending), "live_pending")
+        QUEUE_DEPTH.set(self.sentence_queue.qsize(), "sentences")
+
+    def format_stats(self):
+        stats = self.stats()
+        lag = stats["lag"]
+        text = (f"Live: {stats['incoming']} incoming, {stats['pending']} pending, {stats['sentences']} sentences queued, "
+                f"{stats['voiced']} voiced, {stats['merged']} merged, {stats['dropped']} dropped, "
+                f"{stats['skipped']} skipped. "
+                f"Lag: queue {lag['queue']:.1f}s, commentary {lag['commentary']:.1f}s, audio {lag['audio']:.1f}s. "
+                f"API: {self.governor.format_stats() or 'idle'}")
+        hedgers = [hedger.format_stats() for hedger in (self.llm_hedger, self.tts_hedger) if hedger]
+        if hedgers:
+            text += f". Hedging: {'; '.join(hedgers)}"
+        return text
@@ -0,0 +1,328 @@
+import os
+import json
+import time
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds, from a fast packet decode up to a slow LLM call
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, help, labels=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def samples(self):
+        with self.lock:
+            return sorted(self.values.items())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, *labels):
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            state = self.values.get(labels)
+            if state is None:
+                # Per-bucket counts (not cumulative), then the sum and the count
+                state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, *labels):
+        return Timer(self, labels) if self.registry.enabled else NULL_TIMER
+
+    def samples(self):
+        with self.lock:
+            return sorted((labels, ([*counts], total, count)) for labels, (counts, total, count) in self.values.items())
+
+
+class Registry:
+    """
+    Counters, gauges and histograms shared by every stage, exported as Prometheus text or JSON.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.metrics = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(self, name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(self, name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(self, name, help, labels, buckets))
+
+    def add_collector(self, callback):
+        with self.lock:
+            self.collectors.append(callback)
+
+    def remove_collector(self, callback):
+        with self.lock:
+            if callback in self.collectors:
+                self.collectors.remove(callback)
+
+    def collect(self):
+        with self.lock:
+            collectors = list(self.collectors)
+            metrics = list(self.metrics.values())
+        for callback in collectors:
+            try:
+                callback()
+            except Exception:
+                pass  # A collector for something already gone must not break the export
+        return metrics
+
+    def to_prometheus(self):
+        lines = []
+        for metric in self.collect():
+            samples = metric.samples()
+            if not samples:
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for labels, value in samples:
+                pairs = [f'{name}="{escape_label(label)}"' for name, label in zip(metric.label_names, labels)]
+                if metric.kind != "histogram":
+                    lines.append(f"{metric.name}{format_labels(pairs)} {format_value(value)}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(metric.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else format_value(bound)
+                    bucket_pairs = pairs + ['le="' + le + '"']
+                    lines.append(f"{metric.name}_bucket{format_labels(bucket_pairs)} {cumulative}")
+                lines.append(f"{metric.name}_sum{format_labels(pairs)} {format_value(total)}")
+                lines.append(f"{metric.name}_count{format_labels(pairs)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self):
+        snapshot = {"timestamp": time.time(), "metrics": {}}
+        for metric in self.collect():
+            samples = []
+            for labels, value in metric.samples():
+                sample = {"labels": dict(zip(metric.label_names, labels))}
+                if metric.kind == "histogram":
+                    counts, total, count = value
+                    sample.update(count=count, sum=total, buckets=dict(zip(
+                        [str(bound) for bound in metric.buckets] + ["+Inf"], counts)))
+                else:
+                    sample["value"] = value
+                samples.append(sample)
+            if samples:
+                snapshot["metrics"][metric.name] = {"type": metric.kind, "help": metric.help, "samples": samples}
+        return snapshot
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(pairs):
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        registry = self.server.registry
+        if self.path in ("/", "/metrics"):
+            body = registry.to_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path == "/metrics.json":
+            body = json.dumps(registry.to_dict()).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsServer:
+    """
+    Serves /metrics (Prometheus text) and /metrics.json on a local port, enabling the registry.
+    """
+
+    def __init__(self, registry, port=9464, host="127.0.0.1"):
+        registry.enabled = True
+        self.httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.registry = registry
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class SnapshotWriter:
+    """
+    Writes the registry as JSON to path every interval seconds, replacing the file atomically.
+    """
+
+    def __init__(self, registry, path, interval=10.0):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def write(self):
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(self.registry.to_dict(), f)
+        os.replace(temporary, self.path)
+
+    def stop(self):
+        self.stopped.set()
+        self.write()
+
+
+def timed_receive_methods(receive_methods):
+    """
+    Wraps an AccClient's receive methods to count and time each message type; only done when enabled.
+    """
+    def timed(method, name):
+        def receive():
+            start = time.perf_counter()
+            method()
+            PACKET_SECONDS.observe(time.perf_counter() - start, name)
+            PACKETS_DECODED.inc(1, name)
+        return receive
+
+    # _receive_realtime_car_update -> realtime_car_update
+    return {message_type: timed(method, method.__name__.replace("_receive_", "", 1))
+            for message_type, method in receive_methods.items()}
+
+
+def timed_handler(handler, name):
+    def handle(event):
+        start = time.perf_counter()
+        handler(event)
+        HANDLER_SECONDS.observe(time.perf_counter() - start, name)
+    return handle
+
+
+METRICS = Registry(enabled=os.environ.get("COMMENTATOR_METRICS") == "1")
+
+PACKETS_RECEIVED = METRICS.gauge("acc_packets_received", "Datagrams read from the broadcasting socket")
+PACKETS_DROPPED = METRICS.gauge("acc_packets_dropped", "Datagrams dropped or coalesced by the receive ring",
+                                ("reason",))
+PACKETS_DECODED = METRICS.counter("acc_packets_decoded_total", "Messages decoded, by type", ("type",))
+PACKET_SECONDS = METRICS.histogram("acc_packet_seconds", "Decode and dispatch time per message", ("type",))
+HANDLER_SECONDS = METRICS.histogram("collector_handler_seconds", "DataCollector callback time per message",
+                                    ("handler",))
+TICK_SECONDS = METRICS.histogram("collector_tick_seconds", "Time per update_race_data stage", ("stage",))
+EVENTS = METRICS.counter("collector_events_total", "Race events logged, by type", ("type",))
+LOG_WRITE_SECONDS = METRICS.histogram("collector_log_write_seconds", "Time to append one event to the race log")
+QUEUE_DEPTH = METRICS.gauge("queue_depth", "Items waiting in a queue", ("queue",))
+LLM_FIRST_TOKEN_SECONDS = METRICS.histogram("llm_first_token_seconds", "Time to the first streamed token",
+                                            ("stage",))
+LLM_SECONDS = METRICS.histogram("llm_request_seconds", "Total time of an LLM request", ("stage",))
+LLM_TOKENS = METRICS.counter("llm_tokens_total", "Tokens reported by the API", ("stage", "direction"))
+TTS_FIRST_BYTE_SECONDS = METRICS.histogram("tts_first_byte_seconds", "Time until TTS response headers arrive")
+TTS_BYTES = METRICS.counter("tts_audio_bytes_total", "Audio bytes received from TTS")
+API_GAUGE = METRICS.gauge("api_governor", "Outbound API governor state", ("provider", "field"))
+
+
+def record_usage(stage, usage):
+    if usage is None or not METRICS.enabled:
+        return
+    LLM_TOKENS.inc(getattr(usage, "input_tokens", 0) or 0, stage, "in")
+    LLM_TOKENS.inc(getattr(usage, "output_tokens", 0) or 0, stage, "out")
@@ -0,0 +1,267 @@
+import io
+import os
+import sys
+import time
+import signal
+import pstats
+import cProfile
+import threading
+import tracemalloc
+import weakref
+import socketserver
+from collections import Counter
+from datetime import datetime
+
+DEFAULT_WINDOW_S = 30
+SAMPLE_INTERVAL_S = 0.005
+CONTROL_FILE = "profile.request"
+USAGE = "commands: sample [seconds], cprofile [seconds], memory, memory stop, status"
+SIGNAL_COMMANDS = {"SIGUSR1": "sample", "SIGUSR2": "memory"}
+
+# Signal handlers are process-wide: they are installed once and send to whichever profiler asked last
+signal_target = None
+
+
+class Profiler:
+    """
+    Profiles a running collector on request: stack samples, cProfile and tracemalloc snapshots.
+    """
+
+    def __init__(self, prefix, threads, emit=print, window_s=DEFAULT_WINDOW_S, sample_interval_s=SAMPLE_INTERVAL_S,
+                 traceback_frames=10):
+        self.prefix = prefix
+        # threads() -> {name: (ident, run_in_thread)}; run_in_thread is None for threads that can only be sampled
+        self.threads = threads
+        self.emit = emit
+        self.window_s = window_s
+        self.sample_interval_s = sample_interval_s
+        self.traceback_frames = traceback_frames
+        self.lock = threading.Lock()
+        self.active = None
+        self.previous_snapshot = None
+        self.server = None
+
+    def command(self, line):
+        """
+        Runs one command line and returns a one-line reply.
+        """
+        words = line.split()
+        if not words:
+            words = ["sample"]
+        name, args = words[0].lower(), words[1:]
+        try:
+            if name in ("sample", "cprofile"):
+                seconds = float(args[0]) if args else self.window_s
+                return self.start(name, seconds)
+            if name == "memory":
+                if args and args[0] == "stop":
+                    return self.stop_memory()
+                return self.snapshot_memory()
+            if name == "status":
+                return self.status()
+        except Exception as e:
+            return f"error: {e}"
+        return f"unknown command {name!r}; {USAGE}"
+
+    def output_path(self, kind):
+        return f"{self.prefix()}_{kind}_{datetime.now().strftime('%H-%M-%S')}"
+
+    def start(self, kind, seconds):
+        with self.lock:
+            if self.active is not None:
+                return f"busy: {self.active} is still running"
+            self.active = kind
+        path = self.output_path(kind)
+        target = self.sample if kind == "sample" else self.profile
+        threading.Thread(target=self.finish, args=(target, path, seconds), daemon=True).start()
+        return f"{kind} for {seconds:g}s, writing {path}.txt"
+
+    def finish(self, target, path, seconds):
+        try:
+            target(path, seconds)
+        except Exception as e:
+            self.emit(f"Profiling failed: {e}")
+        finally:
+            with self.lock:
+                self.active = None
+
+    def status(self):
+        tracing = "tracemalloc on" if tracemalloc.is_tracing() else "tracemalloc off"
+        return f"{self.active or 'idle'}, {tracing}, threads: {', '.join(self.threads()) or 'none'}"
+
+    def sample(self, path, seconds):
+        # sys._current_frames reads the other threads from here, so the profiled code pays nothing
+        idents = {name: ident for name, (ident, _) in self.threads().items()}
+        counts = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frames = sys._current_frames()
+            for name, ident in idents.items():
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if stack:
+                    counts[";".join([name] + stack[::-1])] += 1
+            samples += 1
+            time.sleep(self.sample_interval_s)
+
+        with open(path + ".txt", "w", encoding="utf-8") as f:
+            for stack, count in counts.most_common():
+                f.write(f"{stack} {count}\n")
+        leaves = Counter()
+        for stack, count in counts.items():
+            leaves[stack.split(";", 1)[0] + " " + stack.rsplit(";", 1)[-1]] += count
+        top = ", ".join(f"{leaf} {count / samples:.0%}" for leaf, count in leaves.most_common(3))
+        self.emit(f"Stack samples ({samples} over {seconds:g}s) written to {path}.txt; busiest: {top}")
+
+    def profile(self, path, seconds):
+        profiles = {}
+        done = threading.Semaphore(0)
+        targets = {name: run for name, (_, run) in self.threads().items() if run is not None}
+        if sys.version_info >= (3, 12):
+            # cProfile is process-wide since 3.12: one profile, enabled on any thread, sees them all
+            targets = dict(list(targets.items())[:1])
+
+        def begin(name):
+            profile = cProfile.Profile()
+            profiles[name] = profile
+            profile.enable()
+
+        def end(name):
+            try:
+                if name in profiles:
+                    profiles[name].disable()
+            finally:
+                done.release()
+
+        for name, run in targets.items():
+            run(lambda name=name: begin(name))
+        time.sleep(seconds)
+        for name, run in targets.items():
+            run(lambda name=name: end(name))
+        # A thread that stopped in the meantime never runs its end call
+        for _ in targets:
+            if not done.acquire(timeout=5):
+                break
+
+        written = []
+        for name, profile in profiles.items():
+            thread_path = f"{path}_{name}"
+            profile.dump_stats(thread_path + ".prof")
+            report = io.StringIO()
+            pstats.Stats(profile, stream=report).sort_stats("cumulative").print_stats(40)
+            with open(thread_path + ".txt", "w", encoding="utf-8") as f:
+                f.write(report.getvalue())
+            written.append(thread_path + ".prof")
+        self.emit(f"cProfile over {seconds:g}s written to {', '.join(written) or 'nothing (no thread ran it)'}")
+
+    def snapshot_memory(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.traceback_frames)
+            self.previous_snapshot = self.take_snapshot()
+            return "tracemalloc started; the next memory command shows growth since now"
+
+        snapshot = self.take_snapshot()
+        path = self.output_path("memory")
+        snapshot.dump(path + ".tracemalloc")
+        current, peak = tracemalloc.get_traced_memory()
+        with open(path + ".txt", "w", encoding="utf-8") as f:
+            f.write(f"Traced: {current / 1e6:.1f} MB now, {peak / 1e6:.1f} MB peak\n\nGrowth since the last snapshot:\n")
+            for stat in snapshot.compare_to(self.previous_snapshot, "lineno")[:30]:
+                f.write(f"{stat}\n")
+            f.write("\nLargest allocations:\n")
+            for stat in snapshot.statistics("traceback")[:10]:
+                f.write(f"{stat}\n")
+                for line in stat.traceback.format():
+                    f.write(f"    {line}\n")
+        self.previous_snapshot = snapshot
+        self.emit(f"Memory snapshot ({current / 1e6:.1f} MB traced) written to {path}.txt")
+        return f"written to {path}.txt"
+
+    def stop_memory(self):
+        tracemalloc.stop()
+        self.previous_snapshot = None
+        return "tracemalloc stopped"
+
+    def take_snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ])
+
+    def poll_control_file(self, directory):
+        """
+        Runs the command in directory/profile.request (sample if it is empty) and removes the file.
+        """
+        path = os.path.join(directory, CONTROL_FILE)
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, encoding="utf-8") as f:
+                line = f.read().strip()
+            os.remove(path)
+        except OSError:
+            return
+        self.emit(f"Profiler: {self.command(line)}")
+
+    def install_signal_handlers(self):
+        """
+        Opt-in, from the main thread: SIGUSR1 and SIGUSR2 go to this profiler.
+        """
+        # The handlers are installed once per process; later calls only redirect them, and the
+        # profiler is held weakly so they never keep a collector alive
+        global signal_target
+        if not hasattr(signal, "SIGUSR1"):
+            return False
+        if signal_target is None:
+            try:
+                for name in SIGNAL_COMMANDS:
+                    signal.signal(getattr(signal, name), on_signal)
+            except ValueError:
+                return False
+        signal_target = weakref.ref(self)
+        return True
+
+    def run_signal_command(self, line):
+        self.emit(f"Profiler: {self.command(line)}")
+
+    def serve(self, port, host="127.0.0.1"):
+        self.server = ControlServer((host, port), ControlHandler)
+        self.server.profiler = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server.server_address[1]
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def on_signal(signum, frame):
+    profiler = signal_target() if signal_target is not None else None
+    if profiler is None:
+        return
+    # The work happens on a thread of its own, not inside the handler
+    line = SIGNAL_COMMANDS[signal.Signals(signum).name]
+    threading.Thread(target=profiler.run_signal_command, args=(line,), daemon=True).start()
+
+
+class ControlServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ControlHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for raw in self.rfile:
+            line = raw.decode("utf-8", errors="replace").strip()
+            if line in ("quit", "exit"):
+                return
+            if not line:
+                continue
+            self.wfile.write((self.server.profiler.command(line) + "\n").encode("utf-8"))
@@ -1,19 +1,106 @@
 import os
 import re
 import time
+from collections import Counter, deque
 from PyQt5.QtCore import QThread, pyqtSignal
 import anthropic
 
+from api_governor import GOVERNOR, estimate_tokens
+from event_store import EventWriter, RaceEvent, events_path, open_events
+from metrics import LLM_FIRST_TOKEN_SECONDS, LLM_SECONDS, METRICS, record_usage
+from race_index import session_name
+from race_log_codec import RaceLogCodec
+
+OVERTAKER_PATTERN = re.compile(r"([A-Z][\w'-]+ [A-Z][\w'-]+) overtook ")
+PIT_ENTRY_PATTERN = re.compile(r"([A-Z][\w'-]+ [A-Z][\w'-]+) has entered the pits")
+
+
+class RaceHistory:
+    """
+    Race history of bounded size: older lines are folded into a rolling summary.
+    """
+
+    def __init__(self, keep_lines=150):
+        # Drop-in for the history string: `history += line` appends, str(history) is the prompt text
+        self.recent = deque(maxlen=keep_lines)
+        self.folded = 0
+        self.first_timecode = None
+        self.last_timecode = None
+        self.kinds = Counter()
+        self.overtakers = Counter()
+        self.pit_stops = Counter()
+        self.standings = None
+        self.summary_text = None
+
+    def __iadd__(self, text):
+        for line in text.splitlines():
+            if len(self.recent) == self.recent.maxlen:
+                self.fold(self.recent[0])
+            self.recent.append(line)
+        return self
+
+    def fold(self, line):
+        timecode, _, text = line.partition(" - ")
+        if self.first_timecode is None:
+            self.first_timecode = timecode
+        self.last_timecode = timecode
+        self.folded += 1
+        self.summary_text = None
+        self.overtakers.update(OVERTAKER_PATTERN.findall(text))
+        self.pit_stops.update(PIT_ENTRY_PATTERN.findall(text))
+        self.kinds["overtakes"] += text.count(" overtook ")
+        self.kinds["pit stops"] += text.count(" entered the pits")
+        self.kinds["incidents"] += text.count("Accident involving") + text.count("incident at")
+        if "Current positions" in text:
+            self.standings = text[text.index("Current positions"):]
+
+    def summary(self):
+        if not self.folded:
+            return ""
+        if self.summary_text is None:
+            self.summary_text = self.build_summary()
+        return self.summary_text
+
+    def build_summary(self):
+        counts = ", ".join(f"{count} {kind}" for kind, count in self.kinds.items() if count)
+        summary = f"Summary of {self.first_timecode} to {self.last_timecode} ({self.folded} events"
+        summary += f": {counts})." if counts else ")."
+        if self.overtakers:
+            summary += " Most overtakes: " + ", ".join(f"{name} ({count})"
+                                                       for name, count in self.overtakers.most_common(3)) + "."
+        if self.pit_stops:
+            summary += " Most pit stops: " + ", ".join(f"{name} ({count})"
+                                                       for name, count in self.pit_stops.most_common(3)) + "."
+        if self.standings:
+            summary += f" Standings then: {self.standings}"
+        return summary + "\n"
+
+    def __str__(self):
+        recent = "".join(line + "\n" for line in self.recent)
+        return self.summary() + recent
+
+
 class RaceCommentator(QThread):
     output_signal = pyqtSignal(str)
     progress_signal = pyqtSignal(int)
 
-    def __init__(self, input_path, api_key):
+    def __init__(self, input_path, api_key, base_url=None):
         super().__init__()
         self.input_path = input_path
         self.output_path = None
-        self.client = anthropic.Anthropic(api_key=api_key)
+        # base_url=None keeps the SDK default, which honours ANTHROPIC_BASE_URL (e.g. stub_server.py)
+        self.client = anthropic.Anthropic(api_key=api_key, base_url=base_url, max_retries=0)
+        self.governor = GOVERNOR
         self.system_prompt = self.load_prompt("race_commentator_prompt.txt")
+        self.compact_encoding = False
+        self.codec = None
+        self.event_writer = None
+        # Optional RaceIndex; when set, prompts get the background of drivers in the current event
+        self.race_index = None
+        # Endurance mode keeps the conversation and the race history bounded for 24 hour sessions
+        self.endurance = False
+        self.max_messages = 20
+        self.history_lines = 150
 
     def run(self):
         self.output_signal.emit("Starting race commentary generation...")
@@ -21,35 +108,39 @@ class RaceCommentator(QThread):
 
         try:
             messages = []
-            race_history = ""
-            total_events = self.count_events()
+            race_history = self.new_race_history()
+            events = open_events(self.input_path)
             processed_events = 0
+            if self.compact_encoding:
+                self.setup_compact_encoding(events)
 
-            with open(self.input_path, 'r') as input_file:
-                self.output_path = self.create_output_file()
+            self.output_path = self.create_output_file()
+            self.event_writer = EventWriter(events_path(self.output_path))
 
-                for line in input_file:
-                    match = re.match(r'(\d{2}:\d{2}:\d{2}) - (.+)', line.strip())
-                    if match:
-                        timecode, event_data = match.groups()
-                        commentary = self.get_ai_commentary(messages, event_data, race_history)
+            for event in events:
+                timecode = event.timecode
+                event_data = self.encode_event(event.text)
+                commentary = self.decode_commentary(self.get_ai_commentary(messages, event_data, race_history))
 
-                        self.write_commentary(timecode, commentary)
-                        race_history += f"{timecode} - {event_data}\n"
+                self.write_commentary(timecode, commentary, event.session_ms)
+                race_history += f"{timecode} - {event_data}\n"
 
-                        processed_events += 1
-                        progress = int((processed_events / total_events) * 100)
-                        self.progress_signal.emit(progress)
+                processed_events += 1
+                self.progress_signal.emit(events.progress(processed_events))
 
+            self.close_event_writer()
             self.output_signal.emit(f"Commentary generation complete. Output saved to {self.output_path}")
             self.progress_signal.emit(100)
 
         except Exception as e:
             self.output_signal.emit(f"An error occurred: {str(e)}")
+        finally:
+            self.close_event_writer()
 
-    def count_events(self):
-        with open(self.input_path, 'r') as file:
-            return sum(1 for line in file if re.match(r'\d{2}:\d{2}:\d{2} - ', line))
+    def close_event_writer(self):
+        # Also called when a run fails, so the events written so far are left with a final count
+        if self.event_writer is not None:
+            self.event_writer.close()
 
     def load_prompt(self, filename):
         try:
@@ -58,22 +149,91 @@ class RaceCommentator(QThread):
         except FileNotFoundError:
             return f"Error: {filename} not found. Please create this file with the desired prompt."
 
-    def get_ai_commentary(self, messages, event_data, race_history):
+    def setup_compact_encoding(self, events):
+        self.codec = RaceLogCodec.from_texts(event.text for event in events)
+        self.system_prompt = (f"{self.system_prompt}\n\n{self.codec.header()}\n\n"
+                              f"The race history and events use this encoding. In your commentary always call "
+                              f"drivers by their names, never by their codes.")
+
+    def encode_event(self, event_data):
+        return self.codec.encode_event(event_data) if self.codec else event_data
+
+    def decode_commentary(self, commentary):
+        return self.codec.decode_text(commentary) if self.codec else commentary
+
+    def new_race_history(self):
+        return RaceHistory(self.history_lines) if self.endurance else ""
+
+    def add_reply(self, messages, commentary):
+        messages.append({"role": "assistant", "content": commentary})
+        keep = self.max_messages - self.max_messages % 2
+        if self.endurance and len(messages) > keep:
+            # Whole exchanges go, oldest first, so the conversation still opens with a user turn
+            del messages[:len(messages) - keep]
+
+    def build_context(self, event_data, race_history):
         context = f"Race history:\n{race_history}\n\nCurrent event: {event_data}"
+        if self.race_index is not None:
+            background = self.race_index.background_for(self.decode_commentary(event_data),
+                                                         exclude_session=session_name(self.input_path))
+            if background:
+                context += f"\n\nDriver background from previous races:\n{background}"
+        return context
+
+    def get_ai_commentary(self, messages, event_data, race_history):
+        context = self.build_context(event_data, race_history)
         messages.append({"role": "user", "content": context})
 
-        response = self.client.messages.create(
-            model="claude-3-5-sonnet-20240620",
-            max_tokens=500,
-            temperature=0.9,
-            system=self.system_prompt,
-            messages=messages
-        )
+        with LLM_SECONDS.time("commentary"):
+            response = self.governor.call("anthropic", lambda: self.client.messages.create(
+                model="claude-3-5-sonnet-20240620",
+                max_tokens=500,
+                temperature=0.9,
+                system=self.system_prompt,
+                messages=messages
+            ), {"input_tokens": self.estimate_input_tokens(messages)})
+        record_usage("commentary", response.usage)
 
         commentary = response.content[0].text
-        messages.append({"role": "assistant", "content": commentary})
+        self.add_reply(messages, commentary)
         return commentary
 
+    def stream_ai_commentary(self, messages, event_data, race_history):
+        # Same conversation as get_ai_commentary, but yields text as the model produces it
+        context = self.build_context(event_data, race_history)
+        messages.append({"role": "user", "content": context})
+
+        parts = []
+        for text in self.commentary_stream(list(messages)):
+            parts.append(text)
+            yield text
+
+        self.add_reply(messages, "".join(parts))
+
+    def commentary_stream(self, messages):
+        start = time.perf_counter()
+        for attempt in self.governor.attempts("anthropic", {"input_tokens": self.estimate_input_tokens(messages)}):
+            with attempt:
+                with self.client.messages.stream(
+                    model="claude-3-5-sonnet-20240620",
+                    max_tokens=500,
+                    temperature=0.9,
+                    system=self.system_prompt,
+                    messages=messages
+                ) as stream:
+                    for text in stream.text_stream:
+                        if not attempt.committed:
+                            LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - start, "commentary")
+                        # Text already handed on cannot be taken back by a retry
+                        attempt.commit()
+                        yield text
+                    if METRICS.enabled:
+                        record_usage("commentary", stream.get_final_message().usage)
+        LLM_SECONDS.observe(time.perf_counter() - start, "commentary")
+
+    def estimate_input_tokens(self, messages):
+        return estimate_tokens(self.system_prompt, *(message["content"] for message in messages))
+
     def create_output_file(self):
         base_name = os.path.basename(self.input_path)
         file_name, file_extension = os.path.splitext(base_name)
@@ -82,9 +242,11 @@ class RaceCommentator(QThread):
         original_dir = os.path.dirname(self.input_path)
         return os.path.join(original_dir, new_file_name)
 
-    def write_commentary(self, timecode, commentary):
+    def write_commentary(self, timecode, commentary, session_ms=None):
         with open(self.output_path, 'a', encoding='utf-8') as f:
             f.write(f"{timecode} - {commentary}\n")
+        if self.event_writer is not None and session_ms is not None:
+            self.event_writer.write(RaceEvent(session_ms, "commentary", commentary))
         self.output_signal.emit(f"{timecode} - {commentary}")
 
     def get_output_path(self):
@@ -0,0 +1,54 @@
+from types import MappingProxyType
+
+
+class RaceFrame:
+    """
+    Immutable view of the field at one realtime tick, read by the collector thread without locks.
+    """
+
+    __slots__ = ("session_time_ms", "cars", "cars_in_pits", "finished_cars", "classes", "_sorted_cars")
+
+    def __init__(self, session_time_ms, cars, cars_in_pits, finished_cars, classes):
+        self.session_time_ms = session_time_ms
+        self.cars = cars
+        self.cars_in_pits = cars_in_pits
+        self.finished_cars = finished_cars
+        self.classes = classes
+        self._sorted_cars = None
+
+    @property
+    def multiclass(self):
+        return len(set(self.classes.values())) > 1
+
+    def driver_name(self, car_index):
+        car = self.cars.get(car_index)
+        if car is None:
+            return f"Unknown Car {car_index}"
+        return car.get('driverName', f"Car {car_index}")
+
+    @property
+    def sorted_cars(self):
+        if self._sorted_cars is None:
+            self._sorted_cars = tuple(sorted(self.cars.values(),
+                                             key=lambda x: (-x.get('laps', 0), -x.get('splinePosition', 0))))
+        return self._sorted_cars
+
+
+EMPTY_FRAME = RaceFrame(0, MappingProxyType({}), frozenset(), frozenset(), MappingProxyType({}))
+
+
+class FrameBuffer:
+    """
+    Double buffer: the client thread publishes a frame per tick, the collector thread reads front.
+    """
+
+    def __init__(self):
+        self.front = EMPTY_FRAME
+        self.published = 0
+
+    def publish(self, session_time_ms, cars, cars_in_pits, finished_cars, classes):
+        snapshot = MappingProxyType({car_index: MappingProxyType(dict(car)) for car_index, car in cars.items()})
+        self.front = RaceFrame(session_time_ms, snapshot, frozenset(cars_in_pits), frozenset(finished_cars),
+                               MappingProxyType(dict(classes)))
+        self.published += 1
+        return self.front
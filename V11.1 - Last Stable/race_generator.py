@@ -0,0 +1,416 @@
+import os
+import sys
+import math
+import struct
+import random
+import argparse
+
+from accapi.client import Event
+from accapi.enums import BroadcastingEventType, CarLocation, SessionPhase, SessionType
+from accapi.structs import BroadcastingEvent, EntryListCar, RealtimeCarUpdate, RealtimeUpdate, TrackData
+
+FIRST_NAMES = ["Daniel", "Max", "Lucas", "Sofia", "Marco", "Elena", "Tom", "Yuki", "Nico", "Lena", "Pierre",
+               "Ana", "Jonas", "Mia", "Rafael", "Chloe", "Felix", "Ines", "Oscar", "Noah"]
+LAST_NAMES = ["Born", "Keller", "Rossi", "Dubois", "Moreno", "Novak", "Tanaka", "Berg", "Silva", "Hughes",
+              "Costa", "Lindqvist", "Weber", "Fischer", "Laurent", "Kowalski", "Meyer", "Marin", "Vidal", "Hart"]
+
+# Lap time factor per class; class 0 is the fastest
+CLASS_PACE = [1.0, 1.04, 1.08, 1.12, 1.16]
+SECTOR_SHARES = (0.3, 0.4, 0.3)
+
+# Message types of the broadcasting protocol, as read by AccClient
+REGISTRATION_RESULT, REALTIME_UPDATE, REALTIME_CAR_UPDATE, ENTRY_LIST, TRACK_DATA, ENTRY_LIST_CAR, \
+    BROADCASTING_EVENT = range(1, 8)
+DATAGRAM_LENGTH = struct.Struct("<I")
+
+
+def lap_args(lap_ms, car_index, splits=(), invalid=False, outlap=False, inlap=False):
+    return [lap_ms, car_index, 0, len(splits), *splits, invalid, not invalid, outlap, inlap]
+
+
+def pack(*fmt_value_pairs):
+    # Same wire encoding AccClient._send uses: little endian, strings as length-prefixed UTF-8
+    fmt = "<"
+    values = []
+    for f, v in fmt_value_pairs:
+        if f == "s":
+            encoded = v.encode("utf8")
+            fmt += f"H{len(encoded)}s" if encoded else "H"
+            values.append(len(encoded))
+            if encoded:
+                values.append(encoded)
+        else:
+            fmt += f
+            values.append(v)
+    return struct.pack(fmt, *values)
+
+
+def pack_lap(args):
+    split_count = args[3]
+    return pack(*zip("iHHB" + "i" * split_count + "????", args))
+
+
+def encode_message(message_type, args):
+    """
+    Packs decoded constructor args back into the datagram AccClient would receive.
+    """
+    if message_type == REALTIME_CAR_UPDATE:
+        body = pack(*zip("HHBBfffBHHHHfHi", args[:15]))
+        rest = args[15:]
+        for _ in range(3):
+            size = 8 + rest[3]
+            body += pack_lap(rest[:size])
+            rest = rest[size:]
+    elif message_type == REALTIME_UPDATE:
+        body = pack(*zip("HHBBffisss?", args[:11])) + pack(*zip("fBBBBB", args[11:17])) + pack_lap(args[17:])
+    elif message_type == BROADCASTING_EVENT:
+        body = pack(*zip("Bsii", args))
+    elif message_type == ENTRY_LIST_CAR:
+        body = pack(*zip("HBsiBBHB", args[:8]))
+        for i in range(args[7]):
+            body += pack(*zip("sssBH", args[8 + i * 5:13 + i * 5]))
+    elif message_type == ENTRY_LIST:
+        body = pack(*zip("iH" + "H" * args[1], args))
+    elif message_type == TRACK_DATA:
+        body = pack(*zip("isiiB", args[:5])) + pack(("B", 0))
+    elif message_type == REGISTRATION_RESULT:
+        body = pack(*zip("i??s", args))
+    else:
+        raise ValueError(f"Unknown message type: {message_type}")
+    return bytes([message_type]) + body
+
+
+class SyntheticCar:
+    __slots__ = ("index", "category", "pace_ms", "laps", "spline", "lap_start_ms", "lap_target_ms", "last_lap",
+                 "best_lap", "pit_lap", "pit_until_ms", "pit_total_ms", "stopped_until_ms", "position", "cup_position", "kmh", "out_lap", "stint")
+
+    def __init__(self, index, category, pace_ms):
+        self.index = index
+        self.category = category
+        self.pace_ms = pace_ms
+        self.laps = 0
+        self.spline = 0.0
+        self.lap_start_ms = 0
+        self.lap_target_ms = pace_ms
+        self.last_lap = None
+        self.best_lap = None
+        self.pit_lap = None
+        self.pit_until_ms = 0
+        self.pit_total_ms = 0
+        self.stopped_until_ms = 0
+        self.position = index + 1
+        self.cup_position = index + 1
+        self.kmh = 0
+        self.out_lap = False
+        self.stint = 0
+
+
+class SyntheticRace:
+    """
+    A seeded, reproducible race for benchmarks and soak tests.
+    """
+
+    def __init__(self, cars=20, hours=1.0, seed=0, classes=1, tick_ms=500, lap_ms=100000, track_meters=5000,
+                 accidents_per_hour=4.0, pit_window=(0.35, 0.65), pit_loss_ms=55000, stint_laps=None,
+                 driver_swaps=False, churn_per_hour=0.0):
+        # stint_laps, driver_swaps and churn_per_hour shape endurance races: regular stops, new
+        # drivers at each stop, and cars that disconnect and are replaced
+        self.car_count = cars
+        self.duration_ms = int(hours * 3600000)
+        self.seed = seed
+        self.classes = max(1, min(classes, len(CLASS_PACE)))
+        self.tick_ms = tick_ms
+        self.lap_ms = lap_ms
+        self.track_meters = track_meters
+        self.accidents_per_hour = accidents_per_hour
+        self.pit_window = pit_window
+        self.pit_loss_ms = pit_loss_ms
+        self.stint_laps = stint_laps
+        self.driver_swaps = driver_swaps
+        self.churn_per_hour = churn_per_hour
+
+    def setup(self, rng):
+        cars = []
+        for index in range(self.car_count):
+            # Classes run as contiguous blocks of the grid, fastest class in front
+            category = index * self.classes // self.car_count
+            pace = self.lap_ms * CLASS_PACE[category] * (1 + rng.gauss(0, 0.006))
+            car = SyntheticCar(index, category, pace)
+            car.spline = (self.car_count - index) * 0.0012
+            # The opening lap is where the field shuffles: a much wider spread than later laps
+            car.lap_target_ms = pace * (1 + abs(rng.gauss(0, 0.03)))
+            expected_laps = self.duration_ms / pace
+            if self.stint_laps:
+                car.pit_lap = self.stint_laps
+            elif expected_laps > 3:
+                car.pit_lap = max(2, int(expected_laps * rng.uniform(*self.pit_window)))
+            cars.append(car)
+        return cars
+
+    def entry_list_args(self):
+        return [self.entry_args(index, index * self.classes // self.car_count) for index in range(self.car_count)]
+
+    def entry_args(self, index, category, stint=0):
+        offset = self.seed % len(FIRST_NAMES)
+        # Unique first/last pairs for up to 400 cars; each stint of a car has a driver of its own
+        block = index // len(LAST_NAMES)
+        first = FIRST_NAMES[(index * 7 + block + offset + stint * 3) % len(FIRST_NAMES)]
+        last = LAST_NAMES[(index + stint * 7) % len(LAST_NAMES)]
+        team = LAST_NAMES[index % len(LAST_NAMES)]
+        return [index, 0, f"Team {team}", index + 1, category, 0, 0, 1, first, last, last[:3].upper(), 0, 0]
+
+    def track_data_args(self):
+        return [1, "Synthetic Ring", 99, self.track_meters, 0, 0]
+
+    def world_position(self, spline):
+        angle = 2 * math.pi * spline
+        radius = self.track_meters / (2 * math.pi)
+        return radius * 1.4 * math.cos(angle), radius * 0.7 * math.sin(angle)
+
+    def ticks(self):
+        """
+        Yields (session ms, realtime update, car updates, broadcasting events, entry list changes).
+        """
+        rng = random.Random(self.seed)
+        cars = self.setup(rng)
+        pending_events = []
+        accident_chance = self.accidents_per_hour * self.tick_ms / 3600000
+        churn_chance = self.churn_per_hour * self.tick_ms / 3600000
+        next_index = self.car_count
+        # Half the races get a first-lap pileup
+        pileup_ms = rng.randint(20000, 40000) if rng.random() < 0.5 else None
+        session_ms = 0
+        finish_laps = None
+
+        while True:
+            session_ms += self.tick_ms
+            phase = SessionPhase.SESSION if session_ms <= self.duration_ms else SessionPhase.SESSION_OVER
+            if phase == SessionPhase.SESSION_OVER and finish_laps is None:
+                finish_laps = max(car.laps for car in cars) + 1
+
+            roster = []
+            for car in cars:
+                in_pits = car.pit_until_ms
+                self.advance(car, session_ms, rng)
+                if in_pits and not car.pit_until_ms:
+                    if self.stint_laps:
+                        car.pit_lap = car.laps + self.stint_laps
+                    if self.driver_swaps:
+                        car.stint += 1
+                        roster.append((ENTRY_LIST_CAR, self.entry_args(car.index, car.category, car.stint)))
+
+            if churn_chance and phase == SessionPhase.SESSION and rng.random() < churn_chance:
+                cars.append(self.replace_car(cars, rng.choice(cars), next_index, session_ms))
+                next_index += 1
+                roster.insert(0, (ENTRY_LIST, [1, len(cars)] + [car.index for car in cars]))
+                roster.append((ENTRY_LIST_CAR, self.entry_args(cars[-1].index, cars[-1].category)))
+
+            if pileup_ms is not None and session_ms >= pileup_ms:
+                self.accident(cars, session_ms, rng, pending_events, rng.randint(3, 6))
+                pileup_ms = None
+            elif rng.random() < accident_chance:
+                self.accident(cars, session_ms, rng, pending_events, rng.randint(1, 4))
+
+            order = sorted(cars, key=lambda car: -(car.laps + car.spline))
+            class_counts = [0] * self.classes
+            for position, car in enumerate(order, start=1):
+                car.position = position
+                class_counts[car.category] += 1
+                car.cup_position = class_counts[car.category]
+
+            update = [0, 0, SessionType.RACE, phase, float(session_ms), float(self.duration_ms), 0, "", "", "", False,
+                      float(14 * 3600000 + session_ms), 22, 30, 0, 0, 0] + self.best_lap_args(cars)
+            car_updates = [self.car_args(car, session_ms) for car in cars]
+            events = [args for due_ms, args in pending_events if due_ms <= session_ms]
+            pending_events = [(due_ms, args) for due_ms, args in pending_events if due_ms > session_ms]
+            yield session_ms, update, car_updates, events, roster
+
+            if finish_laps is not None and order[0].laps >= finish_laps and order[0].spline > 0.995:
+                return
+
+    def replace_car(self, cars, leaving, index, session_ms):
+        # The newcomer starts from the pit lane a lap down on the car it replaces
+        cars.remove(leaving)
+        car = SyntheticCar(index, leaving.category, leaving.pace_ms)
+        car.laps = max(0, leaving.laps - 1)
+        car.lap_start_ms = session_ms
+        car.pit_lap = car.laps + self.stint_laps if self.stint_laps else None
+        return car
+
+    def advance(self, car, session_ms, rng):
+        if session_ms < car.stopped_until_ms:
+            car.kmh = 0
+            return
+
+        if car.pit_until_ms:
+            # Pit lane: the spline runs from 0.97 through the line to 0.03 over the whole stop
+            remaining = car.pit_until_ms - session_ms
+            progress = 1 - max(remaining, 0) / car.pit_total_ms
+            spline = 0.97 + 0.06 * progress
+            if spline >= 1.0 and car.spline > 0.5:
+                self.complete_lap(car, session_ms, rng, inlap=True)
+                car.out_lap = True
+            car.spline = spline % 1.0
+            car.kmh = 60
+            if remaining <= 0:
+                car.pit_until_ms = 0
+            return
+
+        step = self.tick_ms / car.lap_target_ms
+        car.kmh = int(self.track_meters / car.lap_target_ms * 3600 * (1 + rng.gauss(0, 0.05)))
+        spline = car.spline + step
+        if car.pit_lap is not None and car.laps == car.pit_lap and car.spline < 0.97 <= spline:
+            car.pit_lap = None
+            car.pit_total_ms = self.pit_loss_ms + int(0.06 * car.lap_target_ms)
+            car.pit_until_ms = session_ms + car.pit_total_ms
+            car.spline = 0.97
+            return
+        if spline >= 1.0:
+            self.complete_lap(car, session_ms, rng)
+            spline -= 1.0
+        car.spline = spline
+
+    def complete_lap(self, car, session_ms, rng, inlap=False):
+        lap_ms = session_ms - car.lap_start_ms
+        shares = [share * (1 + rng.gauss(0, 0.01)) for share in SECTOR_SHARES]
+        splits = [int(lap_ms * share / sum(shares)) for share in shares]
+        splits[-1] = lap_ms - splits[0] - splits[1]
+        invalid = rng.random() < 0.03
+        outlap = car.out_lap and not inlap
+        car.out_lap = False
+        car.last_lap = lap_args(lap_ms, car.index, splits, invalid=invalid, outlap=outlap, inlap=inlap)
+        if not invalid and not inlap and not outlap and car.laps > 0 and (car.best_lap is None or lap_ms < car.best_lap[0]):
+            car.best_lap = car.last_lap
+        car.laps += 1
+        car.lap_start_ms = session_ms
+        car.lap_target_ms = car.pace_ms * (1 + rng.gauss(0, 0.004))
+
+    def accident(self, cars, session_ms, rng, pending_events, size):
+        running = [car for car in cars if not car.pit_until_ms and session_ms >= car.stopped_until_ms]
+        if not running:
+            return
+        first = rng.choice(running)
+        nearby = sorted(running, key=lambda car: abs(((car.spline - first.spline) + 0.5) % 1.0 - 0.5))[:size]
+        for car in nearby:
+            car.stopped_until_ms = session_ms + rng.randint(5000, 20000)
+            due_ms = session_ms + rng.randint(0, 2000)
+            pending_events.append((due_ms, [BroadcastingEventType.ACCIDENT, "", int(due_ms), car.index]))
+
+    def best_lap_args(self, cars):
+        best = min((car.best_lap for car in cars if car.best_lap), key=lambda lap: lap[0], default=None)
+        return list(best) if best else lap_args(2 ** 31 - 1, 0)
+
+    def car_args(self, car, session_ms):
+        x, y = self.world_position(car.spline)
+        if car.pit_until_ms:
+            elapsed = session_ms - (car.pit_until_ms - car.pit_total_ms)
+            if elapsed < 3000:
+                location = CarLocation.PIT_ENTRY
+            elif car.pit_until_ms - session_ms < 3000:
+                location = CarLocation.PIT_EXIT
+            else:
+                location = CarLocation.PITLANE
+        else:
+            location = CarLocation.TRACK
+        last_lap = car.last_lap or lap_args(2 ** 31 - 1, car.index)
+        best_lap = car.best_lap or lap_args(2 ** 31 - 1, car.index)
+        current_lap = lap_args(session_ms - car.lap_start_ms, car.index)
+        return ([car.index, 0, 1, 5, x, y, 0.0, location, car.kmh, car.position, car.cup_position, car.position,
+                 car.spline, car.laps, 0] + best_lap + last_lap + current_lap)
+
+    def messages(self):
+        """
+        Yields (message type, constructor args) in the order a client receives them.
+        """
+        yield REGISTRATION_RESULT, [1, True, False, ""]
+        yield ENTRY_LIST, [1, self.car_count] + list(range(self.car_count))
+        for entry in self.entry_list_args():
+            yield ENTRY_LIST_CAR, entry
+        yield TRACK_DATA, self.track_data_args()
+        for _, update, car_updates, events, roster in self.ticks():
+            yield from roster
+            yield REALTIME_UPDATE, update
+            for args in car_updates:
+                yield REALTIME_CAR_UPDATE, args
+            for args in events:
+                yield BROADCASTING_EVENT, args
+
+    def decoded(self):
+        """
+        Yields the accapi objects AccClient would hand to its subscribers, skipping registration.
+        """
+        constructors = {REALTIME_UPDATE: RealtimeUpdate, REALTIME_CAR_UPDATE: RealtimeCarUpdate,
+                        ENTRY_LIST_CAR: EntryListCar, TRACK_DATA: TrackData, BROADCASTING_EVENT: BroadcastingEvent}
+        for message_type, args in self.messages():
+            if message_type in constructors:
+                yield message_type, constructors[message_type](*args)
+
+    def datagrams(self):
+        for message_type, args in self.messages():
+            yield encode_message(message_type, args)
+
+    def write_datagrams(self, path):
+        # Length-prefixed datagrams, for replay through a socket or straight into the decoder
+        count = 0
+        with open(path, "wb") as f:
+            for datagram in self.datagrams():
+                f.write(DATAGRAM_LENGTH.pack(len(datagram)))
+                f.write(datagram)
+                count += 1
+        return count
+
+    def write_collector_log(self, path, collector=None):
+        """
+        Feeds the race through a DataCollector's callbacks and returns the path of its text log.
+        """
+        if collector is None:
+            from data_collector import DataCollector
+            collector = DataCollector("ACC")
+        collector.setup_output_file(path)
+        handlers = {REALTIME_UPDATE: collector.on_realtime_update,
+                    REALTIME_CAR_UPDATE: collector.on_realtime_car_update,
+                    ENTRY_LIST_CAR: collector.on_entry_list_car_update,
+                    TRACK_DATA: collector.on_track_data_update,
+                    BROADCASTING_EVENT: collector.on_broadcasting_event}
+        update_every_ms = collector.update_interval * 1000
+        next_update_ms = update_every_ms
+        try:
+            for message_type, content in self.decoded():
+                handlers[message_type](Event(self, content))
+                if message_type == REALTIME_UPDATE and content.sessionTimeMs >= next_update_ms:
+                    next_update_ms += update_every_ms
+                    if collector.race_started:
+                        collector.update_race_data()
+        finally:
+            collector.close_output()
+        return collector.output_file
+
+
+def read_datagrams(path):
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(DATAGRAM_LENGTH.size)
+            if not header:
+                return
+            yield f.read(DATAGRAM_LENGTH.unpack(header)[0])
+
+
+if __name__ == "__main__":
+    # python race_generator.py --cars 60 --hours 1 --classes 2 --format log --output "Race Data/synthetic.txt"
+    parser = argparse.ArgumentParser(description="Generate a seeded synthetic ACC race.")
+    parser.add_argument("--cars", type=int, default=20)
+    parser.add_argument("--hours", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--classes", type=int, default=1)
+    parser.add_argument("--format", choices=("log", "datagrams"), default="log")
+    parser.add_argument("--output", default=None)
+    options = parser.parse_args()
+
+    race = SyntheticRace(cars=options.cars, hours=options.hours, seed=options.seed, classes=options.classes)
+    name = f"synthetic_{options.cars}cars_{options.hours:g}h_seed{options.seed}"
+    if options.format == "log":
+        output = options.output or os.path.join("Race Data", name + ".txt")
+        print(race.write_collector_log(output))
+    else:
+        output = options.output or name + ".datagrams"
+        print(f"{race.write_datagrams(output)} datagrams written to {output}", file=sys.stderr)
@@ -0,0 +1,251 @@
+import os
+import re
+import sys
+import hashlib
+import sqlite3
+import threading
+
+from event_store import events_path, open_events
+from race_log_codec import WORD_COUNT_PATTERN, RaceLogCodec, is_driver_name
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    session TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    sha1 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    session TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    session_ms INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    position INTEGER,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS event_drivers (
+    event_id INTEGER NOT NULL REFERENCES events(id) ON DELETE CASCADE,
+    driver TEXT NOT NULL,
+    role TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_session ON events(session, session_ms);
+CREATE INDEX IF NOT EXISTS events_type ON events(type, session);
+CREATE INDEX IF NOT EXISTS events_file ON events(file_id);
+CREATE INDEX IF NOT EXISTS event_drivers_driver ON event_drivers(driver, role);
+CREATE INDEX IF NOT EXISTS event_drivers_event ON event_drivers(event_id);
+"""
+
+# Collector event types recognised from the text of logs that have no events file
+TEXT_TYPES = [
+    ("overtake", re.compile(r'Overtake! (.+?) overtook (.+?) for position (\d+)\.'), ("overtaker", "overtaken")),
+    ("overtake", re.compile(r'Class overtake! (.+?) overtook (.+?) for P(\d+) in '), ("overtaker", "overtaken")),
+    ("class_leader", re.compile(r'(.+?) takes the .+? class lead from (.+?)!()'), ("overtaker", "overtaken")),
+    ("battle", re.compile(r'Battle! (.+?) and (.+?) swapped position (\d+) \d+ times'), ("overtaker", "overtaken")),
+    ("accident", re.compile(r'Accident involving: (.+)$'), None),
+    ("accident", re.compile(r'Multi-car incident at .+?: (.+)$'), None),
+    ("pit_entry", re.compile(r'(.+?) has entered the pits\.()'), ("driver",)),
+    ("pit_exit", re.compile(r'(.+?) has exited the pits\.()'), ("driver",)),
+    ("pit_stop", re.compile(r'(.+?) made a pit stop \(\d+s in the pit lane\)\.()'), ("driver",)),
+    ("result", re.compile(r'(.+?) has finished in position (\d+)\.'), ("finisher",)),
+    ("finish", re.compile(r'Checkered flag! (.+?) takes the win!()'), ("winner",)),
+]
+
+
+def session_name(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return re.sub(r'(_filtered)?(_commentary)?$', '', name)
+
+
+def file_kind(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    if name.endswith("_commentary"):
+        return "commentary"
+    if name.endswith("_filtered"):
+        return "filtered"
+    return "raw"
+
+
+def parse_event(text):
+    # -> (type, position, [(driver, role)])
+    text = WORD_COUNT_PATTERN.sub("", text)
+    for event_type, pattern, roles in TEXT_TYPES:
+        match = pattern.match(text)
+        if not match:
+            continue
+        if roles is None:
+            drivers = [(driver, "involved") for driver in match.group(1).split(", ")]
+            position = None
+        else:
+            groups = match.groups()
+            position = next((int(group) for group in groups[len(roles):] if group and group.isdigit()), None)
+            drivers = list(zip(groups, roles))
+        # Edited lines in filtered logs can put prose where a name would be
+        return event_type, position, [(driver, role) for driver, role in drivers if is_driver_name(driver.strip())]
+    return "info", None, []
+
+
+class RaceIndex:
+    def __init__(self, db_path=os.path.join("Race Data", "race_index.sqlite")):
+        self.db_path = db_path
+        # The index is shared with QThreads; one connection guarded by a lock
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self._drivers = None
+        self._driver_pattern = None
+
+    def close(self):
+        self.connection.close()
+
+    def ingest(self, directory="Race Data"):
+        stats = {"scanned": 0, "indexed": 0, "unchanged": 0, "events": 0}
+        paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                       if name.endswith(".txt"))
+
+        # Commentary last within a session, so it can be matched against the session's drivers
+        paths.sort(key=lambda path: (session_name(path), file_kind(path) == "commentary"))
+        for path in paths:
+            stats["scanned"] += 1
+            indexed = self.ingest_file(path)
+            if indexed is None:
+                stats["unchanged"] += 1
+            else:
+                stats["indexed"] += 1
+                stats["events"] += indexed
+
+        if stats["indexed"]:
+            self._drivers = None
+        return stats
+
+    def ingest_file(self, path):
+        mtime = os.path.getmtime(path)
+        with self.lock:
+            row = self.connection.execute("SELECT id, mtime, sha1 FROM files WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[1] == mtime:
+            return None
+
+        sha1 = self.hash_file(path)
+        if row is not None and row[2] == sha1:
+            with self.lock, self.connection:
+                self.connection.execute("UPDATE files SET mtime = ? WHERE id = ?", (mtime, row[0]))
+            return None
+
+        session = session_name(path)
+        kind = file_kind(path)
+        events = list(open_events(path))
+        codec = self.session_codec(session) if kind == "commentary" else None
+
+        with self.lock, self.connection:
+            if row is not None:
+                self.connection.execute("DELETE FROM files WHERE id = ?", (row[0],))
+            file_id = self.connection.execute(
+                "INSERT INTO files (path, session, kind, mtime, sha1) VALUES (?, ?, ?, ?, ?)",
+                (path, session, kind, mtime, sha1)).lastrowid
+
+            for event in events:
+                if kind == "commentary":
+                    names = codec.name_pattern.findall(event.text) if codec.names else []
+                    event_type, position, drivers = "commentary", None, [(name, "mentioned") for name in set(names)]
+                else:
+                    event_type, position, drivers = parse_event(event.text)
+                    if event.type not in ("text", "info", "filtered"):
+                        event_type = event.type
+                event_id = self.connection.execute(
+                    "INSERT INTO events (file_id, session, kind, session_ms, type, position, text) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (file_id, session, kind, event.session_ms, event_type, position, event.text)).lastrowid
+                self.connection.executemany(
+                    "INSERT INTO event_drivers (event_id, driver, role) VALUES (?, ?, ?)",
+                    [(event_id, driver.strip(), role) for driver, role in drivers])
+
+        return len(events)
+
+    def session_codec(self, session):
+        drivers = self.query(
+            "SELECT DISTINCT d.driver FROM event_drivers d JOIN events e ON e.id = d.event_id "
+            "WHERE e.session = ? AND e.kind != 'commentary'", (session,))
+        return RaceLogCodec(driver for driver, in drivers)
+
+    def hash_file(self, path):
+        sha1 = hashlib.sha1()
+        for file_path in (path, events_path(path)):
+            if os.path.exists(file_path):
+                with open(file_path, 'rb') as f:
+                    for block in iter(lambda: f.read(65536), b""):
+                        sha1.update(block)
+        return sha1.hexdigest()
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    def sessions(self, driver, limit=10, exclude_session=None):
+        rows = self.query(
+            "SELECT DISTINCT e.session FROM event_drivers d JOIN events e ON e.id = d.event_id "
+            "WHERE d.driver = ? AND e.kind = 'raw' AND e.session != ? ORDER BY e.session DESC LIMIT ?",
+            (driver, exclude_session or "", limit))
+        return [row[0] for row in rows]
+
+    def driver_history(self, driver, limit=10, exclude_session=None):
+        history = []
+        for session in self.sessions(driver, limit, exclude_session):
+            counts = dict(self.query(
+                "SELECT d.role || ':' || e.type, COUNT(*) FROM event_drivers d JOIN events e ON e.id = d.event_id "
+                "WHERE d.driver = ? AND e.session = ? AND e.kind = 'raw' GROUP BY d.role, e.type",
+                (driver, session)))
+            finish = self.query(
+                "SELECT e.position FROM event_drivers d JOIN events e ON e.id = d.event_id "
+                "WHERE d.driver = ? AND e.session = ? AND e.kind = 'raw' AND e.type = 'result'",
+                (driver, session))
+            history.append({
+                "session": session,
+                "finish_position": finish[0][0] if finish else None,
+                "overtakes": counts.get("overtaker:overtake", 0),
+                "overtaken": counts.get("overtaken:overtake", 0),
+                "accidents": counts.get("involved:accident", 0),
+                "pit_stops": counts.get("driver:pit_entry", 0) + counts.get("driver:pit_stop", 0),
+            })
+        return history
+
+    def driver_background(self, driver, limit=10, exclude_session=None):
+        history = self.driver_history(driver, limit, exclude_session)
+        if not history:
+            return None
+        finishes = [race["finish_position"] for race in history if race["finish_position"]]
+        summary = f"{driver}: {len(history)} previous races"
+        if finishes:
+            summary += (f", average finish P{sum(finishes) / len(finishes):.1f}, best P{min(finishes)}, "
+                        f"{finishes.count(1)} wins")
+        summary += (f", {sum(race['overtakes'] for race in history)} overtakes made, "
+                    f"{sum(race['accidents'] for race in history)} accidents")
+        return summary
+
+    def drivers_in(self, text):
+        if self._drivers is None:
+            self._drivers = [row[0] for row in self.query("SELECT DISTINCT driver FROM event_drivers")]
+            names = sorted(self._drivers, key=len, reverse=True)
+            self._driver_pattern = re.compile(
+                r'(?<!\w)(' + '|'.join(re.escape(name) for name in names) + r')(?!\w)') if names else None
+        if self._driver_pattern is None:
+            return []
+        return list(dict.fromkeys(self._driver_pattern.findall(text)))
+
+    def background_for(self, text, limit=10, exclude_session=None):
+        lines = [self.driver_background(driver, limit, exclude_session) for driver in self.drivers_in(text)]
+        return "\n".join(line for line in lines if line)
+
+
+if __name__ == "__main__":
+    # python race_index.py ingest ["Race Data"]  |  python race_index.py driver "Daniel Born"
+    index = RaceIndex()
+    if len(sys.argv) > 1 and sys.argv[1] == "driver":
+        for race in index.driver_history(sys.argv[2]):
+            print(race)
+    else:
+        print(index.ingest(sys.argv[2] if len(sys.argv) > 2 else "Race Data"))
+    index.close()
@@ -0,0 +1,163 @@
+import re
+
+LINE_PATTERN = re.compile(r'(\d{2}:\d{2}:\d{2}) - (.+)')
+CODE_PATTERN = re.compile(r'\bD(\d+)\b')
+
+# (record type, pattern matching the collector text, text template used when decoding)
+EVENT_TYPES = [
+    ("OT", re.compile(r'Overtake! (.+?) overtook (.+?) for position (\d+)\.'),
+     "Overtake! {0} overtook {1} for position {2}."),
+    ("BAT", re.compile(r'Battle! (.+?) and (.+?) swapped position (\d+) (\d+) times, .+? came out ahead\.'),
+     "Battle! {0} and {1} swapped position {2} {3} times, {0} came out ahead."),
+    ("PIN", re.compile(r'(.+?) has entered the pits\.'), "{0} has entered the pits."),
+    ("POUT", re.compile(r'(.+?) has exited the pits\.'), "{0} has exited the pits."),
+    ("PIT", re.compile(r'(.+?) made a pit stop \((\d+)s in the pit lane\)\.'),
+     "{0} made a pit stop ({1}s in the pit lane)."),
+    ("FIN", re.compile(r'(.+?) has finished in position (\d+)\.'), "{0} has finished in position {1}."),
+]
+ACCIDENT_PREFIX = "Accident involving: "
+INCIDENT_PATTERN = re.compile(r'Multi-car incident at .+?: (.+)$')
+# Tables of multiclass races name the class: "Current positions (Pro-Am): ..."
+TABLE_PATTERN = re.compile(r'(?:Current positions|Position changes|Final results)(?: \([^)]+\))?: ')
+TABLE_ENTRY_PATTERN = re.compile(r'\(P\d+\) (.+?)(?: \+\d+(?:\.\d+s| laps?))?(?=, \(P\d+\) |$)')
+WORD_COUNT_PATTERN = re.compile(r'\s*Commentate in \d+ words\.')
+# Filtered logs mix free text into event lines; anything sentence-like is not a driver name
+NOT_A_NAME_PATTERN = re.compile(r'[!?:]')
+RECORD_PATTERN = re.compile(r'(OT|BAT|PIN|POUT|PIT|FIN|ACC) ((?:D\d+|\d+)(?: (?:D\d+|\d+))*)(.*)$')
+
+LEGEND = """The race data below uses a compact encoding. Drivers are written as codes (D1, D2, ...) listed in the
+driver table. Event records are:
+OT a b p = a overtook b for position p
+BAT a b p n = a and b swapped position p n times, a came out ahead
+ACC a b ... = accident involving the listed drivers
+PIN a / POUT a = a entered / exited the pits
+PIT a s = a made a pit stop of s seconds
+FIN a p = a finished in position p"""
+
+
+def is_driver_name(name):
+    return 0 < len(name) <= 40 and len(name.split()) <= 6 and not NOT_A_NAME_PATTERN.search(name)
+
+
+class RaceLogCodec:
+    def __init__(self, drivers=()):
+        self.names = []
+        self.codes = {}
+        self._name_pattern = None
+        for name in drivers:
+            self.add_driver(name)
+
+    @classmethod
+    def from_log(cls, race_data):
+        matches = (LINE_PATTERN.match(line.strip()) for line in race_data.split('\n'))
+        return cls.from_texts(match.group(2) for match in matches if match)
+
+    @classmethod
+    def from_texts(cls, texts):
+        codec = cls()
+        for text in texts:
+            text = WORD_COUNT_PATTERN.sub("", text)
+            for name in codec.find_drivers(text):
+                if is_driver_name(name):
+                    codec.add_driver(name)
+        return codec
+
+    def add_driver(self, name):
+        name = name.strip()
+        if name and name not in self.codes:
+            self.names.append(name)
+            self.codes[name] = f"D{len(self.names)}"
+            self._name_pattern = None
+
+    def find_drivers(self, text):
+        for _, pattern, _ in EVENT_TYPES:
+            match = pattern.match(text)
+            if match:
+                return [group for group in match.groups() if not group.isdigit()]
+        if text.startswith(ACCIDENT_PREFIX):
+            return text[len(ACCIDENT_PREFIX):].split(", ")
+        match = INCIDENT_PATTERN.match(text)
+        if match:
+            return match.group(1).split(", ")
+        match = TABLE_PATTERN.match(text)
+        if match:
+            return TABLE_ENTRY_PATTERN.findall(text[match.end():])
+        return []
+
+    @property
+    def name_pattern(self):
+        # Longest names first so "Daniel Born" never eats part of "Daniel Borne"
+        if self._name_pattern is None:
+            names = sorted(self.names, key=len, reverse=True)
+            self._name_pattern = re.compile(r'(?<!\w)(' + '|'.join(re.escape(name) for name in names) + r')(?!\w)')
+        return self._name_pattern
+
+    def header(self):
+        drivers = "; ".join(f"{self.codes[name]}={name}" for name in self.names)
+        return f"{LEGEND}\n\nDrivers: {drivers}"
+
+    def encode_event(self, text):
+        for record, pattern, _ in EVENT_TYPES:
+            match = pattern.match(text)
+            if match:
+                fields = [group if group.isdigit() else self.codes.get(group) for group in match.groups()]
+                if record == "BAT":
+                    fields = fields[:4]
+                # Records only hold codes and numbers; edited lines keep their text instead
+                if None not in fields:
+                    return f"{record} {' '.join(fields)}{self.encode_text(text[match.end():])}"
+                break
+        if text.startswith(ACCIDENT_PREFIX):
+            drivers = text[len(ACCIDENT_PREFIX):].split(", ")
+            if all(driver in self.codes for driver in drivers):
+                return "ACC " + " ".join(self.codes[driver] for driver in drivers)
+        return self.encode_text(text)
+
+    def encode_text(self, text):
+        if not self.names:
+            return text
+        return self.name_pattern.sub(lambda match: self.codes[match.group(1)], text)
+
+    def encode(self, race_data):
+        lines = []
+        for line in race_data.split('\n'):
+            match = LINE_PATTERN.match(line.strip())
+            if match:
+                timecode, text = match.groups()
+                lines.append(f"{timecode} {self.encode_event(text)}")
+            else:
+                lines.append(line)
+        return '\n'.join(lines)
+
+    def decode_event(self, text):
+        match = RECORD_PATTERN.match(text)
+        if match:
+            record, fields, rest = match.groups()
+            fields = [self.decode_text(field) for field in fields.split(" ")]
+            if record == "ACC":
+                return ACCIDENT_PREFIX + ", ".join(fields) + rest
+            for name, _, template in EVENT_TYPES:
+                if name == record:
+                    try:
+                        return template.format(*fields) + rest
+                    except IndexError:
+                        break
+        return self.decode_text(text)
+
+    def decode_text(self, text):
+        def name(match):
+            index = int(match.group(1)) - 1
+            return self.names[index] if 0 <= index < len(self.names) else match.group(0)
+        return CODE_PATTERN.sub(name, text)
+
+    def decode(self, encoded):
+        # Accepts both "HH:MM:SS record" and "HH:MM:SS - record" lines from the model
+        lines = []
+        for line in encoded.split('\n'):
+            match = re.match(r'(\d{2}:\d{2}:\d{2})(?: - | )(.+)', line.strip())
+            if match:
+                timecode, text = match.groups()
+                lines.append(f"{timecode} - {self.decode_event(text)}")
+            else:
+                lines.append(self.decode_text(line))
+        return '\n'.join(lines)
@@ -0,0 +1,181 @@
+import re
+
+LINE_PATTERN = re.compile(r'(\d{2}):(\d{2}):(\d{2}) - (.+)')
+OVERTAKE_PATTERN = re.compile(r'Overtake! (.+) overtook (.+) for position (\d+)\.$')
+PIT_PATTERN = re.compile(r'(.+) has (entered|exited) the pits\.$')
+FINISH_PATTERN = re.compile(r'(.+) has finished in position (\d+)\.$')
+TABLE_ENTRY_PATTERN = re.compile(r'\(P(\d+)\) ')
+GAP_SUFFIX_PATTERN = re.compile(r' \+\d+(?:\.\d+s| laps?)$')
+ACCIDENT_PREFIX = "Accident involving: "
+POSITIONS_PATTERN = re.compile(r'Current positions( \([^)]+\))?: ')
+
+
+def format_time(seconds):
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+def parse_lines(race_data):
+    # Returns (seconds, text) for event lines and (None, line) for everything else
+    entries = []
+    for line in race_data.split('\n'):
+        match = LINE_PATTERN.match(line.strip())
+        if match:
+            hours, minutes, seconds, text = match.groups()
+            entries.append((int(hours) * 3600 + int(minutes) * 60 + int(seconds), text))
+        else:
+            entries.append((None, line))
+    return entries
+
+
+def collapse_overtakes(entries, window=20):
+    # A pair of cars swapping places again within `window` seconds of their previous swap is
+    # the same fight. A pass only stands once it has held for `window` seconds, so the whole
+    # fight is reported as one line, at the time it started, with the final outcome.
+    output = []
+    battles = {}
+
+    def close(battle):
+        _, seconds, winner, loser, position, passes, slot = battle
+        if passes == 1:
+            output[slot] = (seconds, f"Overtake! {winner} overtook {loser} for position {position}.")
+        else:
+            output[slot] = (seconds, f"Battle! {winner} and {loser} swapped position {position} {passes} times, "
+                                     f"{winner} came out ahead.")
+
+    for seconds, text in entries:
+        match = OVERTAKE_PATTERN.match(text) if seconds is not None else None
+        if not match:
+            output.append((seconds, text))
+            continue
+
+        winner, loser, position = match.groups()
+        key = frozenset((winner, loser))
+        battle = battles.get(key)
+        if battle is not None and seconds - battle[0] <= window:
+            battles[key] = (seconds, battle[1], winner, loser, position, battle[5] + 1, battle[6])
+            continue
+
+        if battle is not None:
+            close(battle)
+        output.append(None)
+        battles[key] = (seconds, seconds, winner, loser, position, 1, len(output) - 1)
+
+    for battle in battles.values():
+        close(battle)
+    return output
+
+
+def fold_pit_stops(entries):
+    output = []
+    open_stops = {}
+    for seconds, text in entries:
+        match = PIT_PATTERN.match(text) if seconds is not None else None
+        if not match:
+            output.append((seconds, text))
+            continue
+
+        driver, direction = match.groups()
+        if direction == "entered":
+            open_stops[driver] = (len(output), seconds)
+            output.append((seconds, text))
+        elif driver in open_stops:
+            slot, entered = open_stops.pop(driver)
+            output[slot] = (entered, f"{driver} made a pit stop ({seconds - entered}s in the pit lane).")
+        else:
+            output.append((seconds, text))
+    return output
+
+
+def merge_accidents(entries):
+    output = []
+    slots = {}
+    for seconds, text in entries:
+        if seconds is None or not text.startswith(ACCIDENT_PREFIX):
+            output.append((seconds, text))
+            continue
+
+        drivers = text[len(ACCIDENT_PREFIX):].split(", ")
+        if seconds in slots:
+            merged = slots[seconds]
+            merged.extend(driver for driver in drivers if driver not in merged)
+        else:
+            slots[seconds] = drivers
+            output.append((seconds, slots[seconds]))
+
+    return [(seconds, ACCIDENT_PREFIX + ", ".join(text)) if isinstance(text, list) else (seconds, text)
+            for seconds, text in output]
+
+
+def parse_table(text):
+    # "(P1) A, (P2) B" -> {1: "A", 2: "B"}
+    parts = TABLE_ENTRY_PATTERN.split(text)
+    return {int(parts[i]): parts[i + 1].rstrip(", ") for i in range(1, len(parts) - 1, 2)}
+
+
+def drop_unchanged_positions(entries):
+    # The first table is kept whole, later ones only list the places that changed hands
+    output = []
+    last_tables = {}
+    for seconds, text in entries:
+        match = POSITIONS_PATTERN.match(text) if seconds is not None else None
+        if match:
+            # Multiclass races have one table per class
+            category = match.group(1) or ""
+            table = parse_table(text[match.end():])
+            last_table = last_tables.get(category)
+            if last_table is not None:
+                # Gaps move every table; only a different driver in a place is a change
+                changed = [f"(P{position}) {driver}" for position, driver in table.items()
+                           if GAP_SUFFIX_PATTERN.sub("", last_table.get(position, "")) != GAP_SUFFIX_PATTERN.sub("", driver)]
+                last_tables[category] = table
+                if not changed:
+                    continue
+                text = f"Position changes{match.group(1) or ''}: " + ", ".join(changed)
+            else:
+                last_tables[category] = table
+        output.append((seconds, text))
+    return output
+
+
+def fold_results(entries):
+    output = []
+    results = None
+    for seconds, text in entries:
+        match = FINISH_PATTERN.match(text) if seconds is not None else None
+        if not match:
+            results = None
+            output.append((seconds, text))
+            continue
+
+        driver, position = match.groups()
+        if results is None or results[0] != seconds:
+            results = (seconds, [])
+            output.append(results)
+        results[1].append(f"(P{position}) {driver}")
+
+    return [(seconds, "Final results: " + ", ".join(text)) if isinstance(text, list) else (seconds, text)
+            for seconds, text in output]
+
+
+def reduce_race_log(race_data, battle_window=20):
+    entries = parse_lines(race_data)
+    input_events = sum(1 for seconds, _ in entries if seconds is not None)
+    entries = collapse_overtakes(entries, battle_window)
+    entries = fold_pit_stops(entries)
+    entries = merge_accidents(entries)
+    entries = drop_unchanged_positions(entries)
+    entries = fold_results(entries)
+
+    lines = [text if seconds is None else f"{format_time(seconds)} - {text}" for seconds, text in entries]
+    reduced = '\n'.join(lines)
+
+    stats = {
+        "input_chars": len(race_data),
+        "output_chars": len(reduced),
+        "input_events": input_events,
+        "output_events": sum(1 for seconds, _ in entries if seconds is not None),
+    }
+    stats["ratio"] = stats["output_chars"] / stats["input_chars"] if stats["input_chars"] else 1.0
+    return reduced, stats
@@ -0,0 +1,211 @@
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import argparse
+import tempfile
+
+from benchmark import BufferReader
+from race_generator import REGISTRATION_RESULT, SyntheticRace
+
+
+def rss_bytes():
+    """
+    Resident set size of this process, or None where it cannot be read without extra packages.
+    """
+    if os.path.exists("/proc/self/statm"):
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+    return None
+
+
+class SoakRun:
+    """
+    Replays a long synthetic race through the collector and the commentator's conversation state.
+    """
+
+    def __init__(self, options, directory):
+        from data_collector import DataCollector
+        from race_commentator import RaceCommentator
+
+        self.options = options
+        self.race = SyntheticRace(cars=options.cars, hours=options.hours, seed=options.seed, classes=options.classes,
+                                  tick_ms=options.tick_ms, stint_laps=options.stint_laps, driver_swaps=True,
+                                  churn_per_hour=options.churn_per_hour)
+        self.collector = DataCollector("ACC")
+        self.collector.endurance = not options.unbounded
+        self.collector.setup_client()
+        self.collector.client._send = lambda *fmt_value_pairs: None
+        self.collector.live_queue = queue.Queue()
+        self.collector.setup_output_file(os.path.join(directory, "soak.txt"))
+
+        self.commentator = RaceCommentator(self.collector.output_file, "soak")
+        self.commentator.endurance = not options.unbounded
+        self.messages = []
+        self.race_history = self.commentator.new_race_history()
+        self.reply = "What a moment for the leaders, and the field behind is closing in lap after lap."
+
+        self.samples = []
+        self.reset_window()
+
+    def reset_window(self):
+        self.window = {"collector_s": 0.0, "messages": 0, "commentary_s": 0.0, "events": 0}
+
+    def run(self):
+        client = self.collector.client
+        receive = client._receiveMethods
+        update_every_ms = self.collector.update_interval * 1000
+        next_update_ms = update_every_ms
+        next_sample_ms = 3600000
+        started = time.perf_counter()
+
+        for datagram in self.race.datagrams():
+            if datagram[0] == REGISTRATION_RESULT:
+                continue
+            start = time.perf_counter()
+            client._reader = BufferReader(datagram)
+            client._reader.read(1)
+            receive[datagram[0]]()
+            session_ms = self.collector.session_time_ms
+            if session_ms >= next_update_ms:
+                next_update_ms += update_every_ms
+                if self.collector.race_started:
+                    self.collector.update_race_data()
+            self.window["collector_s"] += time.perf_counter() - start
+            self.window["messages"] += 1
+
+            self.comment_on_events()
+            if session_ms >= next_sample_ms:
+                self.sample(next_sample_ms // 3600000, time.perf_counter() - started)
+                next_sample_ms += 3600000
+
+        self.collector.close_output()
+
+    def comment_on_events(self):
+        events = self.collector.live_queue
+        while not events.empty():
+            session_ms, text, _, _, _ = events.get_nowait()
+            start = time.perf_counter()
+            timecode = self.collector.format_session_time(session_ms)
+            context = self.commentator.build_context(text, self.race_history)
+            self.messages.append({"role": "user", "content": context})
+            self.commentator.add_reply(self.messages, self.reply)
+            self.race_history += f"{timecode} - {text}\n"
+            self.window["commentary_s"] += time.perf_counter() - start
+            self.window["events"] += 1
+
+    def probe_context(self, repeat=5, number=100):
+        # Events arrive a few a minute, so their own timings mostly measure cold caches; this
+        # times building the next prompt from the current state, which is what must not grow
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                self.commentator.build_context("Probe event.", self.race_history)
+            elapsed = (time.perf_counter() - start) / number
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def sample(self, hour, elapsed):
+        rss = rss_bytes()
+        window = self.window
+        sample = {
+            "hour": hour,
+            "elapsed_s": round(elapsed, 1),
+            "rss_mb": None if rss is None else round(rss / 1e6, 1),
+            "cars": len(self.collector.cars),
+            "collector_us": round(window["collector_s"] / max(window["messages"], 1) * 1e6, 2),
+            "commentary_us": round(window["commentary_s"] / max(window["events"], 1) * 1e6, 2),
+            "context_us": round(self.probe_context() * 1e6, 2),
+            "events": window["events"],
+            "prompt_chars": len(str(self.race_history)),
+            "messages": len(self.messages),
+        }
+        self.samples.append(sample)
+        self.reset_window()
+        print(f"{sample['hour']:>4}h {sample['elapsed_s']:>7.1f}s  RSS {sample['rss_mb'] or 0:>7.1f} MB  "
+              f"{sample['cars']:>3} cars  collector {sample['collector_us']:>6.2f} us/msg  "
+              f"commentary {sample['commentary_us']:>7.2f} us/event ({sample['events']} events), "
+              f"prompt {sample['context_us']:>6.2f} us  "
+              f"history {sample['prompt_chars']} chars, {sample['messages']} messages", flush=True)
+
+
+def median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2]
+
+
+def check(samples, options, span=3):
+    """
+    Failure messages comparing the median of the last span hours with the first ones after warm-up.
+    """
+    if len(samples) < options.warmup_hours + 2 * span:
+        return [f"only {len(samples)} hour(s) sampled, need {options.warmup_hours + 2 * span} to compare"]
+    early, late = samples[options.warmup_hours:options.warmup_hours + span], samples[-span:]
+    failures = []
+    first, last = early[0], late[-1]
+    if first["rss_mb"] is not None and last["rss_mb"] - first["rss_mb"] > options.rss_tolerance_mb:
+        failures.append(f"RSS grew from {first['rss_mb']} MB at hour {first['hour']} to {last['rss_mb']} MB "
+                        f"at hour {last['hour']} (tolerance {options.rss_tolerance_mb} MB)")
+    for key in ("collector_us", "context_us", "prompt_chars"):
+        before, after = median(sample[key] for sample in early), median(sample[key] for sample in late)
+        if before and after > before * options.latency_tolerance:
+            failures.append(f"{key} rose from {before} in hours {early[0]['hour']}-{early[-1]['hour']} to {after} "
+                            f"in hours {late[0]['hour']}-{late[-1]['hour']} (tolerance x{options.latency_tolerance})")
+    return failures
+
+
+if __name__ == "__main__":
+    # python soak_test.py                      a full 24 h race, a few minutes of wall time
+    # python soak_test.py --hours 4 --cars 60
+    parser = argparse.ArgumentParser(description="Endurance soak test: flat memory and per-event cost over a long race.")
+    parser.add_argument("--hours", type=float, default=24.0)
+    parser.add_argument("--cars", type=int, default=40)
+    parser.add_argument("--classes", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tick-ms", type=int, default=2000, help="Realtime update interval of the synthetic race")
+    parser.add_argument("--stint-laps", type=int, default=30)
+    parser.add_argument("--churn-per-hour", type=float, default=2.0, help="Cars disconnecting and replaced per hour")
+    parser.add_argument("--warmup-hours", type=int, default=2)
+    parser.add_argument("--rss-tolerance-mb", type=float, default=20.0)
+    parser.add_argument("--latency-tolerance", type=float, default=1.5)
+    parser.add_argument("--unbounded", action="store_true", help="Run with endurance mode off, for comparison")
+    parser.add_argument("--output", help="Write the hourly samples here as JSON")
+    options = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="soak_")
+    try:
+        soak = SoakRun(options, directory)
+        soak.run()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if options.output:
+        os.makedirs(os.path.dirname(options.output) or ".", exist_ok=True)
+        with open(options.output, "w", encoding="utf-8") as f:
+            json.dump(soak.samples, f, indent=2)
+
+    failures = check(soak.samples, options)
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if failures:
+        sys.exit(1)
+    print("Memory and per-event cost stayed flat.")
@@ -0,0 +1,336 @@
+import re
+import sys
+import json
+import math
+import time
+import zlib
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+OPENERS = ["What a moment!", "Look at this!", "Incredible scenes!", "And there it is!", "Drama on track!",
+           "Here we go!", "Unbelievable!", "Right on the limit!"]
+CLOSERS = ["The crowd is on its feet.", "That changes the picture at the front.", "Nobody is giving an inch today.",
+           "Keep an eye on this one.", "The pressure is building.", "What a race this is turning into."]
+RACE_DATA_PATTERN = re.compile(r'<race_data>\n?(.*?)\n?</race_data>', re.DOTALL)
+TTS_PATH_PATTERN = re.compile(r'^/v1/text-to-speech/([^/]+)(/stream)?$')
+# Roughly 128 kbit/s MP3 at 15 characters of speech per second
+AUDIO_BYTES_PER_CHAR = 1000
+FRAME_HEADER = b"\xff\xfb\x90\x64"
+
+
+def parse_latency(spec):
+    """
+    "fixed:MS", "uniform:LOW:HIGH", "normal:MEAN:SD", "lognormal:MEDIAN:SIGMA" or MS -> f(rng) in seconds.
+    """
+    kind, _, args = spec.partition(":")
+    if not args:
+        kind, args = "fixed", spec
+    values = [float(value) for value in args.split(":")]
+    if kind == "fixed":
+        return lambda rng: values[0] / 1000
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1])) / 1000
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1]) / 1000
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class StubBehaviour:
+    """
+    How one stubbed provider misbehaves: latency, random errors, rate and concurrency limits.
+    """
+
+    def __init__(self, latency="fixed:0", error_rate=0.0, throttle_rate=0.0, rate_limit=None, burst=None,
+                 max_concurrency=None, retry_after=1.0, token_ms=0.0, seed=0):
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self.burst = burst or rate_limit
+        self.max_concurrency = max_concurrency
+        self.retry_after = retry_after
+        # Delay between streamed text chunks
+        self.token_ms = token_ms
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tokens = self.burst
+        self.refilled = time.monotonic()
+        self.in_flight = 0
+        self.stats = {"requests": 0, "ok": 0, "errors": 0, "throttled": 0, "aborted": 0, "peak_concurrency": 0}
+
+    def admit(self):
+        """
+        Returns (status, Retry-After) to refuse the request with, or None to serve it.
+        """
+        with self.lock:
+            self.stats["requests"] += 1
+            if self.max_concurrency is not None and self.in_flight >= self.max_concurrency:
+                return self.throttle(self.retry_after)
+            if self.rate_limit:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate_limit / 60)
+                self.refilled = now
+                if self.tokens < 1:
+                    return self.throttle((1 - self.tokens) * 60 / self.rate_limit)
+                self.tokens -= 1
+            if self.throttle_rate and self.rng.random() < self.throttle_rate:
+                return self.throttle(self.retry_after)
+            if self.error_rate and self.rng.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return 500, None
+            self.in_flight += 1
+            self.stats["peak_concurrency"] = max(self.stats["peak_concurrency"], self.in_flight)
+            return None
+
+    def throttle(self, retry_after):
+        self.stats["throttled"] += 1
+        return 429, max(1, math.ceil(retry_after))
+
+    def delay(self):
+        with self.lock:
+            seconds = self.latency(self.rng)
+        time.sleep(seconds)
+
+    def finish(self, ok):
+        # A reply that broke off, e.g. a client that hung up mid-stream, is not a success
+        with self.lock:
+            self.in_flight -= 1
+            self.stats["ok" if ok else "aborted"] += 1
+
+
+def stable_seed(text):
+    return zlib.crc32(text.encode("utf-8"))
+
+
+def filter_reply(content, keep_every=3):
+    """
+    Keeps every keep_every-th line of the race data, so the filtered output is a real subset of the input.
+    """
+    match = RACE_DATA_PATTERN.search(content)
+    lines = [line for line in (match.group(1) if match else content).splitlines() if line.strip()]
+    return "\n".join(lines[::keep_every])
+
+
+def commentary_reply(content):
+    rng = random.Random(stable_seed(content))
+    event = content.rsplit("Current event:", 1)[-1].split("\n\n", 1)[0].strip()
+    # Drop the timecode so the line reads like commentary
+    event = event.split(" - ", 1)[-1] if " - " in event else event
+    return f"{rng.choice(OPENERS)} {event} {rng.choice(CLOSERS)}".strip()
+
+
+def message_text(body):
+    content = body["messages"][-1]["content"]
+    if isinstance(content, list):
+        content = "".join(block.get("text", "") for block in content)
+    return content
+
+
+def audio_bytes(text):
+    # Deterministic, MP3-framed filler sized like real speech for the text
+    size = max(1, len(text)) * AUDIO_BYTES_PER_CHAR
+    block = FRAME_HEADER + hashlib.sha256(text.encode("utf-8")).digest() * 13
+    return (block * (size // len(block) + 1))[:size]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self.send_json(200, {provider: behaviour.stats for provider, behaviour in self.server.behaviours.items()})
+        else:
+            self.send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        tts = TTS_PATH_PATTERN.match(self.path)
+        if self.path == "/v1/messages":
+            provider, serve = "llm", self.serve_message
+        elif tts:
+            provider, serve = "tts", self.serve_audio
+        else:
+            self.send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+            return
+
+        behaviour = self.server.behaviours[provider]
+        refusal = behaviour.admit()
+        if refusal is not None:
+            status, retry_after = refusal
+            self.send_error_response(provider, status, retry_after)
+            return
+        ok = False
+        try:
+            behaviour.delay()
+            serve(body, behaviour)
+            ok = True
+        finally:
+            behaviour.finish(ok)
+
+    def send_error_response(self, provider, status, retry_after):
+        headers = {"Retry-After": str(retry_after)} if retry_after is not None else {}
+        if provider == "llm":
+            error_type = "rate_limit_error" if status == 429 else "api_error"
+            payload = {"type": "error", "error": {"type": error_type, "message": f"Stub {error_type}"}}
+        else:
+            payload = {"detail": {"status": "too_many_concurrent_requests" if status == 429 else "internal_error",
+                                  "message": f"Stub error {status}"}}
+        self.send_json(status, payload, headers)
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def serve_message(self, body, behaviour):
+        content = message_text(body)
+        # The filter prompt is the only one that wraps its input in race_data tags
+        text = filter_reply(content) if "<race_data>" in content else commentary_reply(content)
+        input_tokens = (len(body.get("system") or "") + sum(len(str(m["content"])) for m in body["messages"])) // 4
+        output_tokens = max(1, len(text) // 4)
+        message = {"id": f"msg_stub{stable_seed(content):08x}", "type": "message", "role": "assistant",
+                   "model": body.get("model", "stub"), "content": [], "stop_reason": None, "stop_sequence": None,
+                   "usage": {"input_tokens": input_tokens, "output_tokens": 0}}
+
+        if not body.get("stream"):
+            message.update(content=[{"type": "text", "text": text}], stop_reason="end_turn",
+                           usage={"input_tokens": input_tokens, "output_tokens": output_tokens})
+            self.send_json(200, message)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        self.send_event("message_start", {"type": "message_start", "message": message})
+        self.send_event("content_block_start", {"type": "content_block_start", "index": 0,
+                                                "content_block": {"type": "text", "text": ""}})
+        for word in re.findall(r'\S+\s*', text):
+            if behaviour.token_ms:
+                time.sleep(behaviour.token_ms / 1000)
+            self.send_event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                    "delta": {"type": "text_delta", "text": word}})
+        self.send_event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        self.send_event("message_delta", {"type": "message_delta",
+                                          "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                          "usage": {"output_tokens": output_tokens}})
+        self.send_event("message_stop", {"type": "message_stop"})
+
+    def send_event(self, name, payload):
+        self.wfile.write(f"event: {name}\ndata: {json.dumps(payload)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def serve_audio(self, body, behaviour):
+        data = audio_bytes(body.get("text", ""))
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping a kept-alive connection is routine, not worth a traceback
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class StubServer:
+    """
+    Local stand-in for the Anthropic and ElevenLabs APIs; point base_url or *_BASE_URL at url.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, llm=None, tts=None, verbose=False):
+        self.httpd = QuietHTTPServer((host, port), StubHandler)
+        self.httpd.behaviours = {"llm": llm or StubBehaviour(), "tts": tts or StubBehaviour()}
+        self.httpd.verbose = verbose
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def stats(self):
+        return {provider: dict(behaviour.stats) for provider, behaviour in self.httpd.behaviours.items()}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def behaviour_arguments(parser, prefix):
+    parser.add_argument(f"--{prefix}-latency", default="fixed:0",
+                        help="fixed:MS, uniform:LOW:HIGH, normal:MEAN:STDDEV or lognormal:MEDIAN:SIGMA")
+    parser.add_argument(f"--{prefix}-error-rate", type=float, default=0.0)
+    parser.add_argument(f"--{prefix}-throttle-rate", type=float, default=0.0)
+    parser.add_argument(f"--{prefix}-rate-limit", type=float, help="Requests per minute")
+    parser.add_argument(f"--{prefix}-burst", type=float)
+    parser.add_argument(f"--{prefix}-max-concurrency", type=int)
+    parser.add_argument(f"--{prefix}-retry-after", type=float, default=1.0)
+
+
+def behaviour_from(options, prefix, seed):
+    values = vars(options)
+    prefix = prefix.replace("-", "_")
+    return StubBehaviour(latency=values[f"{prefix}_latency"], error_rate=values[f"{prefix}_error_rate"],
+                         throttle_rate=values[f"{prefix}_throttle_rate"], rate_limit=values[f"{prefix}_rate_limit"],
+                         burst=values[f"{prefix}_burst"], max_concurrency=values[f"{prefix}_max_concurrency"],
+                         retry_after=values[f"{prefix}_retry_after"], token_ms=values.get(f"{prefix}_token_ms", 0),
+                         seed=seed)
+
+
+if __name__ == "__main__":
+    # python stub_server.py --port 8099 --llm-latency lognormal:800:0.4 --tts-max-concurrency 2
+    # ANTHROPIC_BASE_URL=http://127.0.0.1:8099 ELEVENLABS_BASE_URL=http://127.0.0.1:8099 python ...
+    parser = argparse.ArgumentParser(description="Local Anthropic/ElevenLabs stand-in for offline pipeline runs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true")
+    behaviour_arguments(parser, "llm")
+    parser.add_argument("--llm-token-ms", type=float, default=0.0, help="Delay between streamed words")
+    behaviour_arguments(parser, "tts")
+    options = parser.parse_args()
+
+    server = StubServer(options.host, options.port, llm=behaviour_from(options, "llm", options.seed),
+                        tts=behaviour_from(options, "tts", options.seed + 1), verbose=options.verbose)
+    print(f"Stub LLM and TTS server on {server.url}", file=sys.stderr)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
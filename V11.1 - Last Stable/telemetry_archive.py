@@ -0,0 +1,151 @@
+import os
+import mmap
+import zlib
+import struct
+import threading
+from array import array
+
+# (column name, array typecode)
+COLUMNS = [
+    ("session_ms", "i"),
+    ("car", "H"),
+    ("laps", "H"),
+    ("spline", "f"),
+    ("position", "H"),
+    ("kmh", "H"),
+    ("location", "B"),
+    ("world_x", "f"),
+    ("world_y", "f"),
+    ("last_lap_ms", "i"),
+]
+COLUMN_TYPES = dict(COLUMNS)
+
+MAGIC = b"TLM1"
+# magic, row count, column count
+CHUNK_HEADER = struct.Struct("<4sIH")
+# column name, typecode, offset, compressed size
+COLUMN_ENTRY = struct.Struct("<16scQI")
+
+
+class TelemetryRecorder:
+    def __init__(self, directory, chunk_rows=65536, compression_level=1):
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self.compression_level = compression_level
+        self.session_time_ms = 0
+        self.chunk_index = 0
+        self.rows_written = 0
+        self.lock = threading.Lock()
+        self.columns = {name: array(typecode) for name, typecode in COLUMNS}
+        os.makedirs(directory, exist_ok=True)
+
+    def attach(self, client):
+        client.onRealtimeUpdate.subscribe(self.on_realtime_update)
+        client.onRealtimeCarUpdate.subscribe(self.on_realtime_car_update)
+
+    def on_realtime_update(self, event):
+        self.session_time_ms = event.content.sessionTimeMs
+
+    def on_realtime_car_update(self, event):
+        self.record(self.session_time_ms, event.content)
+
+    def record(self, session_time_ms, car):
+        with self.lock:
+            columns = self.columns
+            columns["session_ms"].append(int(session_time_ms))
+            columns["car"].append(car.carIndex)
+            columns["laps"].append(car.laps)
+            columns["spline"].append(car.splinePosition)
+            columns["position"].append(car.position)
+            columns["kmh"].append(car.kmh)
+            columns["location"].append(car.locationCode)
+            columns["world_x"].append(car.worldPosX)
+            columns["world_y"].append(car.worldPosY)
+            columns["last_lap_ms"].append(car.lastLap.lapTimeMs)
+            if len(columns["car"]) >= self.chunk_rows:
+                self._flush()
+
+    def close(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        rows = len(self.columns["car"])
+        if rows == 0:
+            return
+
+        blocks = [(name, typecode, zlib.compress(self.columns[name].tobytes(), self.compression_level))
+                  for name, typecode in COLUMNS]
+        offset = CHUNK_HEADER.size + COLUMN_ENTRY.size * len(blocks)
+        entries = []
+        for name, typecode, block in blocks:
+            entries.append(COLUMN_ENTRY.pack(name.encode(), typecode.encode(), offset, len(block)))
+            offset += len(block)
+
+        path = os.path.join(self.directory, f"chunk_{self.chunk_index:05d}.tlm")
+        with open(path, "wb") as f:
+            f.write(CHUNK_HEADER.pack(MAGIC, rows, len(blocks)))
+            f.writelines(entries)
+            f.writelines(block for _, _, block in blocks)
+
+        self.chunk_index += 1
+        self.rows_written += rows
+        self.columns = {name: array(typecode) for name, typecode in COLUMNS}
+
+
+class TelemetryChunk:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.rows, column_count = CHUNK_HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a telemetry chunk")
+        self.blocks = {}
+        for i in range(column_count):
+            name, typecode, offset, size = COLUMN_ENTRY.unpack_from(self.map, CHUNK_HEADER.size + i * COLUMN_ENTRY.size)
+            self.blocks[name.rstrip(b"\0").decode()] = (typecode.decode(), offset, size)
+
+    def column(self, name):
+        typecode, offset, size = self.blocks[name]
+        values = array(typecode)
+        values.frombytes(zlib.decompress(self.map[offset:offset + size]))
+        return values
+
+    def close(self):
+        self.map.close()
+
+
+class TelemetryArchive:
+    def __init__(self, directory):
+        self.directory = directory
+        self.chunks = [TelemetryChunk(os.path.join(directory, name))
+                       for name in sorted(os.listdir(directory)) if name.endswith(".tlm")]
+
+    @property
+    def rows(self):
+        return sum(chunk.rows for chunk in self.chunks)
+
+    def column(self, name):
+        # Only the requested column's blocks are read and decompressed
+        values = array(COLUMN_TYPES[name])
+        for chunk in self.chunks:
+            values.extend(chunk.column(name))
+        return values
+
+    def columns(self, *names):
+        return {name: self.column(name) for name in names}
+
+    def car(self, car_index, *names):
+        # Rows of one car, for the given columns
+        cars = self.column("car")
+        rows = [i for i, car in enumerate(cars) if car == car_index]
+        result = {}
+        for name in names:
+            values = self.column(name)
+            result[name] = array(values.typecode, (values[i] for i in rows))
+        return result
+
+    def close(self):
+        for chunk in self.chunks:
+            chunk.close()
@@ -1,20 +1,32 @@
 import os
 import re
 import requests
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from PyQt5.QtCore import QThread, pyqtSignal
 
+from api_governor import GOVERNOR
+from event_store import open_events
+from metrics import TTS_BYTES, TTS_FIRST_BYTE_SECONDS
+
+DEFAULT_TTS_BASE_URL = "https://api.elevenlabs.io"
+
 class VoiceGenerator(QThread):
     output_signal = pyqtSignal(str)
     progress_signal = pyqtSignal(int)
 
-    def __init__(self, input_path, api_key):
+    def __init__(self, input_path, api_key, base_url=None):
         super().__init__()
         self.input_path = input_path
         self.output_dir = "audio output"
         self.chunk_size = 1024
         self.xi_api_key = api_key
-        self.voice_id = "Mw9TampTt4PGYMa0FYBO"  # Default voice ID
-        self.tts_url = f"https://api.elevenlabs.io/v1/text-to-speech/{self.voice_id}/stream"
+        # ELEVENLABS_BASE_URL points every generator at another server, e.g. stub_server.py
+        self.base_url = (base_url or os.environ.get("ELEVENLABS_BASE_URL") or DEFAULT_TTS_BASE_URL).rstrip("/")
+        self.set_voice("Mw9TampTt4PGYMa0FYBO")  # Default voice ID
+        self.governor = GOVERNOR
+        # requests timeout (connect, read); the read part also bounds a stream that stalls midway
+        self.timeout = None
 
     def run(self):
         self.output_signal.emit("Starting voice commentary generation...")
@@ -23,34 +35,50 @@ class VoiceGenerator(QThread):
         try:
             os.makedirs(self.output_dir, exist_ok=True)
 
-            total_lines = self.count_lines()
+            events = open_events(self.input_path)
             processed_lines = 0
 
-            with open(self.input_path, 'r') as file:
-                for line in file:
-                    match = re.match(r'(\d{2}:\d{2}:\d{2}) - (.+)', line.strip())
-                    if match:
-                        time_code, text = match.groups()
-                        self.generate_audio(text, time_code)
-
-                        processed_lines += 1
-                        progress = int((processed_lines / total_lines) * 100)
-                        self.progress_signal.emit(progress)
-
+            # Each event is its own file, so they are voiced in parallel as fast as the governor allows.
+            # Events sharing a timecode get numbered files rather than racing for one.
+            workers = max(1, min(events.count, self.governor.provider("elevenlabs").max_concurrency))
+            occurrences = Counter()
+            futures = []
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for event in events:
+                    occurrences[event.timecode] += 1
+                    output_path = self.get_audio_path(event.timecode, occurrences[event.timecode])
+                    futures.append(executor.submit(self.generate_audio, event.text, event.timecode, output_path))
+                for future in as_completed(futures):
+                    future.result()
+                    processed_lines += 1
+                    self.progress_signal.emit(events.progress(processed_lines))
+
+            self.output_signal.emit(f"API calls: {self.governor.format_stats()}")
             self.output_signal.emit("Voice generation complete!")
             self.progress_signal.emit(100)
 
         except Exception as e:
             self.output_signal.emit(f"An error occurred: {str(e)}")
 
-    def count_lines(self):
-        with open(self.input_path, 'r') as file:
-            return sum(1 for line in file if re.match(r'\d{2}:\d{2}:\d{2} - ', line))
-
-    def generate_audio(self, text, time_code):
+    def generate_audio(self, text, time_code, output_path=None):
         # Remove line breaks and page breaks from the text
         text = re.sub(r'\s+', ' ', text).strip()
 
+        response = self.request_audio(text)
+
+        if response.ok:
+            output_path = output_path or self.get_audio_path(time_code)
+
+            with open(output_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    TTS_BYTES.inc(len(chunk))
+                    f.write(chunk)
+
+            self.output_signal.emit(f"Audio saved: {output_path}")
+        else:
+            self.output_signal.emit(f"Error generating audio for time {time_code}: {response.text}")
+
+    def request_audio(self, text, previous_text=None):
         headers = {
             "Accept": "application/json",
             "xi-api-key": self.xi_api_key
@@ -65,23 +93,25 @@ class VoiceGenerator(QThread):
                 "use_speaker_boost": True
             }
         }
-
-        response = requests.post(self.tts_url, headers=headers, json=data, stream=True)
-
-        if response.ok:
-            output_path = os.path.join(self.output_dir, f"Commentary_{time_code.replace(':', '')}.mp3")
-
-            with open(output_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=self.chunk_size):
-                    f.write(chunk)
-
-            self.output_signal.emit(f"Audio saved: {output_path}")
-        else:
-            self.output_signal.emit(f"Error generating audio for time {time_code}: {response.text}")
+        if previous_text:
+            # Keeps intonation continuous when one commentary is voiced sentence by sentence
+            data["previous_text"] = previous_text
+
+        # With stream=True the call returns once the headers are in
+        with TTS_FIRST_BYTE_SECONDS.time():
+            return self.governor.call("elevenlabs",
+                                      lambda: requests.post(self.tts_url, headers=headers, json=data, stream=True,
+                                                            timeout=self.timeout),
+                                      {"characters": len(text)})
+
+    def get_audio_path(self, time_code, occurrence=1):
+        # The first event at a timecode keeps the plain name; later ones get _2, _3, ...
+        suffix = f"_{occurrence}" if occurrence > 1 else ""
+        return os.path.join(self.output_dir, f"Commentary_{time_code.replace(':', '')}{suffix}.mp3")
 
     def get_output_dir(self):
         return os.path.abspath(self.output_dir)
 
     def set_voice(self, voice_id):
         self.voice_id = voice_id
-        self.tts_url = f"https://api.elevenlabs.io/v1/text-to-speech/{self.voice_id}/stream"
+        self.tts_url = f"{self.base_url}/v1/text-to-speech/{self.voice_id}/stream"